@@ -1,8 +1,25 @@
+import collections
+import contextlib
+import itertools
+import multiprocessing
 import os
 import sys
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from subprocess import call
-from typing import Iterable, List, Set
+from typing import (
+    TYPE_CHECKING,
+    Container,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import click
 import requests
@@ -10,7 +27,7 @@ from rich.prompt import Confirm, Prompt
 from rich.traceback import install
 
 from . import __version__
-from .exceptions import AnkiApiError, HighlighterError
+from .exceptions import AnkiApiError, DuplicateNoteError, GitError, HighlighterError
 from .helpers import (
     CONSOLE,
     print_action,
@@ -22,17 +39,24 @@ from .helpers import (
     print_sub_warning,
     print_warning,
 )
-from .models import converter, highlighter, img_handler
-from .models.anki_api import AnkiApi
+from .models import converter, git, img_handler, preparer, walker
 from .models.anki_media import AnkiMedia
 from .models.config import Config
-from .models.hasher import Hasher
+from .models.document import Document
+from .models.hasher import FileScan, Hasher
 from .models.notes.basic_note import BasicNote
 from .models.notes.cloze_note import ClozeNote
 from .models.notes.note import Note
 from .models.parser import Parser
+from .models.pipeline import Stage
+from .models.preparer import PreparedChunk, PreparedFile, PreparedNotes
+from .models.render_cache import RenderCache
+from .models.sync_state import SyncState
 from .models.writer import Writer
 
+if TYPE_CHECKING:
+    from .models.anki_api import AnkiApi
+
 DEFAULT_ANKI_FOLDERS = {
     "win32": r"~\AppData\Roaming\Anki2",
     "linux": "~/.local/share/Anki2",
@@ -40,8 +64,13 @@ DEFAULT_ANKI_FOLDERS = {
 }
 
 FILE_EXTENSIONS = [".md", ".markdown"]
+# Maximum number of notes from the file that are processed at once
+NOTES_CHUNK_SIZE = 1000
+# Maximum number of chunks of notes that are prepared ahead of the sync
+PIPELINE_QUEUE_SIZE = 2
 CONFIG_PATH = f"{os.path.dirname(__file__)}/config.ini"
-HASHES_PATH = f"{os.path.dirname(__file__)}/hashes.json"
+STATE_PATH = f"{os.path.dirname(__file__)}/sync_state.db"
+RENDER_CACHE_PATH = f"{os.path.dirname(__file__)}/render_cache.db"
 
 CONFIG = Config(CONFIG_PATH)
 
@@ -49,149 +78,499 @@ CONFIG = Config(CONFIG_PATH)
 install(console=CONSOLE)
 
 
-def get_notes_from_file(file_path: str) -> List[Note]:
+def get_prepared_document(
+    chunks: Iterable[PreparedChunk],
+) -> Tuple[Document, Iterator[PreparedChunk]]:
+    """Get the document from which notes of the file were prepared, so that it isn't read again.
+    Raises the error of the preparation if the file couldn't be read.
+
+    Returns:
+        Document and all chunks of the file
+    Raises:
+        ValueError: if the file has changed since it was prepared
+    """
+    chunks = iter(chunks)
+    first_chunk = next(chunks)
+    document = first_chunk.document
+    if document is None:
+        raise first_chunk.error or ValueError("file wasn't read")
+    if Hasher.get_signature(document.path) != document.signature:
+        document.close()
+        raise ValueError("file has changed while cards were collected from it")
+
+    return document, itertools.chain([first_chunk], chunks)
+
+
+def get_notes_from_file(
+    writer: Writer,
+    chunks: Iterable[PreparedChunk],
+    skipped_sections: bool = False,
+) -> Iterator[List[Note]]:
+    """Get notes of the file from the chunks in which they were prepared.
+    Edits made by the preparation are added to the writer.
+    """
     print_sub_step("Getting cards from the file...")
-    # We need to change working directory because images in file can have relative path
-    os.chdir(os.path.dirname(file_path))
+    notes_num = 0
+    for chunk in chunks:
+        if chunk.error is not None:
+            raise chunk.error
 
-    default_deck = CONFIG.get_option_value("defaults", "deck")
-    notes = Parser(file_path, default_deck).collect_notes()
-    notes_num = len(notes)
-    if notes_num == 0:
-        print_sub_step("Cards weren't found!")
-    else:
+        writer.add_edits(chunk.prepared.edits)
+        if not chunk.prepared.notes:
+            continue
+
+        notes_num += len(chunk.prepared.notes)
         print_sub_step(f'Found {notes_num} {"cards" if notes_num > 1 else "card"}!')
+        yield chunk.prepared.notes
 
-    return notes
+    if notes_num == 0 and skipped_sections:
+        print_sub_step("Changed cards weren't found!")
+    elif notes_num == 0:
+        print_sub_step("Cards weren't found!")
 
 
-def create_notes_from_file(
-    file_path: str,
-    full_sync: bool,
-    anki_api: AnkiApi,
-    anki_media: AnkiMedia,
-    hasher: Hasher,
-) -> None:
-    """Get all notes from file and send them to Anki"""
-    print_step(f'Collecting cards from "{file_path}"!')
+def prepare_files(
+    scans: Iterable[FileScan],
+    hasher: Optional[Hasher] = None,
+    jobs: int = 1,
+    render_cache: Optional[RenderCache] = None,
+) -> Iterator[PreparedChunk]:
+    """Parse notes from the files and convert them to the Anki format in chunks of at most NOTES_CHUNK_SIZE notes.
+    Notes from the sections that were synced according to the hasher aren't parsed
+    (all notes are parsed if it isn't passed). If jobs is greater than 1, files are prepared
+    in the pool of processes. Errors are returned with the chunks, so that only the file
+    with the error is skipped.
+    """
+    if jobs > 1:
+        yield from _prepare_files_in_pool(scans, hasher, jobs)
+        return
+
+    default_deck = CONFIG.get_option_value("defaults", "deck")
+    for scan in scans:
+        # Document is passed with the chunks and is closed by their consumer.
+        # Each chunk is returned after the next one is prepared, so the last chunk of the file
+        # is returned when the document isn't used here anymore and can be written
+        document = None
+        previous: Optional[PreparedNotes] = None
+        try:
+            document = Document.read(scan.path, scan)
+            for prepared in preparer.iter_prepared_notes(
+                document,
+                default_deck,
+                get_skipped_sections(scan.path, hasher),
+                NOTES_CHUNK_SIZE,
+                render_cache,
+            ):
+                if previous is not None:
+                    yield PreparedChunk(scan, document, previous)
+                previous = prepared
+        except Exception as e:
+            if previous is not None:
+                yield PreparedChunk(scan, document, previous)
+            yield PreparedChunk(scan, document, PreparedNotes([], [], {}), e)
+            continue
 
-    print_sub_step("Calculating hash...")
-    curr_hash = hasher.calculate_hash(file_path)
-    if not (full_sync or hasher.has_changed(file_path, curr_hash)):
-        print_sub_step("The file hasn't changed since last sync!")
+        if previous is None:
+            previous = PreparedNotes([], [], {})
+        yield PreparedChunk(scan, document, previous)
+
+
+def _prepare_files_in_pool(
+    scans: Iterable[FileScan], hasher: Optional[Hasher], jobs: int
+) -> Iterator[PreparedChunk]:
+    """Prepare notes from the files in the pool of jobs processes.
+    Files are prepared ahead of the ones that are synced, but no more than 2 * jobs of them.
+    All notes of each file are sent back from the worker at once, so notes of these files
+    are kept in memory (contents of the files aren't).
+    """
+    default_deck = CONFIG.get_option_value("defaults", "deck")
+    # Pool is started while other threads are running (stages of the sync, scan of the files),
+    # so its processes mustn't be forked from this process: they could inherit held locks
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    with ProcessPoolExecutor(
+        jobs,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=preparer.init_worker,
+        initargs=(RENDER_CACHE_PATH, converter.RENDERER_VERSION),
+    ) as pool:
+        pending: Deque[Tuple[FileScan, "Future[PreparedFile]"]] = collections.deque()
+        for scan in scans:
+            future = pool.submit(
+                preparer.prepare_file,
+                scan.path,
+                default_deck,
+                get_skipped_sections(scan.path, hasher),
+                NOTES_CHUNK_SIZE,
+            )
+            pending.append((scan, future))
+            if len(pending) >= 2 * jobs:
+                yield from _get_prepared_chunks(*pending.popleft())
+
+        while pending:
+            yield from _get_prepared_chunks(*pending.popleft())
+
+
+def get_skipped_sections(file_path: str, hasher: Optional[Hasher]) -> Container[str]:
+    """Get hashes of the sections of the file which notes don't have to be synced"""
+    if hasher is None:
+        return ()
+    return hasher.get_synced_sections(file_path)
+
+
+def _get_prepared_chunks(
+    scan: FileScan, future: "Future[PreparedFile]"
+) -> Iterator[PreparedChunk]:
+    """Wait until the file is prepared in the pool and get chunks of its notes"""
+    try:
+        prepared_file = future.result()
+    except Exception as e:
+        yield PreparedChunk(scan, None, PreparedNotes([], [], {}), e)
         return
 
-    notes = get_notes_from_file(file_path)
-    if not notes:
-        print_sub_step("Updating information on file hash...")
-        hasher.update_hash(file_path, curr_hash)
+    # Only notes are sent from the worker: the file is mapped here again, and positions
+    # of the notes refer to its text until the file changes
+    try:
+        document = Document.read(scan.path, scan)
+    except OSError as e:
+        yield PreparedChunk(scan, None, PreparedNotes([], [], {}), e)
+        return
+    if document.signature != prepared_file.signature:
+        document.close()
+        error = ValueError("file has changed while cards were collected from it")
+        yield PreparedChunk(scan, None, PreparedNotes([], [], {}), error)
         return
 
-    converter.convert_cloze_deletions_to_anki_format(
-        note for note in notes if isinstance(note, ClozeNote)
-    )
-    writer = Writer(file_path, notes)
-    writer.update_cloze_notes()
+    for prepared in prepared_file.chunks or [PreparedNotes([], [], {})]:
+        yield PreparedChunk(scan, document, prepared)
 
-    print_sub_step("Handling images...")
-    img_handler.handle_images_in(notes, anki_media)
 
-    print_sub_step("Converting cards to the html...")
-    converter.convert_notes_to_html(notes)
+def copy_images(
+    chunks: Iterable[PreparedChunk], anki_media: AnkiMedia
+) -> Iterator[PreparedChunk]:
+    """Copy images used in the notes to Anki Media folder.
+    Relative paths to images are resolved against the directory of the file.
+    """
+    for chunk in chunks:
+        if chunk.error is None:
+            base_dir = os.path.dirname(chunk.scan.path)
+            try:
+                img_handler.copy_images_to(
+                    anki_media, chunk.prepared.image_links, base_dir
+                )
+            except OSError as e:
+                chunk = chunk._replace(error=e)
+        yield chunk
+
+
+def send_notes_to_anki(
+    notes: List[Note],
+    anki_api: "AnkiApi",
+    hasher: Hasher,
+    full_sync: bool = False,
+    duplicates: Optional[List[Note]] = None,
+) -> None:
+    """Add new notes to Anki and update existing ones.
+    Notes that haven't changed since they were sent to Anki are skipped (unless full_sync is set).
+    Notes that weren't added because they are duplicates are appended to duplicates
+    (if it's passed) to be reported at once, otherwise they are reported right away.
+    """
+    fingerprints = {}
+    if not full_sync:
+        fingerprints = hasher.get_note_fingerprints(
+            note.anki_id for note in notes if note.anki_id
+        )
 
-    print_sub_step("Synchronizing changes and adding new cards...")
+    new_fingerprints = {}
+    # Tags are saved with the fingerprints to know which tags can be removed later
+    new_tags = {}
+    new_notes: List[Tuple[Note, str]] = []
+    changed_notes: List[Tuple[Note, str]] = []
     for note in notes:
-        try:
-            if note.anki_id:
-                anki_api.update_note(note)
-                continue
+        fingerprint = note.get_fingerprint(CONFIG)
+        if not note.anki_id:
+            new_notes.append((note, fingerprint))
+        elif fingerprints.get(note.anki_id) != fingerprint:
+            changed_notes.append((note, fingerprint))
+
+    # Existing notes are updated at once. Tags that were sent before can be removed from them
+    if changed_notes:
+        synced_tags = hasher.get_synced_tags(
+            note.anki_id for note, _ in changed_notes if note.anki_id
+        )
+        errors = anki_api.update_notes([note for note, _ in changed_notes], synced_tags)
+        for error in errors:
+            print_error(str(error), note=error.note)
+
+        failed = {id(error.note) for error in errors}
+        for note, fingerprint in changed_notes:
+            if note.anki_id and id(note) not in failed:
+                new_fingerprints[note.anki_id] = fingerprint
+                new_tags[note.anki_id] = list(note.tags)
+
+    # New notes are added at once
+    if new_notes:
+        note_ids, errors = anki_api.add_notes([note for note, _ in new_notes])
+        new_duplicates: List[Note] = []
+        for error in errors:
+            if isinstance(error, DuplicateNoteError) and error.note is not None:
+                new_duplicates.append(error.note)
+            else:
+                print_error(str(error), note=error.note)
+
+        if duplicates is None:
+            print_duplicates(new_duplicates)
+        else:
+            duplicates.extend(new_duplicates)
+
+        for (note, fingerprint), note_id in zip(new_notes, note_ids):
+            note.anki_id = note_id
+            if note_id:
+                new_fingerprints[note_id] = fingerprint
+                new_tags[note_id] = list(note.tags)
+
+    hasher.update_note_fingerprints(new_fingerprints, new_tags)
+
+
+def print_duplicates(duplicates: List[Note]) -> None:
+    """Report notes that weren't added to Anki because they are duplicates"""
+    if not duplicates:
+        return
 
-            note.anki_id = anki_api.add_note(note)
-        except AnkiApiError as e:
-            print_error(str(e), note=e.note)
+    for duplicate in duplicates:
+        CONSOLE.print(duplicate)
+    print_error(f"duplicates! Notes that weren't added: {len(duplicates)}")
 
-    print_sub_step("Adding IDs to cards in file...")
-    writer.update_note_ids()
 
-    print_sub_step("Updating information on file hash...")
-    hasher.update_hash(file_path, hasher.calculate_hash(file_path))
-    print_sub_step("Finished!")
+def create_notes_from_file(
+    scan: FileScan,
+    chunks: Iterable[PreparedChunk],
+    anki_api: "AnkiApi",
+    hasher: Hasher,
+    full_sync: bool = False,
+    skipped_sections: bool = False,
+    duplicates: Optional[List[Note]] = None,
+) -> None:
+    """Send prepared notes from file to Anki and write their IDs to the file.
+    skipped_sections is set if notes from the sections that haven't changed since the last sync
+    weren't prepared. Duplicates are collected as in send_notes_to_anki.
+    """
+    file_path = scan.path
+    print_step(f'Collecting cards from "{file_path}"!')
 
+    # File is read only once, by the stage that prepared the notes. Its hash is updated
+    # in memory after the changes are written
+    document, chunks = get_prepared_document(chunks)
+    with document:
+        # All changes are written to the file at once in the end
+        writer = Writer(document)
+        # Sections are hashed after IDs are written to them (while the file is written)
+        note_ids_of_sections: Dict[str, List[Optional[int]]] = {}
+        try:
+            for notes in get_notes_from_file(writer, chunks, skipped_sections):
+                print_sub_step("Synchronizing changes and adding new cards...")
+                send_notes_to_anki(notes, anki_api, hasher, full_sync, duplicates)
+                writer.update_note_ids(notes)
+        finally:
+            # Document mustn't be changed until all its notes are prepared
+            collections.deque(chunks, maxlen=0)
+            # IDs of the cards that were already added must not be lost
+            written = writer.save(note_ids_of_sections)
+            if written:
+                print_sub_step("Added IDs to cards in file!")
 
-def update_note_ids_in_file(file_path: str, anki_api: AnkiApi, anki_media: AnkiMedia):
-    """Update IDs of notes in file by getting their IDs from Anki"""
-    print_step(f'Updating IDs of cards in "{file_path}"!')
+        print_sub_step("Updating information on file hash...")
+        if not written:
+            note_ids_of_sections = Parser(document, "").get_note_ids_of_sections()
+        note_ids, sections = get_synced_sections(note_ids_of_sections)
+        hasher.update_hash(
+            file_path, document.hash, document.signature, note_ids, sections
+        )
+    print_sub_step("Finished!")
 
-    notes = get_notes_from_file(file_path)
-    if not notes:
-        return
 
-    converter.convert_cloze_deletions_to_anki_format(
-        [note for note in notes if isinstance(note, ClozeNote)]
-    )
-    writer = Writer(file_path, notes)
-    writer.update_cloze_notes()
+def get_synced_sections(
+    note_ids_of_sections: Mapping[str, List[Optional[int]]]
+) -> Tuple[List[int], Dict[str, List[int]]]:
+    """Get IDs of all notes from the file and hashes of the sections in which all notes have IDs.
+    Sections with notes that weren't added to Anki must be synced again.
+    """
+    note_ids: List[int] = []
+    sections: Dict[str, List[int]] = {}
+    for section_hash, ids in note_ids_of_sections.items():
+        section_note_ids = [note_id for note_id in ids if note_id]
+        note_ids.extend(section_note_ids)
+        if len(section_note_ids) == len(ids):
+            sections[section_hash] = section_note_ids
 
-    print_sub_step("Handling images...")
-    img_handler.handle_images_in(notes, anki_media, copy_images=False)
+    return note_ids, sections
 
-    print_sub_step("Converting cards to the html...")
-    converter.convert_notes_to_html(notes)
 
-    print_sub_step("Getting card IDs from Anki...")
-    anki_api.update_note_ids(notes)
+def update_note_ids_in_file(
+    file_path: str, chunks: Iterable[PreparedChunk], anki_api: "AnkiApi"
+):
+    """Update IDs of notes in file by getting their IDs from Anki"""
+    print_step(f'Updating IDs of cards in "{file_path}"!')
 
-    print_sub_step("Adding IDs to cards in file...")
-    writer.update_note_ids()
+    document, chunks = get_prepared_document(chunks)
+    with document:
+        # All changes are written to the file at once in the end
+        writer = Writer(document)
+        try:
+            for notes in get_notes_from_file(writer, chunks):
+                print_sub_step("Getting card IDs from Anki...")
+                not_found = anki_api.update_note_ids(notes)
+                if not_found:
+                    print_sub_warning(
+                        f"Cards that weren't found in Anki: {len(not_found)}"
+                    )
+                writer.update_note_ids(notes)
+        finally:
+            collections.deque(chunks, maxlen=0)
+            if writer.save():
+                print_sub_step("Added IDs to cards in file!")
     print_sub_step("Finished!")
 
 
-def sync(anki_api: AnkiApi) -> None:
+def sync(anki_api: "AnkiApi") -> None:
     try:
         anki_api.sync()
     except AnkiApiError as e:
         print_sub_warning(f"{e}. Skipping...")
 
 
-def get_file_paths_from_directory(dir_path: str, search_recursive: bool) -> Set[str]:
-    os.chdir(dir_path)
+def get_paths_to_files(
+    paths: Iterable[str], recursive: bool, state: SyncState
+) -> Iterator[str]:
+    seen: Set[walker.FileId] = set()
+
+    def print_walk_error(error: OSError) -> None:
+        print_sub_warning(f"{error}. Skipping...")
+
+    for path in paths:
+        full_path = os.path.realpath(path)
+
+        if os.path.isdir(full_path):
+            yield from walker.walk_files(
+                full_path, FILE_EXTENSIONS, recursive, seen, print_walk_error, state
+            )
+            continue
 
-    paths_to_files = set()
-    sub_directories = []
-    for item in os.scandir():
-        # Get markdown files
-        extension = os.path.splitext(item.name)[1]
-        if item.is_file() and extension in FILE_EXTENSIONS:
-            paths_to_files.add(os.path.realpath(item.path))
-        # And all directories
-        elif search_recursive and item.is_dir():
-            sub_directories.append(os.path.realpath(item.path))
+        file_id = walker.get_file_id(full_path)
+        if file_id not in seen:
+            seen.add(file_id)
+            yield full_path
 
-    # Get all markdown files from each sub directory
-    for directory in sub_directories:
-        paths_to_files |= get_file_paths_from_directory(directory, search_recursive)
-        os.chdir(dir_path)
 
-    return paths_to_files
+def get_unique_paths(paths: Iterable[str]) -> Iterator[str]:
+    """Skip paths that were already returned"""
+    seen: Set[str] = set()
+    for path in paths:
+        if path not in seen:
+            seen.add(path)
+            yield path
 
 
-def get_paths_to_files(paths: Set[str], recursive: bool) -> Set[str]:
-    paths_to_files = set()
-    initial_directory = os.getcwd()
+def get_changed_files_from_git(
+    paths: Iterable[str],
+    recursive: bool,
+    since: Optional[str],
+    state: SyncState,
+    check_all: bool = False,
+) -> Tuple[List[str], Set[str], List[Tuple[str, str, str, List[str]]]]:
+    """Get files that changed in git since the commit. If commit is not passed, the one at which
+    files from the path were synced last time is used. If check_all is set, all files are checked.
+    Files that weren't committed during the last sync are checked again, because their changes
+    could be reverted without commit.
+
+    Returns:
+        Changed files, paths in which all files must be checked (not in git repositories,
+        without synced commit or with check_all) and current commits of the repositories
+        with the real paths in them and files from the paths that aren't committed
+    Raises:
+        GitError: if git isn't installed or since is incorrect
+    """
+    changed_files: List[str] = []
+    other_paths = set()
+    commits = []
     for path in paths:
         full_path = os.path.realpath(path)
+        root = git.get_repository_root(full_path)
+        head = git.get_head_commit(root) if root else None
+        if not (root and head):
+            print_sub_warning(f'"{path}" is not in a git repository with commits!')
+            other_paths.add(path)
+            continue
 
-        if os.path.isdir(full_path):
-            paths_to_files |= get_file_paths_from_directory(full_path, recursive)
-            os.chdir(initial_directory)
+        # Files are read from the working tree, so uncommitted changes are synced too
+        uncommitted = git.get_changed_files(
+            root, head, full_path, FILE_EXTENSIONS, recursive
+        )
+        commits.append((root, full_path, head, uncommitted))
+        if check_all:
+            other_paths.add(path)
+            continue
+
+        git_sync = state.get_git_sync(root, full_path, recursive)
+        base = since or (git_sync.commit_hash if git_sync else None)
+        if not base:
+            print_sub_step(
+                f'"{path}" wasn\'t synced with git before. Checking all files.'
+            )
+            other_paths.add(path)
+            continue
+
+        try:
+            files = (
+                uncommitted
+                if base == head
+                else git.get_changed_files(
+                    root, base, full_path, FILE_EXTENSIONS, recursive
+                )
+            )
+        except GitError as e:
+            if since:
+                raise
+            # Synced commit could be removed from the history (e.g. by rebase)
+            print_sub_warning(f'{e}. Checking all files in "{path}".')
+            other_paths.add(path)
             continue
 
-        paths_to_files.add(full_path)
+        if git_sync:
+            previously_uncommitted = (
+                file_path
+                for file_path in git_sync.uncommitted_files
+                if os.path.exists(file_path)
+            )
+            files = git.filter_files(
+                itertools.chain(files, previously_uncommitted),
+                full_path,
+                FILE_EXTENSIONS,
+                recursive,
+            )
+        if os.path.isdir(full_path):
+            files = list(walker.filter_ignored(files, full_path))
+        print_sub_step(f'Changed files in "{path}": {len(files)}')
+        changed_files.extend(files)
+
+    return changed_files, other_paths, commits
+
+
+def update_git_commits(
+    state: SyncState,
+    commits: Iterable[Tuple[str, str, str, List[str]]],
+    recursive: bool,
+) -> None:
+    for root, path, commit, uncommitted in commits:
+        state.update_git_sync(root, path, recursive, commit, uncommitted)
 
-    return paths_to_files
 
+def handle_code_highlight(anki_api: "AnkiApi", anki_media: AnkiMedia) -> None:
+    from .models import highlighter
 
-def handle_code_highlight(anki_api: AnkiApi, anki_media: AnkiMedia) -> None:
     for note_type in (BasicNote, ClozeNote):
         highlighter.add_code_highlight_to(
             note_type,  # type: ignore
@@ -201,7 +580,7 @@ def handle_code_highlight(anki_api: AnkiApi, anki_media: AnkiMedia) -> None:
         )
 
 
-def handle_note_types(anki_api: AnkiApi) -> None:
+def handle_note_types(anki_api: "AnkiApi") -> None:
     note_types = anki_api.fetch_note_types()
     curr_basic_type = CONFIG.get_option_value("anki", "basic_type")
     curr_front_field = CONFIG.get_option_value("anki", "front_field")
@@ -288,7 +667,7 @@ code {
         CONFIG.update_option_value("anki", "cloze_field", text_field)
 
 
-def check_note_types(anki_media: AnkiMedia, anki_api: AnkiApi) -> None:
+def check_note_types(anki_media: AnkiMedia, anki_api: "AnkiApi") -> None:
     print_action("Checking note types...")
     try:
         handle_note_types(anki_api)
@@ -316,7 +695,7 @@ def get_profile_from_user(profiles: List[str]) -> str:
     return profile
 
 
-def get_profile(prompt_user: bool, anki_api: AnkiApi) -> str:
+def get_profile(prompt_user: bool, anki_api: "AnkiApi") -> str:
     profiles = anki_api.get_profiles()
 
     if len(profiles) == 1:
@@ -366,6 +745,142 @@ def list_config_options(ctx, param, value) -> None:
     ctx.exit()
 
 
+def get_default_paths() -> Set[str]:
+    """Get path to the default folder from the config"""
+    default_path = os.path.expanduser(CONFIG.get_option_value("defaults", "folder"))
+    if not default_path:
+        print_error(
+            "default folder is not specified in the config!\n"
+            "You must pass the path to a file or a folder as an argument."
+        )
+        sys.exit(1)
+
+    if not os.path.exists(default_path):
+        print_error(f'default folder "{default_path}" does not exist!')
+        sys.exit(1)
+
+    return {default_path}
+
+
+def open_collection(prompt: bool) -> Tuple["AnkiApi", AnkiMedia]:
+    """Load collection of the profile, get changes from AnkiWeb and check note types"""
+    # AnkiApi is imported here because loading of aqt takes a lot of time
+    from .models.anki_api import AnkiApi
+
+    # Get path to Anki folder
+    anki_path = CONFIG.get_option_value("anki", "path")
+    if not anki_path:
+        anki_path = DEFAULT_ANKI_FOLDERS[sys.platform]
+    # Path mustn't depend on the working directory
+    anki_path = os.path.abspath(os.path.expanduser(anki_path))
+
+    # Create instance of AnkiApi. Throws an error if path to anki is incorrect
+    try:
+        anki_api = AnkiApi(CONFIG, Path(anki_path))
+    except AnkiApiError as e:
+        print_error(str(e))
+        sys.exit(1)
+
+    # Get name of profile and select it in Anki
+    print_action("Getting profile...")
+    profile = get_profile(prompt, anki_api)
+
+    # Load collection of a profile
+    print_action("Loading profile...")
+    try:
+        anki_api.load_collection(profile)
+    except AnkiApiError as e:
+        print_error(str(e), pause=False)
+        sys.exit(1)
+
+    # Sync changes with AnkiWeb
+    print_action("Getting changes from AnkiWeb...")
+    sync(anki_api)
+
+    # Check correctness of note types
+    anki_media = AnkiMedia(profile, anki_path)
+    check_note_types(anki_media, anki_api)
+
+    return anki_api, anki_media
+
+
+def sync_files(
+    scans: Iterable[FileScan],
+    update_ids: bool,
+    ignore_errors: bool,
+    anki_api: "AnkiApi",
+    anki_media: AnkiMedia,
+    hasher: Hasher,
+    full_sync: bool = False,
+    render_cache: Optional[RenderCache] = None,
+    jobs: int = 1,
+    duplicates: Optional[List[Note]] = None,
+) -> bool:
+    """Sync notes from each file with Anki. Returns False if some files were skipped because of errors.
+    Notes that weren't added because they are duplicates are appended to duplicates (if it's passed).
+
+    Sync is split into stages connected by bounded queues: notes are prepared (parsed and
+    converted to html) and their images are copied in background threads, while notes of
+    the previous chunks are sent to Anki and written back to the files in this thread.
+    Only this thread works with Anki collection. If jobs is greater than 1, notes are
+    prepared in the pool of processes. Scans can be produced lazily: they are consumed
+    by the stage that prepares notes.
+    """
+    # Notes from the synced sections are skipped, unless all notes must be synced
+    skip_synced = not (full_sync or update_ids)
+
+    failed = False
+    with contextlib.ExitStack() as stack:
+        chunks: Iterable[PreparedChunk] = stack.enter_context(
+            Stage(
+                prepare_files(
+                    scans, hasher if skip_synced else None, jobs, render_cache
+                ),
+                PIPELINE_QUEUE_SIZE,
+                name="prepare",
+            )
+        )
+        if not update_ids:
+            chunks = stack.enter_context(
+                Stage(
+                    copy_images(chunks, anki_media),
+                    PIPELINE_QUEUE_SIZE,
+                    name="media",
+                )
+            )
+
+        for scan, file_chunks in itertools.groupby(chunks, key=lambda c: c.scan):
+            try:
+                if update_ids:
+                    update_note_ids_in_file(scan.path, file_chunks, anki_api)
+                    continue
+
+                create_notes_from_file(
+                    scan,
+                    file_chunks,
+                    anki_api,
+                    hasher,
+                    full_sync,
+                    skip_synced and bool(hasher.get_synced_sections(scan.path)),
+                    duplicates,
+                )
+            except (
+                OSError,
+                ValueError,
+                FileNotFoundError,
+                FileExistsError,
+            ) as e:
+                failed = True
+                print_error(f"{e}\nSkipping file!", pause=(not ignore_errors))
+            except AnkiApiError as e:
+                failed = True
+                print_error(
+                    f"{e}\nSkipping file!", pause=(not ignore_errors), note=e.note
+                )
+
+    return not failed
+
+
 @click.group()
 @click.version_option(version=__version__)
 def cli() -> None:
@@ -467,6 +982,29 @@ def config(list_options: bool, reset: bool, edit: bool, name: str, value: str) -
     is_flag=True,
     help="Collect cards from the file, even if the file hasn't changed since the last sync.",
 )
+@click.option(
+    "-g",
+    "--git",
+    "use_git",
+    is_flag=True,
+    help="Ask git for files that changed since the last sync instead of checking all files.",
+)
+@click.option(
+    "--since",
+    "since",
+    metavar="REV",
+    help="Ask git for files that changed since the REV commit instead of checking all files.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes in which cards are collected from files and converted to html. "
+    "All cards of the files that are collected ahead are kept in memory.",
+)
 @click.argument(
     "paths", metavar="[PATH]...", nargs=-1, type=click.Path(exists=True), required=False
 )
@@ -476,6 +1014,9 @@ def collect(
     update_ids: bool,
     ignore_errors: bool,
     full_sync: bool,
+    use_git: bool,
+    since: Optional[str],
+    jobs: int,
     paths: Iterable[str],
 ) -> None:
     """Get flashcards from files and add them to Anki. If flashcard already exists in Anki, the changes will be synced.
@@ -490,84 +1031,95 @@ def collect(
 
            Get cards from all Markdown files in the directory:\n
                inka collect path/to/directory
+
+           Get cards only from files that changed in git since the last sync:\n
+               inka collect --git path/to/directory
     """
     # If no path specified as an argument, search for default path in config
-    paths = set(paths)
-    if not paths:
-        default_path = os.path.expanduser(CONFIG.get_option_value("defaults", "folder"))
-        if not default_path:
-            print_error(
-                "default folder is not specified in the config!\n"
-                "You must pass the path to a file or a folder as an argument."
+    paths = set(paths) if paths else get_default_paths()
+
+    # State is saved when collect exits early too (e.g. the collection can't be opened),
+    # so that the changes found so far (like signatures of the files) aren't lost
+    with SyncState(STATE_PATH) as state:
+        hasher = Hasher(state)
+
+        # Notes from all files must be synced again if they are affected by the config changes.
+        # Information about the last sync is removed, so that files which aren't synced now
+        # are synced again too
+        config_fingerprint = state.get_config_fingerprint("notes")
+        if config_fingerprint not in (None, CONFIG.get_fingerprint()):
+            print_sub_warning(
+                "Config has changed since the last sync! Syncing all files."
             )
-            sys.exit(1)
-
-        if not os.path.exists(default_path):
-            print_error(f'default folder "{default_path}" does not exist!')
-            sys.exit(1)
-
-        paths.add(default_path)
-
-    # Get path to Anki folder
-    anki_path = CONFIG.get_option_value("anki", "path")
-    if not anki_path:
-        anki_path = os.path.expanduser(DEFAULT_ANKI_FOLDERS[sys.platform])
-
-    # Create instance of AnkiApi. Throws an error if path to anki is incorrect
-    try:
-        anki_api = AnkiApi(CONFIG, Path(anki_path))
-    except AnkiApiError as e:
-        print_error(str(e))
-        sys.exit(1)
-
-    # Get name of profile and select it in Anki
-    print_action("Getting profile...")
-    profile = get_profile(prompt, anki_api)
-
-    # Load collection of a profile
-    print_action("Loading profile...")
-    try:
-        anki_api.load_collection(profile)
-    except AnkiApiError as e:
-        print_error(str(e), pause=False)
-        sys.exit(1)
-
-    # Sync changes with AnkiWeb
-    print_action("Getting changes from AnkiWeb...")
-    sync(anki_api)
+            hasher.reset_hashes()
+
+        # Files in git repositories are taken from git instead of searching and hashing all of them.
+        # IDs are updated in all files, and commits aren't saved, because notes aren't synced
+        git_files: List[str] = []
+        git_commits: List[Tuple[str, str, str, List[str]]] = []
+        if (use_git or since) and not update_ids:
+            print_action("Getting changed files from git...")
+            try:
+                git_files, paths, git_commits = get_changed_files_from_git(
+                    paths, recursive, since, state, check_all=full_sync
+                )
+            except GitError as e:
+                print_error(str(e))
+                sys.exit(1)
+
+        # Files are found and checked for changes as they are synced. Files are checked
+        # up to the first changed one before opening the collection, so that nothing is loaded
+        # if there aren't any
+        print_action("Searching Markdown files and checking them for changes...")
+        files = get_unique_paths(
+            itertools.chain(git_files, get_paths_to_files(paths, recursive, state))
+        )
+        scans = hasher.scan_files(files)
+        first_scan = None
+        files_found = False
+        for scan in scans:
+            files_found = True
+            if scan.changed or full_sync or update_ids:
+                first_scan = scan
+                break
+
+        if first_scan is None:
+            if not (files_found or git_commits):
+                print_sub_warning("Markdown files not found!")
+                sys.exit(0)
+
+            update_git_commits(state, git_commits, recursive)
+            print_result("Files haven't changed since the last sync!")
+            sys.exit(0)
 
-    # Check correctness of note types
-    anki_media = AnkiMedia(profile, anki_path)
-    check_note_types(anki_media, anki_api)
+        anki_api, anki_media = open_collection(prompt)
+
+        # Duplicates from all files are reported at once in the end
+        duplicates: List[Note] = []
+        # Perform action on notes from each file
+        with RenderCache(RENDER_CACHE_PATH, converter.RENDERER_VERSION) as render_cache:
+            synced = sync_files(
+                (
+                    scan
+                    for scan in itertools.chain([first_scan], scans)
+                    if scan.changed or full_sync or update_ids
+                ),
+                update_ids,
+                ignore_errors,
+                anki_api,
+                anki_media,
+                hasher,
+                full_sync,
+                render_cache,
+                jobs,
+                duplicates,
+            )
 
-    # Get paths to all files
-    print_action("Searching Markdown files...")
-    files = get_paths_to_files(paths, recursive)
-    if not files:
-        print_sub_warning("Markdown files not found!")
-        sys.exit(0)
-
-    # Perform action on notes from each file
-    hasher = Hasher(HASHES_PATH)
-    initial_directory = os.getcwd()
-    for file in files:
-        try:
-            if update_ids:
-                update_note_ids_in_file(file, anki_api, anki_media)
-                continue
-
-            create_notes_from_file(file, full_sync, anki_api, anki_media, hasher)
-        except (
-            OSError,
-            ValueError,
-            FileNotFoundError,
-            FileExistsError,
-        ) as e:
-            print_error(f"{e}\nSkipping file!", pause=(not ignore_errors))
-        except AnkiApiError as e:
-            print_error(f"{e}\nSkipping file!", pause=(not ignore_errors), note=e.note)
-        finally:
-            os.chdir(initial_directory)
+        # Skipped files must be checked again during the next sync
+        if synced:
+            update_git_commits(state, git_commits, recursive)
+        # Options of the note types can be changed after the collection is opened
+        state.update_config_fingerprint("notes", CONFIG.get_fingerprint())
 
     # Sync changes with AnkiWeb
     print_action("Synchronizing changes with AnkiWeb...")
@@ -575,4 +1127,5 @@ def collect(
 
     # Close collection to save changes
     anki_api.close()
+    print_duplicates(duplicates)
     print_action("Everything is done!")
@@ -9,5 +9,13 @@ class AnkiApiError(Exception):
         self.note = note
 
 
+class DuplicateNoteError(AnkiApiError):
+    pass
+
+
 class HighlighterError(Exception):
     pass
+
+
+class GitError(Exception):
+    pass
@@ -0,0 +1,160 @@
+from typing import Iterable, List, Optional
+
+import mistune  # type: ignore
+from mistune.util import escape, escape_html  # type: ignore
+
+from .mathjax import render_html_block_mathjax, render_html_inline_mathjax
+
+
+class AnkiHTMLRenderer(mistune.HTMLRenderer):
+    """HTML renderer that doesn't put newlines around tags, because Anki renders them as line breaks.
+
+    Output is the same as the output of mistune.HTMLRenderer after removing one newline
+    before and after each tag with the regex r"\\n?(<.+?>)\\n?", but it's produced in one pass:
+    tags are rendered without newlines and rendered parts are joined without newlines
+    that are adjacent to tags.
+
+    Content of block math isn't escaped, so it can contain something that looks like a tag.
+    Such content sets has_raw_tags, and the output may differ from the result of the regex.
+    """
+
+    def __init__(self):
+        super().__init__(escape=True)
+        self.has_raw_tags = False
+
+    def finalize(self, data: Iterable[str]) -> str:
+        parts: List[str] = []
+        for part in data:
+            if not part:
+                continue
+
+            if parts and part[0] == "\n" and parts[-1][-1] == ">":
+                part = part[1:]
+            elif parts and part[0] == "<" and parts[-1][-1] == "\n":
+                parts[-1] = parts[-1][:-1]
+                if not parts[-1]:
+                    parts.pop()
+
+            if part:
+                parts.append(part)
+
+        return "".join(parts)
+
+    @staticmethod
+    def _wrap(start_tag: str, text: str, end_tag: str) -> str:
+        """Put text between the tags without newlines that are adjacent to them"""
+        if text[:1] == "\n":
+            text = text[1:]
+        if text[-1:] == "\n":
+            text = text[:-1]
+        return start_tag + text + end_tag
+
+    def emphasis(self, text: str) -> str:
+        return self._wrap("<em>", text, "</em>")
+
+    def strong(self, text: str) -> str:
+        return self._wrap("<strong>", text, "</strong>")
+
+    def strikethrough(self, text: str) -> str:
+        return self._wrap("<del>", text, "</del>")
+
+    def link(self, link: str, text: Optional[str] = None, title=None) -> str:
+        if text is None:
+            text = link
+
+        s = '<a href="' + self._safe_url(link) + '"'
+        if title:
+            s += ' title="' + escape_html(title) + '"'
+        return self._wrap(s + ">", text or link, "</a>")
+
+    def codespan(self, text: str) -> str:
+        return self._wrap("<code>", escape(text), "</code>")
+
+    def linebreak(self) -> str:
+        return "<br />"
+
+    def paragraph(self, text: str) -> str:
+        return self._wrap("<p>", text, "</p>")
+
+    def heading(self, text: str, level: int) -> str:
+        tag = "h" + str(level)
+        return self._wrap("<" + tag + ">", text, "</" + tag + ">")
+
+    def thematic_break(self) -> str:
+        return "<hr />"
+
+    def block_code(self, code: str, info: Optional[str] = None) -> str:
+        html = "<pre><code"
+        if info is not None:
+            info = info.strip()
+        if info:
+            lang = info.split(None, 1)[0]
+            lang = escape_html(lang)
+            html += ' class="language-' + lang + '"'
+        return self._wrap(html + ">", escape(code), "</code></pre>")
+
+    def block_quote(self, text: str) -> str:
+        return self._wrap("<blockquote>", text, "</blockquote>")
+
+    def block_html(self, html: str) -> str:
+        return self._wrap("<p>", escape(html), "</p>")
+
+    def block_error(self, html: str) -> str:
+        return self._wrap('<div class="error">', html, "</div>")
+
+    def list(self, text: str, ordered: bool, level: int, start=None) -> str:
+        if ordered:
+            html = "<ol"
+            if start is not None:
+                html += ' start="' + str(start) + '"'
+            return self._wrap(html + ">", text, "</ol>")
+        return self._wrap("<ul>", text, "</ul>")
+
+    def list_item(self, text: str, level: int) -> str:
+        return self._wrap("<li>", text, "</li>")
+
+    # footnotes plugin
+    def footnotes(self, text: str) -> str:
+        return self._wrap('<section class="footnotes"><ol>', text, "</ol></section>")
+
+    def footnote_item(self, text: str, key: str, index: int) -> str:
+        i = str(index)
+        back = '<a href="#fnref-' + i + '" class="footnote">&#8617;</a>'
+
+        text = text.rstrip()
+        if text.endswith("</p>"):
+            text = text[:-4] + back + "</p>"
+        else:
+            text = text + back
+        return self._wrap('<li id="fn-' + i + '">', text, "</li>")
+
+    # table plugin
+    def table(self, text: str) -> str:
+        return self._wrap("<table>", text, "</table>")
+
+    def table_head(self, text: str) -> str:
+        return self._wrap("<thead><tr>", text, "</tr></thead>")
+
+    def table_body(self, text: str) -> str:
+        return self._wrap("<tbody>", text, "</tbody>")
+
+    def table_row(self, text: str) -> str:
+        return self._wrap("<tr>", text, "</tr>")
+
+    def table_cell(self, text: str, align=None, is_head=False) -> str:
+        tag = "th" if is_head else "td"
+        html = "  <" + tag
+        if align:
+            html += ' style="text-align:' + align + '"'
+        return self._wrap(html + ">", text, "</" + tag + ">")
+
+    # mathjax plugin
+    def mathjax_inline(self, content: str) -> str:
+        return render_html_inline_mathjax(content)
+
+    def mathjax_block(self, content: str) -> str:
+        # Content can span multiple lines, so newlines around tags inside it can't be found
+        # by looking at the rendered parts
+        if "<" in content or ">" in content:
+            self.has_raw_tags = True
+        return render_html_block_mathjax(content)
@@ -2,18 +2,22 @@
 # and apy (https://github.com/lervag/apy) projects. Thanks to all their developers.
 
 import os
+from collections import defaultdict
 from pathlib import Path
-from typing import Dict, Iterable, List, Type
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple, Type
 
 import anki
 import anki.collection
 import anki.consts
+import anki.dbproxy
+import anki.decks
 import anki.errors
 import anki.models
 import anki.notes
+import anki.utils
 import aqt
 
-from ..exceptions import AnkiApiError
+from ..exceptions import AnkiApiError, DuplicateNoteError
 from .config import Config
 from .notes.note import Note
 
@@ -33,16 +37,20 @@ class AnkiApi:
         self._profile_manager = aqt.ProfileManager(anki_path)
         self._profile_manager.setupMeta()
 
+        # Note types and decks that were used to add notes, by their names
+        self._models: Dict[str, anki.models.NoteType] = {}
+        self._deck_ids: Dict[str, anki.decks.DeckId] = {}
+        # IDs of the existing notes by names of their note types
+        self._note_ids: Dict[str, Set[int]] = {}
+        # Checksums of the first fields of the existing notes by IDs of their note types
+        self._checksums: Dict[int, Set[int]] = {}
+
     def get_profiles(self) -> List[str]:
         """Get list of user profiles from Anki"""
         return self._profile_manager.profiles()
 
     def load_collection(self, profile: str) -> None:
         """Select profile in Anki and load collection"""
-        # opening collection changes current directory so
-        # we need to rollback it to initial
-        initial_dir = os.getcwd()
-
         try:
             self._profile_manager.load(profile)
             self._collection = anki.collection.Collection(
@@ -54,8 +62,6 @@ class AnkiApi:
                 "You need to either close Anki or switch to a different profile."
             )
 
-        os.chdir(initial_dir)
-
     def sync(self):
         """Sync collection to AnkiWeb"""
         # todo: handle case when to sync we need user decision (download or upload)
@@ -71,55 +77,325 @@ class AnkiApi:
         except anki.errors.NetworkError:
             raise AnkiApiError("Please check your internet connection")
 
-        # Perform media sync
-        initial_dir = os.getcwd()
-        os.chdir(self._collection.media.dir())
+        # Perform media sync. Paths to the media are resolved against the media folder by Anki
         self._collection.sync_media(auth)
-        os.chdir(initial_dir)
-
-    def add_note(self, note: Note) -> int:
-        model = self._collection.models.by_name(note.get_anki_note_type(self._cfg))
-        anki_note = anki.notes.Note(self._collection, model)
-        anki_note.tags = list(note.tags)
-        anki_note.fields = list(note.get_html_fields(self._cfg).values())
 
-        if anki_note.dupeOrEmpty():
-            raise AnkiApiError("duplicate! Note wasn't added.", note=note)
-
-        # gets id of the deck. if deck doesn't exist - it will be created.
-        deck_id = self._collection.decks.id(note.deck_name, create=True)
-        if not deck_id:
-            raise AnkiApiError(f"the deck {note.deck_name} couldn't be created.")
+    def add_notes(
+        self, notes: Sequence[Note]
+    ) -> Tuple[List[Optional[int]], List[AnkiApiError]]:
+        """Add notes to Anki at once. Note types and decks are looked up once for all notes.
+        Notes are checked for duplicates in Anki and among themselves before adding.
+
+        Args:
+            notes: notes that will be added
+        Returns:
+            IDs of the notes in the same order (None if note wasn't added)
+            and errors because of which notes weren't added
+        """
+        note_ids: List[Optional[int]] = [None] * len(notes)
+        errors: List[AnkiApiError] = []
+        added: List[Tuple[int, anki.notes.Note, anki.decks.DeckId]] = []
+        # First fields of the added notes, because Anki doesn't see duplicates among them
+        first_fields = set()
+        for i, note in enumerate(notes):
+            try:
+                model = self._get_model_by_name(note.get_anki_note_type(self._cfg))
+                anki_note = anki.notes.Note(self._collection, model)
+                anki_note.tags = list(note.tags)
+                anki_note.fields = list(note.get_html_fields(self._cfg).values())
+
+                first_field = (model["id"], self._strip_html(anki_note.fields[0]))
+                if not first_field[1].strip():
+                    raise AnkiApiError("first field is empty! Note wasn't added.")
+                if first_field in first_fields or self._is_duplicate(*first_field):
+                    raise DuplicateNoteError("duplicate! Note wasn't added.")
+                first_fields.add(first_field)
+
+                added.append((i, anki_note, self._get_deck_id(note.deck_name)))
+            except AnkiApiError as e:
+                e.note = note
+                errors.append(e)
+
+        # Notes are added in one operation by Anki 23.10 and newer
+        if hasattr(self._collection, "add_notes"):
+            self._collection.add_notes(
+                [
+                    anki.collection.AddNoteRequest(  # type: ignore[attr-defined]
+                        note=anki_note, deck_id=deck_id
+                    )
+                    for _, anki_note, deck_id in added
+                ]
+            )
+        else:
+            for _, anki_note, deck_id in added:
+                self._collection.add_note(anki_note, deck_id)
+
+        for i, anki_note, _ in added:
+            note_ids[i] = anki_note.id
+            if anki_note.mid in self._checksums:
+                self._checksums[anki_note.mid].add(
+                    self._get_field_checksum(anki_note.fields[0])
+                )
+            note_type = notes[i].get_anki_note_type(self._cfg)
+            if note_type in self._note_ids:
+                self._note_ids[note_type].add(anki_note.id)
+        return note_ids, errors
+
+    def update_note_ids(self, notes: Iterable[Note]) -> List[Note]:
+        """Update incorrect or absent IDs of notes by looking for the notes with the same first field in Anki.
+
+        Args:
+            notes: notes with IDs that will be checked
+        Returns:
+            Notes that weren't found in Anki (their IDs are removed)
+        """
+        # Update id only if note with this id doesn't exist
+        missing_notes = [note for note in notes if not self.has_note(note)]
+
+        not_found = []
+        for note, note_id in zip(
+            missing_notes, self._find_notes_by_first_field(missing_notes)
+        ):
+            note.anki_id = note_id
+            if note_id is None:
+                not_found.append(note)
+
+        return not_found
+
+    def has_note(self, note: Note) -> bool:
+        """Check if Anki has note with the ID of the note and the same note type.
+        IDs of the notes of each note type are read from the collection only once.
+        """
+        if not note.anki_id:
+            return False
+
+        note_type = note.get_anki_note_type(self._cfg)
+        if note_type not in self._note_ids:
+            model = self._get_model_by_name(note_type)
+            self._note_ids[note_type] = set(
+                self._get_db().list("SELECT id FROM notes WHERE mid = ?", model["id"])
+            )
 
-        self._collection.add_note(anki_note, deck_id)
-        return anki_note.id
+        return note.anki_id in self._note_ids[note_type]
 
-    def update_note_ids(self, notes: Iterable[Note]) -> None:
-        """Update incorrect or absent IDs of notes"""
+    def update_notes(
+        self,
+        notes: Sequence[Note],
+        synced_tags: Optional[Mapping[int, Iterable[str]]] = None,
+    ) -> List[AnkiApiError]:
+        """Synchronize changes in notes with Anki. Fields, tags and decks of all notes are read
+        at once, and only changed notes are written to the collection. Changes of tags are
+        applied together to all notes with the same changes, and cards are moved together
+        to each deck.
+
+        Only the tags that were sent to Anki during the previous syncs are removed from the notes,
+        so tags added in Anki (e.g. "leech" or "marked") are kept.
+
+        Args:
+            notes: notes with IDs of Anki notes
+            synced_tags: tags of the notes (by their IDs) that were sent to Anki before
+        Returns:
+            Errors because of which notes weren't updated
+        """
+        errors: List[AnkiApiError] = []
+        existing_notes: List[Tuple[int, Note]] = []
         for note in notes:
-            # Update id only if note with this id doesn't exist
+            if not (note.anki_id and self.has_note(note)):
+                errors.append(
+                    AnkiApiError(
+                        f"note with ID {note.anki_id} was not found. "
+                        f'You can update IDs on notes with the command "inka collect --update-ids path/to/file.md".',
+                        note=note,
+                    )
+                )
+                continue
+            existing_notes.append((note.anki_id, note))
+
+        note_ids = [note_id for note_id, _ in existing_notes]
+        current_notes = self._get_fields_and_tags_of_notes(note_ids)
+        current_decks = self._get_decks_of_cards(note_ids)
+
+        changed_notes = []
+        # IDs of the notes by tags that are added to or removed from them
+        tags_to_add: Dict[str, List[anki.collection.NoteId]] = defaultdict(list)
+        tags_to_remove: Dict[str, List[anki.collection.NoteId]] = defaultdict(list)
+        # IDs of the cards by decks to which they are moved
+        cards_to_move: Dict[
+            anki.decks.DeckId, List[anki.collection.CardId]
+        ] = defaultdict(list)
+        for note_id, note in existing_notes:
             try:
-                note_id = anki.collection.NoteId(note.anki_id if note.anki_id else -1)
-                self._collection.get_note(note_id)
-            except anki.errors.NotFoundError:
-                found_notes = self._collection.find_notes(note.search_query)
-                note.anki_id = found_notes[0] if found_notes else None
-
-    def update_note(self, note: Note) -> None:
-        """Synchronize changes in notes with Anki"""
-        try:
-            note_id = anki.collection.NoteId(note.anki_id if note.anki_id else -1)
-            anki_note = self._collection.get_note(note_id)
-        except anki.errors.NotFoundError:
-            raise AnkiApiError(
-                f"note with ID {note.anki_id} was not found. "
-                f'You can update IDs on notes with the command "inka collect --update-ids path/to/file.md".'
+                deck_id = self._get_deck_id(note.deck_name)
+            except AnkiApiError as e:
+                e.note = note
+                errors.append(e)
+                continue
+
+            for card_id, card_deck_id in current_decks.get(note_id, []):
+                if card_deck_id != deck_id:
+                    cards_to_move[deck_id].append(card_id)
+
+            fields, tags = current_notes.get(note_id, ({}, []))
+            new_fields = {
+                field: value
+                for field, value in note.get_html_fields(self._cfg).items()
+                if field in fields and fields[field] != value
+            }
+            added_tags = self._get_missing_tags(note.tags, tags)
+            previous_tags = {
+                tag.lower() for tag in (synced_tags or {}).get(note_id, [])
+            }
+            removed_tags = self._get_missing_tags(
+                (tag for tag in tags if tag.lower() in previous_tags), note.tags
             )
-
-        for field, value in note.get_html_fields(self._cfg).items():
-            if field in anki_note:
+            new_tags = self._get_missing_tags(tags, removed_tags) + added_tags
+            # Anki removes child tags together with their parent, so if note keeps
+            # the child, its tags are set directly
+            keeps_child_tag = any(
+                tag.lower().startswith(removed_tag.lower() + "::")
+                for removed_tag in removed_tags
+                for tag in new_tags
+            )
+            if not (new_fields or keeps_child_tag):
+                if added_tags:
+                    tags_to_add[" ".join(added_tags)].append(
+                        anki.collection.NoteId(note_id)
+                    )
+                if removed_tags:
+                    tags_to_remove[" ".join(removed_tags)].append(
+                        anki.collection.NoteId(note_id)
+                    )
+                continue
+
+            anki_note = self._collection.get_note(anki.collection.NoteId(note_id))
+            for field, value in new_fields.items():
                 anki_note[field] = value
-        anki_note.flush()
+            if added_tags or removed_tags:
+                anki_note.tags = new_tags
+            changed_notes.append(anki_note)
+
+        if changed_notes:
+            self._collection.update_notes(changed_notes)
+        for tag_string, tagged_note_ids in tags_to_add.items():
+            self._collection.tags.bulk_add(tagged_note_ids, tag_string)
+        for tag_string, tagged_note_ids in tags_to_remove.items():
+            self._collection.tags.bulk_remove(tagged_note_ids, tag_string)
+        for deck_id, card_ids in cards_to_move.items():
+            self._collection.set_deck(card_ids, deck_id)
+        return errors
+
+    @staticmethod
+    def _get_missing_tags(tags: Iterable[str], other_tags: Iterable[str]) -> List[str]:
+        """Get tags that aren't among other tags. Tags are compared case-insensitively, as in Anki."""
+        other_tags = {tag.lower() for tag in other_tags}
+        return [tag for tag in tags if tag.lower() not in other_tags]
+
+    def _find_notes_by_first_field(self, notes: Sequence[Note]) -> List[Optional[int]]:
+        """Find IDs of the notes in Anki with the same note type and first field.
+        Notes are looked up in one query by checksum of the first field (that Anki keeps
+        in the index), and then their first fields are compared.
+        """
+        first_fields = []
+        for note in notes:
+            model = self._get_model_by_name(note.get_anki_note_type(self._cfg))
+            first_field_name = model["flds"][0]["name"]
+            first_field = note.get_html_fields(self._cfg).get(first_field_name, "")
+            first_fields.append((model["id"], first_field))
+        if not first_fields:
+            return []
+
+        checksums = {self._get_field_checksum(field) for _, field in first_fields}
+        rows = self._get_db().all(
+            "SELECT id, mid, flds FROM notes "
+            f"WHERE csum IN {anki.utils.ids2str(checksums)} ORDER BY id"
+        )
+
+        found_ids: Dict[Tuple[int, str], int] = {}
+        for note_id, model_id, fields in rows:
+            first_field = anki.utils.split_fields(fields)[0]
+            found_ids.setdefault((model_id, first_field), note_id)
+
+        return [found_ids.get(first_field) for first_field in first_fields]
+
+    def _is_duplicate(self, model_id: int, first_field: str) -> bool:
+        """Check if Anki has note of the note type with the same first field (without html).
+        Checksums of the first fields of each note type are read from the collection only once,
+        and the fields themselves are compared only when the checksum matches.
+        """
+        if model_id not in self._checksums:
+            self._checksums[model_id] = set(
+                self._get_db().list("SELECT csum FROM notes WHERE mid = ?", model_id)
+            )
+
+        checksum = self._get_checksum(first_field)
+        if checksum not in self._checksums[model_id]:
+            return False
+
+        rows = self._get_db().list(
+            "SELECT flds FROM notes WHERE mid = ? AND csum = ?", model_id, checksum
+        )
+        return any(
+            self._strip_html(anki.utils.split_fields(fields)[0]) == first_field
+            for fields in rows
+        )
+
+    def _get_field_checksum(self, field: str) -> int:
+        """Get checksum of the field as Anki calculates it for the first field of the note"""
+        return self._get_checksum(self._strip_html(field))
+
+    def _strip_html(self, field: str) -> str:
+        """Remove html from the field, but keep names of the media files"""
+        # Anki strips html with the global backend that isn't initialized without GUI
+        return self._collection._backend.strip_html(
+            text=field, mode=anki.collection.StripHtmlMode.PRESERVE_MEDIA_FILENAMES
+        )
+
+    @staticmethod
+    def _get_checksum(text: str) -> int:
+        return int(anki.utils.checksum(text)[:8], 16)
+
+    def _get_fields_and_tags_of_notes(
+        self, note_ids: Iterable[int]
+    ) -> Dict[int, Tuple[Dict[str, str], List[str]]]:
+        """Get fields of the existing notes by their names and tags of the notes in one query"""
+        rows = self._get_db().all(
+            "SELECT id, mid, flds, tags FROM notes "
+            f"WHERE id IN {anki.utils.ids2str(note_ids)}"
+        )
+
+        notes = {}
+        field_names: Dict[int, List[str]] = {}  # by ID of note type
+        for note_id, model_id, fields, tags in rows:
+            if model_id not in field_names:
+                model = self._collection.models.get(model_id)
+                field_names[model_id] = (
+                    [field["name"] for field in model["flds"]] if model else []
+                )
+            notes[note_id] = (
+                dict(zip(field_names[model_id], anki.utils.split_fields(fields))),
+                self._collection.tags.split(tags),
+            )
+
+        return notes
+
+    def _get_decks_of_cards(
+        self, note_ids: Iterable[int]
+    ) -> Dict[int, List[Tuple[anki.collection.CardId, int]]]:
+        """Get IDs of the cards of the existing notes with IDs of their decks in one query.
+        For cards in filtered decks IDs of their home decks are returned.
+        """
+        rows = self._get_db().all(
+            "SELECT id, nid, did, odid FROM cards "
+            f"WHERE nid IN {anki.utils.ids2str(note_ids)}"
+        )
+
+        cards: Dict[int, List[Tuple[anki.collection.CardId, int]]] = defaultdict(list)
+        for card_id, note_id, deck_id, original_deck_id in rows:
+            cards[note_id].append(
+                (anki.collection.CardId(card_id), original_deck_id or deck_id)
+            )
+
+        return cards
 
     def fetch_note_types(self) -> List[str]:
         """Get list of names of the existing note types"""
@@ -161,6 +437,7 @@ class AnkiApi:
             counter += 1
 
         self._collection.models.add(model)
+        self._models.pop(name, None)
 
     def fetch_note_type_styling(self, note_type: Type[Note]) -> str:
         """Get styling of note type that is used to add notes"""
@@ -210,6 +487,32 @@ class AnkiApi:
         """Save and close the collection."""
         self._collection.close()
 
+    def _get_db(self) -> anki.dbproxy.DBProxy:
+        if self._collection.db is None:
+            raise AnkiApiError("the collection is closed.")
+
+        return self._collection.db
+
+    def _get_model_by_name(self, name: str) -> anki.models.NoteType:
+        """Get note type from Anki. Note type is looked up only once"""
+        if name not in self._models:
+            anki_model = self._collection.models.by_name(name)
+            if not anki_model:
+                raise AnkiApiError(f"couldn't get note type {name} from Anki!")
+            self._models[name] = anki_model
+
+        return self._models[name]
+
+    def _get_deck_id(self, name: str) -> anki.decks.DeckId:
+        """Get ID of the deck. If deck doesn't exist - it will be created"""
+        if name not in self._deck_ids:
+            deck_id = self._collection.decks.id(name, create=True)
+            if not deck_id:
+                raise AnkiApiError(f"the deck {name} couldn't be created.")
+            self._deck_ids[name] = deck_id
+
+        return self._deck_ids[name]
+
     def _get_model(self, note_type: Type[Note]) -> anki.models.NoteType:
         model_name = note_type.get_anki_note_type(self._cfg)
         anki_model = self._collection.models.by_name(model_name)
@@ -1,4 +1,5 @@
 import configparser
+import hashlib
 import os
 from pathlib import Path
 from typing import List, Union
@@ -20,6 +21,15 @@ class Config:
     _default_cloze_field = "Text"
     _default_highlight_style = "monokai"
 
+    _fingerprint_options = [
+        ("defaults", "deck"),
+        ("anki", "basic_type"),
+        ("anki", "front_field"),
+        ("anki", "back_field"),
+        ("anki", "cloze_type"),
+        ("anki", "cloze_field"),
+    ]
+
     def __init__(self, config_path: Union[str, Path]):
         self._config = configparser.ConfigParser()
         self._config_path = config_path
@@ -79,6 +89,14 @@ class Config:
         self._config[section][key] = new_value
         self._save()
 
+    def get_fingerprint(self) -> str:
+        """Get fingerprint of the options that affect how notes are added to Anki"""
+        options = [
+            f"{section}.{key}={self._config[section][key]}"
+            for section, key in self._fingerprint_options
+        ]
+        return hashlib.sha1("\n".join(options).encode("utf-8")).hexdigest()
+
     def get_formatted_options(self) -> List[str]:
         """Get list of formatted key-value entries from the config"""
         formatted_entries = []
@@ -1,119 +1,140 @@
+import functools
 import re
-from typing import Iterable, Iterator, Match, Pattern, Tuple, Union
+from typing import Callable, Iterable, Iterator, Optional, Tuple
 
 import mistune  # type: ignore
 
 from ..mistune_plugins.mathjax import BLOCK_MATH, INLINE_MATH, plugin_mathjax
+from ..mistune_plugins.renderer import AnkiHTMLRenderer
 from .notes.basic_note import Note
 from .notes.cloze_note import ClozeNote
-
-MD = mistune.create_markdown(
-    plugins=["strikethrough", "footnotes", "table", plugin_mathjax]
-)
+from .render_cache import RenderCache
+
+PLUGINS = ["strikethrough", "footnotes", "table", plugin_mathjax]
+RENDERER = AnkiHTMLRenderer()
+MD = mistune.create_markdown(renderer=RENDERER, plugins=PLUGINS)
+# Markdown with the default renderer for the text that AnkiHTMLRenderer can't render in one pass
+DEFAULT_MD = mistune.create_markdown(plugins=PLUGINS)
+TAG_WITH_NEWLINES_REGEX = re.compile(r"\n?(<.+?>)\n?")
+# Version of the conversion to html that is used to key cached results.
+# Has to be changed when the output of _convert_md_to_html changes
+RENDERER_VERSION = f"mistune {mistune.__version__}; plugins: strikethrough, footnotes, table, mathjax; 1"
 
 INLINE_CODE_REGEX = re.compile(r"`[\S\s]+?`", re.MULTILINE)
 BLOCK_CODE_REGEX = re.compile(r"```[\s\S]+?```", re.MULTILINE)
-CLOZE_DELETION_REGEX = re.compile(
-    r"{{c\d+::[\s\S]*?}}|" r"{c?\d+::[\s\S]*?}|" r"{[\s\S]*?}", re.MULTILINE
+# Code and math (in which cloze deletions aren't searched) or curly brace.
+# Block code and math go first, so that they aren't taken for the inline ones
+CLOZE_TOKEN_REGEX = re.compile(
+    "|".join(
+        [
+            BLOCK_CODE_REGEX.pattern,
+            INLINE_CODE_REGEX.pattern,
+            BLOCK_MATH,
+            INLINE_MATH,
+            r"[{}]",
+        ]
+    )
 )
-ANKI_CLOZE_REGEX = re.compile(r"{{c\d+::[\s\S]*?}}", re.MULTILINE)
-EXPLICIT_SHORT_CLOZE_REGEX = re.compile(r"{c?(\d+)::([\s\S]*?)}", re.MULTILINE)
-IMPLICIT_SHORT_CLOZE_REGEX = re.compile(r"{([\s\S]*?)}", re.MULTILINE)
+ANKI_CLOZE_START_REGEX = re.compile(r"{{c\d+::")
+EXPLICIT_SHORT_CLOZE_START_REGEX = re.compile(r"{c?(\d+)::")
 
-INLINE_CODE_PLACEHOLDER = "INLINE_CODE_PLACEHOLDER"
-BLOCK_CODE_PLACEHOLDER = "BLOCK_CODE_PLACEHOLDER"
-INLINE_MATH_PLACEHOLDER = "INLINE_MATH_PLACEHOLDER"
-BLOCK_MATH_PLACEHOLDER = "BLOCK_MATH_PLACEHOLDER"
 
+def convert_notes_to_html(notes: Iterable[Note], cache: Optional[RenderCache] = None):
+    """Convert note fields to html. Fields that were already converted are taken from the cache (if it's passed)"""
+    convert_func: Callable[[str], str] = _convert_md_to_html
+    if cache:
+        convert_func = functools.partial(cache.render, render_func=_convert_md_to_html)
 
-def convert_notes_to_html(notes: Iterable[Note]):
-    """Convert note fields to html"""
     for note in notes:
-        note.convert_fields_to_html(_convert_md_to_html)
+        note.convert_fields_to_html(convert_func)
 
 
 def convert_cloze_deletions_to_anki_format(cloze_notes: Iterable[ClozeNote]):
     """Convert short syntax for cloze deletions to anki syntax"""
     for note in cloze_notes:
-        # We substitute code and math inline/blocks with placeholders before searching cloze deletions
-        # Block code should be removed before inline code
-        block_code_matches, redacted_text = _get_matches_and_updated_text(
-            BLOCK_CODE_REGEX, BLOCK_CODE_PLACEHOLDER, note.updated_text_md
-        )
-        inline_code_matches, redacted_text = _get_matches_and_updated_text(
-            INLINE_CODE_REGEX, INLINE_CODE_PLACEHOLDER, redacted_text
-        )
-
-        # Block math should be removed before inline math
-        block_math_matches, redacted_text = _get_matches_and_updated_text(
-            BLOCK_MATH, BLOCK_MATH_PLACEHOLDER, redacted_text
-        )
-        inline_math_matches, redacted_text = _get_matches_and_updated_text(
-            INLINE_MATH, INLINE_MATH_PLACEHOLDER, redacted_text
-        )
+        note.updated_text_md = _convert_cloze_deletions(note.updated_text_md)
 
-        cloze_strings = CLOZE_DELETION_REGEX.findall(redacted_text)
-        redacted_text = _replace_short_cloze_syntax(redacted_text, cloze_strings)
 
-        redacted_text = _replace_placeholders_with_content(
-            block_code_matches, BLOCK_CODE_PLACEHOLDER, redacted_text
-        )
-        redacted_text = _replace_placeholders_with_content(
-            inline_code_matches, INLINE_CODE_PLACEHOLDER, redacted_text
-        )
-        redacted_text = _replace_placeholders_with_content(
-            block_math_matches, BLOCK_MATH_PLACEHOLDER, redacted_text
-        )
-        redacted_text = _replace_placeholders_with_content(
-            inline_math_matches, INLINE_MATH_PLACEHOLDER, redacted_text
+def _convert_md_to_html(text: str) -> str:
+    # Renderer doesn't put '\n' around html tags because Anki is rendering them as newlines
+    RENDERER.has_raw_tags = False
+    html = MD(text)
+    if RENDERER.has_raw_tags:
+        # Tags from the raw content can only be found in the whole html,
+        # so '\n' around them are deleted after rendering
+        html = TAG_WITH_NEWLINES_REGEX.sub(
+            lambda tag_match: tag_match.group(1), DEFAULT_MD(text)
         )
+    return html
 
-        note.updated_text_md = redacted_text
 
-
-def _convert_md_to_html(text: str) -> str:
-    # We delete '\n' before and after each html tag because Anki is rendering them as newlines
-    return re.sub(r"\n?(<.+?>)\n?", lambda tag_match: tag_match.group(1), MD(text))
-
-
-def _get_matches_and_updated_text(
-    regex_pattern: Union[str, Pattern], placeholder: str, text: str
-) -> Tuple[Iterator[Match[str]], str]:
-    """Search for matches with regex pattern and then replace same matches in text with placeholder"""
-    matches = re.finditer(regex_pattern, text)
-    new_text = re.sub(regex_pattern, placeholder, text)
-    return matches, new_text
-
-
-def _replace_placeholders_with_content(
-    matches: Iterable[Match[str]], placeholder: str, text: str
-) -> str:
-    """Replace placeholder occurrences with text from regex matches"""
-    new_text = text
-    for match in matches:
-        new_text = new_text.replace(placeholder, match.group(0), 1)
-    return new_text
-
-
-def _replace_short_cloze_syntax(text: str, cloze_strings: Iterable[str]) -> str:
-    """Replace short implicit and explicit cloze syntax with Anki cloze syntax in text"""
-    new_text = text
-    for i, cloze in enumerate(cloze_strings, start=1):
-        if re.match(ANKI_CLOZE_REGEX, cloze):
+def _convert_cloze_deletions(text: str) -> str:
+    """Replace short implicit and explicit cloze syntax with Anki cloze syntax in one pass over the text.
+    Cloze deletions are numbered in the order they appear in the text (including the ones in Anki syntax).
+    """
+    parts = []
+    position = 0
+    for index, (start, end) in enumerate(_iter_cloze_deletions(text), start=1):
+        if text.startswith("}}", end - 2) and ANKI_CLOZE_START_REGEX.match(text, start):
             continue
 
-        explicit_match = re.match(EXPLICIT_SHORT_CLOZE_REGEX, cloze)
+        explicit_match = EXPLICIT_SHORT_CLOZE_START_REGEX.match(text, start)
         if explicit_match:
-            explicit_index = explicit_match.group(1)
-            content = explicit_match.group(2)
-            new_cloze = "{{" + f"c{explicit_index}::{content}" + "}}"
-            new_text = new_text.replace(cloze, new_cloze, 1)
+            number = explicit_match.group(1)
+            content = text[explicit_match.end() : end - 1]
+        else:
+            number = str(index)
+            content = text[start + 1 : end - 1]
+
+        parts.append(text[position:start])
+        parts.append("{{" + f"c{number}::{content}" + "}}")
+        position = end
+
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def _iter_cloze_deletions(text: str) -> Iterator[Tuple[int, int]]:
+    """Find start and end of each cloze deletion in the text. Code and math are skipped"""
+    position = 0
+    while True:
+        match = CLOZE_TOKEN_REGEX.search(text, position)
+        if not match:
+            return
+
+        position = match.end()
+        if match.group() != "{":
             continue
 
-        implicit_match = re.match(IMPLICIT_SHORT_CLOZE_REGEX, cloze)
-        if implicit_match:
-            content = implicit_match.group(1)
-            new_cloze = "{{" + f"c{i}::{content}" + "}}"
-            new_text = new_text.replace(cloze, new_cloze, 1)
+        end = _find_cloze_deletion_end(text, match.start())
+        if end is None:
+            return  # there are no closing braces further in the text
+
+        yield match.start(), end
+        position = end
+
+
+def _find_cloze_deletion_end(text: str, start: int) -> Optional[int]:
+    """Find the end of the cloze deletion that starts with the curly brace.
+    Cloze deletion in Anki syntax ends with '}}', others end with '}'.
+    Returns None if the cloze deletion doesn't end.
+    """
+    is_anki_cloze = ANKI_CLOZE_START_REGEX.match(text, start)
+    first_end = None
+    position = start + 1
+    while True:
+        match = CLOZE_TOKEN_REGEX.search(text, position)
+        if not match:
+            # Anki cloze deletion without '}}' ends as the implicit one
+            return first_end
+
+        position = match.end()
+        if match.group() != "}":
+            continue
 
-    return new_text
+        if not is_anki_cloze:
+            return position
+        if text.startswith("}", position):
+            return position + 1
+        if first_end is None:
+            first_end = position
@@ -0,0 +1,177 @@
+import contextlib
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from .hasher import FileScan, FileSignature, Hasher
+
+
+class Document:
+    """Contents of the text file with notes.
+
+    File is memory-mapped, so its contents are read from the file system only when
+    they're needed and the whole file doesn't have to be in memory. Text is decoded
+    with universal newlines (as in text mode) and can be iterated over in chunks.
+    Hash of the file is calculated from the mapped contents, unless it's already known.
+    """
+
+    # Approximate size of the chunks (in bytes) in which text is decoded
+    _chunk_size = 1024 * 1024
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        data: Optional[Union[bytes, mmap.mmap]] = None,
+        signature: Optional[FileSignature] = None,
+        file_hash: Optional[str] = None,
+    ):
+        self.path = path
+        self.signature = signature
+        self._data = data  # None if the file has to be mapped again
+        self._text: Optional[str] = None
+        self._hash = file_hash
+
+    @classmethod
+    def read(
+        cls, path: Union[str, Path], scan: Optional[FileScan] = None
+    ) -> "Document":
+        """Open and memory-map the file. Its signature is taken before the contents are mapped
+
+        Args:
+            path: path to the file
+            scan: result of the last check of the file for changes. Its hash is used
+                if the file hasn't changed since then
+        Returns:
+            Document with contents of the file
+        Raises:
+            OSError: if the file can't be read
+        """
+        signature = Hasher.get_signature(path)
+        file_hash = scan.get_hash(signature) if scan else None
+        return cls(path, cls._map(path), signature, file_hash)
+
+    @property
+    def text(self) -> str:
+        """Decoded contents of the file. The whole text is kept in memory
+
+        Raises:
+            UnicodeDecodeError: if the file isn't encoded in UTF-8
+        """
+        if self._text is None:
+            self._text = "".join(self.iter_text())
+        return self._text
+
+    @property
+    def hash(self) -> str:
+        """Hash of the contents of the file (same as calculated by Hasher)"""
+        if self._hash is None:
+            self._hash = Hasher.calculate_hash_of_data(self._get_data())
+        return self._hash
+
+    def iter_text(self) -> Iterator[str]:
+        """Iterate over decoded text in chunks. Each chunk (except the last one) ends with newline
+
+        Raises:
+            UnicodeDecodeError: if the file isn't encoded in UTF-8
+        """
+        if self._text is not None:
+            yield self._text
+            return
+
+        data = self._get_data()
+        position = 0
+        while position < len(data):
+            # Chunks are split after newline, so multibyte characters and '\r\n' aren't split
+            end = data.rfind(b"\n", position, position + self._chunk_size) + 1
+            if end == 0:
+                end = data.find(b"\n", position + self._chunk_size) + 1 or len(data)
+
+            chunk = data[position:end].decode("utf-8")
+            yield chunk.replace("\r\n", "\n").replace("\r", "\n")
+            position = end
+
+    def write(self, text: str) -> None:
+        """Write text to the file (newlines are translated as in text mode) and update the document.
+
+        Args:
+            text: new contents of the file
+        Raises:
+            OSError: if the file can't be written
+        """
+        self.write_chunks([text])
+
+    def write_chunks(self, chunks: Iterable[str]) -> None:
+        """Write text to the file in chunks (newlines are translated as in text mode) and update the document.
+        File is replaced atomically: text is written to the temporary file which is then renamed.
+        Chunks can be produced from the current contents of the document.
+
+        Args:
+            chunks: new contents of the file
+        Raises:
+            OSError: if the file can't be written
+        """
+        # Symbolic link to the file must stay a link
+        path = os.path.realpath(self.path)
+        directory, name = os.path.split(path)
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f".{name}.", suffix=".tmp", dir=directory
+        )
+        try:
+            file_hash = hashlib.sha1()
+            with os.fdopen(fd, mode="wb") as f:
+                for chunk in chunks:
+                    data = chunk.replace("\n", os.linesep).encode("utf-8")
+                    f.write(data)
+                    file_hash.update(data)
+                f.flush()
+                os.fsync(f.fileno())
+                stat = os.fstat(f.fileno())
+
+            if os.path.exists(path):
+                shutil.copymode(path, temp_path)
+
+            # Mapped file can't be replaced on Windows
+            self.close()
+            self._data = None
+            os.replace(temp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+
+        self.signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        self._text = None
+        self._hash = file_hash.hexdigest()
+
+    def close(self) -> None:
+        """Unmap the file. It is mapped again if contents of the document are needed"""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+            self._data = None
+
+    def _get_data(self) -> Union[bytes, mmap.mmap]:
+        if self._data is None:
+            self._data = self._map(self.path)
+        return self._data
+
+    @staticmethod
+    def _map(path: Union[str, Path]) -> Union[bytes, mmap.mmap]:
+        """Memory-map the file for reading"""
+        with open(path, mode="rb") as f:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return b""  # empty files can't be mapped
+
+    def __enter__(self) -> "Document":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
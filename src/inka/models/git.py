@@ -0,0 +1,133 @@
+import os
+import subprocess
+from typing import Iterable, List, Optional
+
+from ..exceptions import GitError
+
+
+def get_repository_root(path: str) -> Optional[str]:
+    """Get path to the root of the git repository that contains the file or directory.
+
+    Args:
+        path: path to the file or directory
+    Returns:
+        Real path to the root of the repository or None if path is not inside a repository
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    try:
+        root = _run_git(directory, "rev-parse", "--show-toplevel").strip()
+    except GitError:
+        return None
+
+    return os.path.realpath(root)
+
+
+def get_head_commit(repository_root: str) -> Optional[str]:
+    """Get hash of the HEAD commit. Returns None if repository has no commits"""
+    try:
+        return _run_git(repository_root, "rev-parse", "--verify", "HEAD").strip()
+    except GitError:
+        return None
+
+
+def get_changed_files(
+    repository_root: str,
+    since: str,
+    path: str,
+    extensions: Iterable[str],
+    recursive: bool,
+) -> List[str]:
+    """Get files that were changed since the commit, including uncommitted and untracked files.
+
+    Args:
+        repository_root: real path to the root of the git repository
+        since: revision with which files are compared
+        path: real path to the file or directory (inside the repository) in which to look for changes
+        extensions: extensions of the files to look for (with period)
+        recursive: look for changes in subdirectories
+    Returns:
+        Real paths to the changed files (deleted files are excluded)
+    Raises:
+        GitError: if git isn't installed or revision is incorrect
+    """
+    extensions = tuple(extensions)
+    pathspec = os.path.relpath(path, repository_root)
+
+    changed = _run_git(
+        repository_root,
+        "diff",
+        "--name-only",
+        "-z",
+        "--no-renames",
+        "--diff-filter=d",
+        since,
+        "--",
+        pathspec,
+    )
+    untracked = _run_git(
+        repository_root,
+        "ls-files",
+        "--others",
+        "--exclude-standard",
+        "-z",
+        "--",
+        pathspec,
+    )
+
+    return filter_files(
+        (
+            os.path.normpath(os.path.join(repository_root, name))
+            for name in dict.fromkeys((changed + untracked).split("\0"))
+            if name
+        ),
+        path,
+        extensions,
+        recursive,
+    )
+
+
+def filter_files(
+    files: Iterable[str], path: str, extensions: Iterable[str], recursive: bool
+) -> List[str]:
+    """Get files with the extensions that are inside the path (or are the path itself).
+
+    Args:
+        files: real paths to the files
+        path: real path to the file or directory
+        extensions: extensions of the files to keep (with period)
+        recursive: keep files from subdirectories of the path
+    Returns:
+        Files from the path without duplicates
+    """
+    extensions = tuple(extensions)
+    directory = os.path.join(path, "")
+    result = []
+    for file_path in dict.fromkeys(files):
+        if os.path.splitext(file_path)[1] not in extensions:
+            continue
+        if file_path != path and not (
+            os.path.dirname(file_path) == path
+            or (recursive and file_path.startswith(directory))
+        ):
+            continue
+
+        result.append(file_path)
+
+    return result
+
+
+def _run_git(directory: str, *args: str) -> str:
+    """Run git command in the directory and return its output"""
+    try:
+        result = subprocess.run(
+            ["git", "-C", directory, "-c", "core.quotePath=false", *args],
+            capture_output=True,
+            check=True,
+            encoding="utf-8",
+        )
+    except FileNotFoundError:
+        raise GitError("git is not installed")
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.strip() or f"git {args[0]} failed")
+
+    return result.stdout
@@ -1,40 +1,193 @@
+import collections
 import hashlib
-import json
+import mmap
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .sync_state import FileState, SyncState
+
+# (size, mtime_ns, inode) of the file
+FileSignature = Tuple[int, int, int]
+# Signature and hash of the file (None if they couldn't be read)
+_FileCheck = Tuple[Optional[FileSignature], Optional[str]]
+
+
+class FileScan(NamedTuple):
+    """Result of checking the file for changes"""
+
+    path: str
+    signature: Optional[FileSignature]  # None if the file couldn't be accessed
+    hash: Optional[str]
+    changed: bool
+
+    def get_hash(self, signature: Optional[FileSignature]) -> Optional[str]:
+        """Get hash of the file if it has the same signature as during the scan. Returns None
+        if the signature is different or can't be trusted (see Hasher.is_reliable_signature)
+        """
+        if signature is None or signature != self.signature:
+            return None
+        return self.hash if Hasher.is_reliable_signature(signature) else None
 
 
 class Hasher:
-    def __init__(self, path: str):
-        self._path = path
-        try:
-            with open(path, mode="rt", encoding="utf-8") as f:
-                self._hashes = json.load(f)
-        except FileNotFoundError:
-            self._hashes = {}
+    # Files modified this recently can still change without changing their signature
+    # (mtime granularity), so their signature is not trusted until the next run
+    _racy_interval_ns = 2 * 10**9
+    _chunk_size = 1024 * 1024
+    # Maximum number of files that are checked ahead of the returned ones
+    _scan_window = 64
 
-    def update_hash(self, filepath: str, new_hash: str) -> None:
-        """Update hash value for this filepath in the datafile"""
-        self._hashes[filepath] = new_hash
-        self._save()
+    def __init__(self, state: SyncState):
+        self._state = state
+
+    def update_hash(
+        self,
+        filepath: str,
+        new_hash: str,
+        signature: Optional[FileSignature] = None,
+        note_ids: Optional[Iterable[int]] = None,
+        sections: Optional[Dict[str, List[int]]] = None,
+    ) -> None:
+        """Update hash value and signature (and optionally IDs of notes and hashes of sections) for this filepath
+        in the sync state. Signature should be taken before the hash is calculated. If it's not passed,
+        the current one is used.
+        """
+        if signature is None:
+            signature = self.get_signature(filepath)
+
+        if not self.is_reliable_signature(signature):
+            signature = None
+
+        self._state.update_file(filepath, new_hash, signature, note_ids)
+        if sections is not None:
+            self._state.update_sections(filepath, sections)
+
+    def get_synced_sections(self, filepath: str) -> Dict[str, List[int]]:
+        """Get hashes of the sections from this file that were synced last time with IDs of their notes"""
+        return self._state.get_sections(filepath)
 
     def has_changed(self, filepath: str, curr_hash: str) -> bool:
         """Check if the hash of this file changed. Returns True if file doesn't have previous hash value"""
-        try:
-            return self._hashes[filepath] != curr_hash
-        except KeyError:
+        file_state = self._state.get_file(filepath)
+        if file_state is None:
             return True
 
+        return file_state.hash != curr_hash
+
+    def scan_files(
+        self, filepaths: Iterable[str], max_workers: Optional[int] = None
+    ) -> Iterator[FileScan]:
+        """Check which files changed since the last sync. Files are checked concurrently as paths to them come,
+        and results are returned lazily in the same order. Only files with changed signature are hashed.
+        If the content of such file hasn't changed, its new signature is saved.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending: Deque[Tuple[str, Optional[FileState], "Future[_FileCheck]"]]
+            pending = collections.deque()
+            for path in filepaths:
+                # Sync state is read in this thread, files are read in the pool
+                file_state = self._state.get_file(path)
+                synced_signature = file_state.signature if file_state else None
+                future = executor.submit(self._check_file, path, synced_signature)
+                pending.append((path, file_state, future))
+                if len(pending) >= self._scan_window:
+                    yield self._get_scan(*pending.popleft())
+
+            while pending:
+                yield self._get_scan(*pending.popleft())
+
+    def _get_scan(
+        self,
+        path: str,
+        file_state: Optional[FileState],
+        future: "Future[_FileCheck]",
+    ) -> FileScan:
+        signature, curr_hash = future.result()
+        # Hash of the file with the same signature is taken from the sync state
+        if signature and file_state and file_state.signature == signature:
+            return FileScan(path, signature, file_state.hash, False)
+
+        if signature is None or curr_hash is None:
+            return FileScan(path, signature, curr_hash, True)
+
+        changed = file_state is None or file_state.hash != curr_hash
+        if not changed:
+            self.update_hash(path, curr_hash, signature)
+        return FileScan(path, signature, curr_hash, changed)
+
+    def get_note_fingerprints(self, note_ids: Iterable[int]) -> Dict[int, str]:
+        """Get fingerprints of the notes that were sent to Anki during the last sync"""
+        return self._state.get_note_fingerprints(note_ids)
+
+    def update_note_fingerprints(
+        self,
+        fingerprints: Dict[int, str],
+        tags: Optional[Dict[int, List[str]]] = None,
+    ) -> None:
+        """Save fingerprints of the notes that were sent to Anki together with their tags"""
+        self._state.update_note_fingerprints(fingerprints, tags)
+
+    def get_synced_tags(self, note_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """Get tags of the notes that were sent to Anki during the previous syncs"""
+        return self._state.get_note_tags(note_ids)
+
     def reset_hashes(self) -> None:
-        """Remove all hashes from the file"""
-        self._hashes = {}
-        self._save()
+        """Remove all hashes (of files, sections and notes), directory listings and synced git commits from the sync state"""
+        self._state.remove_files()
+
+    @classmethod
+    def is_reliable_signature(cls, signature: FileSignature) -> bool:
+        """Check if the file with the signature couldn't change without changing its signature"""
+        return time.time_ns() - signature[1] > cls._racy_interval_ns
+
+    @staticmethod
+    def get_signature(filepath: Union[str, Path]) -> FileSignature:
+        """Get size, modification time (in nanoseconds) and inode number of the file"""
+        stat = os.stat(filepath)
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    @classmethod
+    def _check_file(
+        cls, filepath: str, synced_signature: Optional[FileSignature]
+    ) -> "_FileCheck":
+        """Get signature of the file and its hash if the signature differs from the synced one.
+        None is returned instead of the values that couldn't be read.
+        """
+        try:
+            signature = cls.get_signature(filepath)
+            if signature == synced_signature:
+                return signature, None
+        except OSError:
+            return None, None
+
+        try:
+            return signature, cls.calculate_hash(filepath)
+        except OSError:
+            return signature, None
 
-    def _save(self) -> None:
-        with open(self._path, mode="wt", encoding="utf-8") as f:
-            json.dump(self._hashes, f)
+    @classmethod
+    def calculate_hash(cls, filepath: str) -> str:
+        """Calculate SHA-1 hash for the contents of the file"""
+        file_hash = hashlib.sha1()
+        with open(filepath, mode="rb") as f:
+            while chunk := f.read(cls._chunk_size):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
 
     @staticmethod
-    def calculate_hash(filepath: str) -> str:
-        """Calculate MD5 hash for the file"""
-        with open(filepath, mode="rt", encoding="utf-8") as f:
-            encoded_text = f.read().encode("utf-8")
-        return hashlib.md5(encoded_text).hexdigest()
+    def calculate_hash_of_data(data: Union[bytes, mmap.mmap]) -> str:
+        """Calculate SHA-1 hash for the contents of the file that are already in memory"""
+        return hashlib.sha1(data).hexdigest()
@@ -6,28 +6,22 @@ from .anki_media import AnkiMedia
 from .notes.note import Note
 
 
-def handle_images_in(
-    notes: List[Note], anki_media: AnkiMedia, copy_images: bool = True
-) -> None:
-    """
-    Copy images used in Notes fields to Anki Media folder and change source in their
-    links to be just filename (for Anki to find them).
+def update_image_links_in(notes: List[Note]) -> List[str]:
+    """Change source in image links of the notes to be just filename.
 
     Args:
         notes: Notes in which image links will be searched for and then updated
-        anki_media: AnkiMedia object that will be used to copy images
-        copy_images: copy images to Anki media folder or not
+    Returns:
+        List of unique image links (as they were before the update)
     """
     # Find all unique image links in the notes
     image_links = _fetch_image_links(notes)
 
-    # Copy images to Anki Media folder
-    if copy_images:
-        _copy_images_to(anki_media, list(image_links.keys()))
-
     # Update image links in notes
     _update_image_links_in_notes(image_links)
 
+    return list(image_links)
+
 
 def _fetch_image_links(notes: List[Note]) -> Dict[str, List[Note]]:
     """Get dictionary of image links with Note objects in which they are used.
@@ -73,18 +67,22 @@ def _update_image_links_in_notes(image_links: Dict[str, List[Note]]) -> None:
             note.update_fields_with(lambda field: str.replace(field, link, new_link))
 
 
-def _copy_images_to(anki_media: AnkiMedia, image_links: Iterable[str]) -> None:
+def copy_images_to(
+    anki_media: AnkiMedia, image_links: Iterable[str], base_dir: Optional[str] = None
+) -> None:
     """Copy images to Anki Media folder.
 
     Args:
         anki_media: AnkiMedia object that will be used to copy images
         image_links: list of markdown links to images
+        base_dir: directory against which relative paths to images are resolved
+            (current working directory by default)
     Raises:
         FileNotFoundError: if path to image in markdown link is incorrect
         FileExistsError: if different file with the same name already exists in Anki Media folder
     """
     for link in image_links:
-        abs_path = _get_abs_path_from(link)
+        abs_path = _get_abs_path_from(link, base_dir)
         if not abs_path:
             continue
 
@@ -111,11 +109,15 @@ def _get_path_from(image_link: str) -> Optional[str]:
     return match.group(0)
 
 
-def _get_abs_path_from(image_link: str) -> Optional[str]:
+def _get_abs_path_from(
+    image_link: str, base_dir: Optional[str] = None
+) -> Optional[str]:
     """Get absolute path to image from markdown's image link
 
     Args:
         image_link: markdown image link
+        base_dir: directory against which relative path is resolved
+            (current working directory by default)
     Returns:
         String with the absolute path to image
     """
@@ -123,6 +125,8 @@ def _get_abs_path_from(image_link: str) -> Optional[str]:
     if not path:
         return None
 
+    if base_dir:
+        path = os.path.join(base_dir, path)
     return os.path.realpath(path)
 
 
@@ -3,7 +3,7 @@ from typing import Any, Callable, Dict, Iterable, List, Optional
 from rich.table import Column, Table
 
 from ..config import Config
-from .note import Note
+from .note import Note, NoteSpan
 
 
 class BasicNote(Note):
@@ -16,8 +16,9 @@ class BasicNote(Note):
         tags: Iterable[str],
         deck_name: str,
         anki_id: Optional[int] = None,
+        span: Optional[NoteSpan] = None,
     ):
-        super().__init__(tags, deck_name, anki_id)
+        super().__init__(tags, deck_name, anki_id, span)
         self.raw_front_md = front_md
         self.raw_back_md = back_md
         self.updated_front_md = front_md  # With updated image links
@@ -25,11 +26,6 @@ class BasicNote(Note):
         self.front_html = ""
         self.back_html = ""
 
-    @property
-    def search_query(self) -> str:
-        """Query to search for note in Anki"""
-        return self.create_anki_search_query(self.front_html)
-
     def convert_fields_to_html(self, convert_func: Callable[[str], str]) -> None:
         """Convert note fields from markdown to html using provided function"""
         self.front_html = convert_func(self.updated_front_md)
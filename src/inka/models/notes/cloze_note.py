@@ -3,7 +3,7 @@ from typing import Any, Callable, Dict, Iterable, List, Optional
 from rich.table import Column, Table
 
 from ..config import Config
-from .note import Note
+from .note import Note, NoteSpan
 
 
 class ClozeNote(Note):
@@ -15,17 +15,13 @@ class ClozeNote(Note):
         tags: Iterable[str],
         deck_name: str,
         anki_id: Optional[int] = None,
+        span: Optional[NoteSpan] = None,
     ):
-        super().__init__(tags, deck_name, anki_id)
+        super().__init__(tags, deck_name, anki_id, span)
         self.raw_text_md = text_md
         self.updated_text_md = text_md  # With updated image links and cloze deletions
         self.text_html = ""
 
-    @property
-    def search_query(self) -> str:
-        """Query to search for note in Anki"""
-        return self.create_anki_search_query(self.text_html)
-
     def convert_fields_to_html(self, convert_func: Callable[[str], str]) -> None:
         """Convert note fields from markdown to html using provided function"""
         self.text_html = convert_func(self.updated_text_md)
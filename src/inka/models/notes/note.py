@@ -1,29 +1,42 @@
+import hashlib
+import json
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 from rich.table import Table
 
 from inka.models.config import Config
 
 
+class NoteSpan(NamedTuple):
+    """Position of the note in the text it was parsed from (offsets of characters)"""
+
+    start: int
+    end: int
+    line: int  # number of the first line of the note (starting from 1)
+    id: Tuple[int, int]  # line with ID (empty if note doesn't have it)
+    question: Tuple[int, int]
+    answer: Optional[Tuple[int, int]] = None  # only basic notes have answers
+    anki_id: Optional[int] = None  # ID from the line with ID
+
+
 class Note(ABC):
     """Base class for all other note types"""
 
     def __init__(
-        self, tags: Iterable[str], deck_name: str, anki_id: Optional[int] = None
+        self,
+        tags: Iterable[str],
+        deck_name: str,
+        anki_id: Optional[int] = None,
+        span: Optional[NoteSpan] = None,
     ):
         self.tags = tags
         self.deck_name = deck_name
         self.anki_id = anki_id
+        self.span = span  # None if note wasn't parsed from the file
         self.changed = False  # Card was marked as changed in Anki
         self.to_delete = False  # Card was marked to be deleted in Anki
 
-    @property
-    @abstractmethod
-    def search_query(self) -> str:
-        """Query to search for note in Anki"""
-        pass
-
     @abstractmethod
     def convert_fields_to_html(self, convert_func: Callable[[str], str]) -> None:
         """Convert note fields from markdown to html using provided function"""
@@ -55,17 +68,17 @@ class Note(ABC):
         """Get name of Anki note type"""
         pass
 
-    @staticmethod
-    def create_anki_search_query(text: str) -> str:
-        """Create Anki search query from the supplied text"""
-        special_chars = ["\\", '"', "*", "_", ":"]
-
-        search_query = text
-        for char in special_chars:
-            escaped_char = "\\" + char
-            search_query = search_query.replace(char, escaped_char)
-
-        return '"' + search_query + '"'
+    def get_fingerprint(self, cfg: Config) -> str:
+        """Get hash of everything that is sent to Anki: note type, deck, tags and html fields"""
+        data = [
+            self.get_anki_note_type(cfg),
+            self.deck_name,
+            list(self.tags),
+            self.get_html_fields(cfg),
+        ]
+        return hashlib.sha1(
+            json.dumps(data, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
 
     @abstractmethod
     def __rich__(self) -> Table:
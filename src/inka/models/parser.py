@@ -1,89 +1,212 @@
 import re
-from pathlib import Path
-from typing import List, Optional, Union
-
-from ..mistune_plugins.mathjax import BLOCK_MATH
+from typing import (
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from .document import Document
+from .hasher import Hasher
 from .notes.basic_note import BasicNote
 from .notes.cloze_note import ClozeNote
-from .notes.note import Note
+from .notes.note import Note, NoteSpan
+
+
+class _NoteToken(NamedTuple):
+    """Parts of the note string found in the section (offsets of characters)"""
+
+    start: int
+    end: int
+    line: int  # index of the first line of the note in the section
+    id_end: int  # same as start if note doesn't have line with ID
+    body_start: int  # position after the number and period
+    answer_start: Optional[int]  # first line that starts with '>' (if there is one)
+
+
+class _SectionSplitter:
+    """Splits text that comes in chunks into sections (see Parser).
+    Each chunk (except the last one) must end with newline.
+    """
+
+    def __init__(self, delimiter: str):
+        self._delimiter = delimiter
+        self._offset = 0  # offset of the next chunk in the text
+        self._line = 1  # number of the first line of the next chunk
+        # Parts, offset and number of the first line of the unclosed section
+        self._parts: List[str] = []
+        self._opened: Optional[Tuple[int, int]] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, int, int]]:
+        """Add the next chunk of the text.
+
+        Returns:
+            Text, offset and number of the first line of the sections that were closed in the chunk
+        """
+        delimiter = self._delimiter
+        sections = []
+        section_start = 0  # start of the unclosed section in this chunk
+        counted = 0  # position in the chunk up to which lines were counted
+        position = chunk.find(delimiter)
+        while position != -1:
+            line_end = position + len(delimiter)
+            is_line = (position == 0 or chunk[position - 1] == "\n") and (
+                line_end == len(chunk) or chunk[line_end] == "\n"
+            )
+            if not is_line:
+                position = chunk.find(delimiter, position + 1)
+                continue
+
+            self._line += chunk.count("\n", counted, position)
+            counted = position
+            if self._opened is None:
+                # Section can't start on the last line
+                if line_end < len(chunk):
+                    self._opened = (self._offset + line_end + 1, self._line + 1)
+                    section_start = line_end + 1
+            elif self._offset + position > self._opened[0]:
+                self._parts.append(chunk[section_start:position])
+                sections.append(("".join(self._parts), *self._opened))
+                self._parts, self._opened = [], None
+
+            position = chunk.find(delimiter, line_end)
+
+        if self._opened is not None:
+            self._parts.append(chunk[section_start:])
+        self._line += chunk.count("\n", counted)
+        self._offset += len(chunk)
+        return sections
 
 
 class Parser:
-    """Class for getting notes and various information about them from the text file"""
+    """Class for getting notes and various information about them from the text file.
+
+    Text is split into sections and notes in one pass over its lines:
+    - section starts with the line '---' and ends with the next line '---'
+      (the first line of the section is never its end);
+    - note starts with the line that begins with a number and period, optionally preceded
+      by the line with ID. It ends before the next such line, the line '---',
+      the ID comment or the end of the section;
+    - note is basic if it has lines that start with '>' (answer), otherwise it's cloze
+      if it has curly braces.
+    """
 
-    _section_regex = re.compile(
-        r"^---\n" r"(.+?)" r"^---$",  # start of section  # contents  # end of section
-        re.MULTILINE | re.DOTALL,
-    )
     _deck_name_regex = re.compile(r"(?<=^Deck:)(.*?)$", re.MULTILINE)
     _tags_regex = re.compile(r"(?<=^Tags:)(.*?)$", re.MULTILINE)
-    _all_notes_regex = re.compile(
-        r"(?:^<!--ID:\S+-->\n)?"  # optional ID
-        r"^\d+\.[\s\S]*?"  # card contents (optionally contains answer)
-        r"(?=<!--ID:\S+-->|^\d+\.|\Z|^---$)",  # card ends before ID, start of next card, end of string, end of section
-        re.MULTILINE,
-    )
-    _basic_note_regex = re.compile(
-        r"(?:^<!--ID:\S+-->\n)?"
-        r"^\d+\.[\s\S]+?"
-        r"(?:^>.*?(?:\n|$))+",  # optional ID  # card question  # card answer
-        re.MULTILINE,
-    )
-    _cloze_note_regex = re.compile(
-        r"(?:^<!--ID:\S+-->\n)?"  # optional ID
-        r"^\d+\.[\s\S]*?{[\s\S]*?}[\s\S]*?"  # contents that must have '{' and '}' symbols
-        r"(?=<!--ID:\S+-->|^\d+\.|\Z|^---$)",  # card ends before ID, start of next card, end of string, end of section
-        re.MULTILINE,
-    )
-    _id_regex = re.compile(r"^<!--ID:(\S+)-->$", re.MULTILINE)
-    _question_regex = re.compile(
-        r"^\d+\."
-        r"([\s\S]+?)"
-        r"(?=^>|\Z)",  # question start  # contents  # answer start or end of string
-        re.MULTILINE,
-    )
-    _answer_regex = re.compile(r"(?:^>.*?(?:\n|$))+", re.MULTILINE)
+    _id_comment_regex = re.compile(r"<!--ID:\S+-->")
+    _id_comment_start = "<!--ID:"
+    _section_delimiter = "---"
+    _code_block_delimiter = "```"
+    _math_block_delimiter = "$$"
 
     def __init__(
         self,
-        file_path: Union[str, Path],
+        document: Document,
         default_deck: str,
     ):
-        self._file_path = file_path
+        self._document = document
         self._default_deck = default_deck
 
     def collect_notes(self) -> List[Note]:
-        """Get all notes from the file which path was passed to the Parser"""
-        with open(self._file_path, mode="rt", encoding="utf-8") as f:
-            file_string = f.read()
-
-        question_sections = self._get_sections(file_string)
-
-        notes = []
-        for section in question_sections:
-            notes.extend(self._get_notes_from_section(section))
+        """Get all notes from the document that was passed to the Parser.
+        Each note has its position in the text of the document.
+        """
+        return list(self.iter_notes())
+
+    def iter_notes(self, skipped_sections: Container[str] = ()) -> Iterator[Note]:
+        """Iterate over notes from the document section by section.
+        Text of the document is read in chunks, so only the current section is kept in memory.
+
+        Args:
+            skipped_sections: hashes of the sections which notes shouldn't be parsed
+        Returns:
+            Iterator over the notes from the sections that weren't skipped
+        """
+        for section, offset, line in self._iter_sections(self._document.iter_text()):
+            if skipped_sections and self.get_section_hash(section) in skipped_sections:
+                continue
+            yield from self._get_notes_from_section(section, offset, line)
+
+    def get_note_ids_of_sections(self) -> Dict[str, List[Optional[int]]]:
+        """Get IDs of the notes from each section of the document (None if note doesn't have ID).
+        Sections are identified by their hashes.
+        """
+        return {
+            self.get_section_hash(section): self._get_note_ids(section)
+            for section, _, _ in self._iter_sections(self._document.iter_text())
+        }
 
-        return notes
-
-    def _get_notes_from_section(self, section: str) -> List[Note]:
-        """Get all Notes from the section string"""
+    @classmethod
+    def collect_note_ids_of_sections(
+        cls, chunks: Iterable[str], note_ids: Dict[str, List[Optional[int]]]
+    ) -> Iterator[str]:
+        """Pass chunks of the text through, adding IDs of the notes from each section of the text
+        to note_ids (as get_note_ids_of_sections does). Text can be split into chunks anywhere.
+        IDs of all notes are added only after all chunks were passed.
+        """
+        splitter = _SectionSplitter(cls._section_delimiter)
+        line: List[str] = []  # chunks of the line that didn't end yet
+        for chunk in chunks:
+            yield chunk
+            line.append(chunk)
+            if not chunk.endswith("\n"):
+                continue
+
+            for section, _, _ in splitter.feed("".join(line)):
+                note_ids[cls.get_section_hash(section)] = cls._get_note_ids(section)
+            line.clear()
+
+        for section, _, _ in splitter.feed("".join(line)):
+            note_ids[cls.get_section_hash(section)] = cls._get_note_ids(section)
+
+    @staticmethod
+    def get_section_hash(section: str) -> str:
+        """Calculate hash of the section text"""
+        return Hasher.calculate_hash_of_data(section.encode("utf-8"))
+
+    def _get_notes_from_section(
+        self, section: str, offset: int = 0, line: int = 1
+    ) -> List[Note]:
+        """Get all Notes from the section string.
+
+        Args:
+            section: text of the section
+            offset: offset of the section in the text of the document
+            line: number of the first line of the section in the document
+        Returns:
+            Notes with their positions in the text of the document
+        """
         tags = self._get_tags(section)
         deck_name = self._get_deck_name(section)
 
-        note_strings = self.get_note_strings(section)
-
         # Create note objects
         notes: List[Note] = []
-        for string in note_strings:
-            anki_id = self.get_id(string)
-
-            # we check in this order because is_cloze_note_str can match front/back note if it contains curly braces
-            if self._is_basic_note_str(string):
-                question = self.get_question(string)
-                answer = self._get_cleaned_answer(string)
+        for token in self._tokenize(section):
+            anki_id = self.get_id(section[token.start : token.id_end])
+
+            question_end = token.end
+            if token.answer_start is not None:
+                question_end = token.answer_start
+            question_span = self._strip_span(section, token.body_start, question_end)
+            question = section[question_span[0] : question_span[1]]
+
+            if token.answer_start is not None:
+                answer_end = self._find_answer_end(
+                    section, token.answer_start, token.end
+                )
+                raw_answer = section[token.answer_start : answer_end]
+                answer = self._clean_answer(raw_answer)
                 if not question or not answer:
                     continue
 
+                answer_span = (
+                    offset + token.answer_start,
+                    offset + token.answer_start + len(raw_answer.rstrip()),
+                )
                 notes.append(
                     BasicNote(
                         front_md=question,
@@ -91,20 +214,46 @@ class Parser:
                         tags=tags,
                         deck_name=deck_name,
                         anki_id=anki_id,
+                        span=self._get_span(
+                            token, offset, line, question_span, answer_span
+                        )._replace(anki_id=anki_id),
                     )
                 )
-            elif self._is_cloze_note_str(string):
-                text = self.get_question(string)
-                if not text:
+            elif self._has_cloze(section, token.body_start, token.end):
+                if not question:
                     continue
 
                 notes.append(
                     ClozeNote(
-                        text_md=text, tags=tags, deck_name=deck_name, anki_id=anki_id
+                        text_md=question,
+                        tags=tags,
+                        deck_name=deck_name,
+                        anki_id=anki_id,
+                        span=self._get_span(
+                            token, offset, line, question_span
+                        )._replace(anki_id=anki_id),
                     )
                 )
         return notes
 
+    @staticmethod
+    def _get_span(
+        token: _NoteToken,
+        offset: int,
+        line: int,
+        question_span: Tuple[int, int],
+        answer_span: Optional[Tuple[int, int]] = None,
+    ) -> NoteSpan:
+        """Get position of the note in the text of the document"""
+        return NoteSpan(
+            start=offset + token.start,
+            end=offset + token.end,
+            line=line + token.line,
+            id=(offset + token.start, offset + token.id_end),
+            question=(offset + question_span[0], offset + question_span[1]),
+            answer=answer_span,
+        )
+
     def _get_deck_name(self, section: str) -> str:
         """Get deck name specified for this section"""
         matches = re.findall(Parser._deck_name_regex, section)
@@ -128,17 +277,18 @@ class Parser:
     @classmethod
     def get_note_strings(cls, section: str) -> List[str]:
         """Get all strings of notes from section"""
-        return re.findall(cls._all_notes_regex, section)
+        return [section[token.start : token.end] for token in cls._tokenize(section)]
 
     @classmethod
     def get_id(cls, text: str) -> Optional[int]:
         """Get note's ID from text. Returns None if id wasn't found or if it is incorrect."""
-        id_match = re.search(cls._id_regex, text)
-        if id_match:
-            try:
-                return int(id_match.group(1))
-            except ValueError:
-                return None
+        for start, end in cls._iter_lines(text):
+            line = text[start:end]
+            if cls._is_id_line(line):
+                try:
+                    return int(line[len(cls._id_comment_start) : -3])
+                except ValueError:
+                    return None
 
         return None
 
@@ -146,24 +296,29 @@ class Parser:
     def get_question(cls, text: str) -> Optional[str]:
         """Get clean question string from text
         (without digit followed by period and trailing whitespace)"""
-        question_match = re.search(cls._question_regex, text)
-        if question_match:
-            return question_match.group(1).strip()
+        body_start = cls._find_first_number(text)
+        if body_start == -1 or body_start == len(text):
+            return None
 
-        return None
+        question_end = cls._find_answer_start(text, body_start)
+        if question_end == -1:
+            question_end = len(text)
+
+        return text[body_start:question_end].strip()
 
     @classmethod
     def get_answer(cls, text: str) -> Optional[str]:
         """Get answer string from text"""
-        answer_match = re.search(cls._answer_regex, text)
-        if answer_match:
-            return answer_match.group()
-        return None
+        answer_start = 0 if text.startswith(">") else cls._find_answer_start(text, 0)
+        if answer_start == -1:
+            return None
+
+        return text[answer_start : cls._find_answer_end(text, answer_start, len(text))]
 
     @classmethod
     def _get_sections(cls, file_contents: str) -> List[str]:
         """Get all sections (groups of notes) from the file string"""
-        return re.findall(cls._section_regex, file_contents)
+        return [section for section, _, _ in cls._iter_sections([file_contents])]
 
     @classmethod
     def _get_tags(cls, section: str) -> List[str]:
@@ -181,32 +336,31 @@ class Parser:
     @classmethod
     def _is_basic_note_str(cls, string: str) -> bool:
         """Check if note string contains basic note type"""
-        match = re.search(cls._basic_note_regex, string)
-        if not match:
+        body_start = cls._find_first_number(string)
+        if body_start == -1:
             return False
-        return True
+        return cls._find_answer_start(string, body_start) != -1
 
     @classmethod
     def _is_cloze_note_str(cls, string: str) -> bool:
         """Check if note string contains cloze note type. Matches basic note type if it contains curly braces"""
-        match = re.search(cls._cloze_note_regex, string)
-        if not match:
+        body_start = cls._find_first_number(string)
+        if body_start == -1:
             return False
-        return True
-
-    @classmethod
-    def _get_cloze_note_strings(cls, section: str) -> List[str]:
-        """Get all strings from section with only question and an (optional) ID"""
-        return re.findall(cls._cloze_note_regex, section)
+        return cls._has_cloze(string, body_start, len(string))
 
     @classmethod
     def _get_cleaned_answer(cls, text: str) -> Optional[str]:
         """Get clean answer string from text (without '>' and trailing whitespace)"""
-        # Remove '>' and first whitespace char after it (if there is any)
         answer = cls.get_answer(text)
         if not answer:
             return None
 
+        return cls._clean_answer(answer)
+
+    @classmethod
+    def _clean_answer(cls, answer: str) -> str:
+        """Remove '>' and whitespace after it from the lines of the answer"""
         lines = answer.splitlines()
         cleaned_lines = []
         # Remove '>' and whitespace after it
@@ -218,13 +372,221 @@ class Parser:
 
         cleaned_answer = "\n\n".join(cleaned_lines)
 
-        def replace_newlines(s: re.Match) -> str:
-            return re.sub("\n\n", "\n", s.group(0))
-
         # change newlines in code blocks
-        cleaned_answer = re.sub(r"```[\s\S]*?```", replace_newlines, cleaned_answer)
+        cleaned_answer = cls._replace_newlines_in_blocks(
+            cleaned_answer, cls._code_block_delimiter, escapable=False
+        )
 
         # change newlines in math blocks
-        cleaned_answer = re.sub(BLOCK_MATH, replace_newlines, cleaned_answer)
+        cleaned_answer = cls._replace_newlines_in_blocks(
+            cleaned_answer, cls._math_block_delimiter, escapable=True
+        )
 
         return cleaned_answer
+
+    @classmethod
+    def _iter_sections(cls, chunks: Iterable[str]) -> Iterator[Tuple[str, int, int]]:
+        """Iterate over sections in text that is split into chunks.
+        Each chunk (except the last one) must end with newline.
+
+        Args:
+            chunks: chunks of the text
+        Returns:
+            Iterator over text of the section, its offset and number of its first line in the text
+        """
+        splitter = _SectionSplitter(cls._section_delimiter)
+        for chunk in chunks:
+            yield from splitter.feed(chunk)
+
+    @classmethod
+    def _get_note_ids(cls, section: str) -> List[Optional[int]]:
+        """Get IDs of the notes from the section (None if note doesn't have ID)"""
+        return [
+            cls.get_id(section[token.start : token.id_end])
+            for token in cls._tokenize(section)
+        ]
+
+    @classmethod
+    def _tokenize(cls, section: str) -> List[_NoteToken]:
+        """Find all notes in the section in one pass over its lines"""
+        lines = list(cls._iter_lines(section))
+        tokens = []
+        index = 0
+        while index < len(lines):
+            start, end = lines[index]
+            note_line = index
+
+            # Note starts with the line with number, which can be preceded by the line with ID
+            first = index
+            if cls._is_id_line(section[start:end]) and index + 1 < len(lines):
+                first = index + 1
+            body_start = cls._get_number_end(section, lines[first][0])
+            if body_start == -1:
+                index += 1
+                continue
+
+            # Note can end with the ID comment even on its first line
+            note_end = cls._find_id_comment(section, body_start, lines[first][1])
+            answer_start = None
+            index = first + 1
+            while note_end == -1 and index < len(lines):
+                line_start, line_end = lines[index]
+                if cls._is_note_end_line(section, line_start, line_end):
+                    note_end = line_start
+                    break
+
+                comment_start = cls._find_id_comment(section, line_start, line_end)
+                if answer_start is None and comment_start != line_start:
+                    if section.startswith(">", line_start):
+                        answer_start = line_start
+
+                if comment_start != -1:
+                    note_end = comment_start
+                    # Rest of the line can't contain the start of the next note
+                    if comment_start != line_start:
+                        index += 1
+                    break
+
+                index += 1
+
+            if note_end == -1:
+                note_end = len(section)
+
+            tokens.append(
+                _NoteToken(
+                    start=start,
+                    end=note_end,
+                    line=note_line,
+                    id_end=lines[first][0] if first != note_line else start,
+                    body_start=body_start,
+                    answer_start=answer_start,
+                )
+            )
+
+        return tokens
+
+    @classmethod
+    def _is_note_end_line(cls, text: str, start: int, end: int) -> bool:
+        """Check if the line ends the note (i.e. it starts the next note or ends the section)"""
+        return (
+            text[start:end] == cls._section_delimiter
+            or cls._get_number_end(text, start) != -1
+        )
+
+    @classmethod
+    def _is_id_line(cls, line: str) -> bool:
+        """Check if the line consists only of the ID comment"""
+        return (
+            len(line) > len(cls._id_comment_start) + 3
+            and line.startswith(cls._id_comment_start)
+            and line.endswith("-->")
+            and line.split() == [line]
+        )
+
+    @classmethod
+    def _find_id_comment(cls, text: str, start: int, end: int) -> int:
+        """Find position of the first ID comment between start and end. Returns -1 if there isn't one"""
+        position = text.find(cls._id_comment_start, start, end)
+        while position != -1:
+            if cls._id_comment_regex.match(text, position, end):
+                return position
+            position = text.find(cls._id_comment_start, position + 1, end)
+
+        return -1
+
+    @staticmethod
+    def _get_number_end(text: str, start: int) -> int:
+        """Get position after the number and period at the start of the line. Returns -1 if line doesn't start with them"""
+        position = start
+        while position < len(text) and text[position].isdecimal():
+            position += 1
+
+        if position == start or not text.startswith(".", position):
+            return -1
+        return position + 1
+
+    @classmethod
+    def _find_first_number(cls, text: str) -> int:
+        """Get position after the number and period of the first line that starts with them"""
+        for start, _ in cls._iter_lines(text):
+            number_end = cls._get_number_end(text, start)
+            if number_end != -1:
+                return number_end
+
+        return -1
+
+    @staticmethod
+    def _find_answer_start(text: str, position: int) -> int:
+        """Find start of the first line after position that starts with '>'. Returns -1 if there isn't one"""
+        newline = text.find("\n>", position)
+        return newline + 1 if newline != -1 else -1
+
+    @staticmethod
+    def _find_answer_end(text: str, start: int, end: int) -> int:
+        """Find end of the consecutive lines that start with '>' (including the last newline)"""
+        position = start
+        while position < end and text[position] == ">":
+            newline = text.find("\n", position, end)
+            if newline == -1:
+                return end
+            position = newline + 1
+
+        return position
+
+    @staticmethod
+    def _has_cloze(text: str, start: int, end: int) -> bool:
+        """Check if there are curly braces ('{' and then '}') between start and end"""
+        opening = text.find("{", start, end)
+        return opening != -1 and text.find("}", opening + 1, end) != -1
+
+    @staticmethod
+    def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+        """Get start and end of the text between start and end without surrounding whitespace"""
+        string = text[start:end]
+        stripped = string.strip()
+        if not stripped:
+            return start, start
+
+        start += len(string) - len(string.lstrip())
+        return start, start + len(stripped)
+
+    @staticmethod
+    def _iter_lines(text: str) -> Iterator[Tuple[int, int]]:
+        """Iterate over start and end of each line (without newline)"""
+        start = 0
+        while start <= len(text):
+            end = text.find("\n", start)
+            if end == -1:
+                end = len(text)
+            yield start, end
+            start = end + 1
+
+    @staticmethod
+    def _replace_newlines_in_blocks(text: str, delimiter: str, escapable: bool) -> str:
+        """Replace double newlines with single ones in blocks enclosed by delimiter (e.g. code blocks).
+        If delimiter is escapable, delimiters preceded by backslash are skipped.
+        """
+
+        def find_delimiter(position: int) -> int:
+            position = text.find(delimiter, position)
+            while escapable and position > 0 and text[position - 1] == "\\":
+                position = text.find(delimiter, position + 1)
+            return position
+
+        parts = []
+        position = 0
+        while True:
+            block_start = find_delimiter(position)
+            if block_start == -1:
+                break
+            block_end = find_delimiter(block_start + len(delimiter))
+            if block_end == -1:
+                break
+            block_end += len(delimiter)
+
+            parts.append(text[position:block_start])
+            parts.append(text[block_start:block_end].replace("\n\n", "\n"))
+            position = block_end
+
+        parts.append(text[position:])
+        return "".join(parts)
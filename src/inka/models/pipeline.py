@@ -0,0 +1,80 @@
+import queue
+import threading
+from typing import Any, Generic, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Marks the end of the items in the queue
+_END = object()
+
+
+class Stage(Generic[T]):
+    """Stage of the pipeline that produces items in the background thread.
+
+    Items are passed to the consumer through the bounded queue, so the stage works on
+    the next items while the consumer handles the previous ones, but never gets more
+    than max_size items ahead of it. Stages are chained by passing one stage as the
+    items of another. Exception raised while producing items is re-raised by the consumer
+    after all items produced before it.
+    """
+
+    def __init__(self, items: Iterable[T], max_size: int = 1, name: str = "stage"):
+        self._items = items
+        self._queue: "queue.Queue[Tuple[Any, Optional[Exception]]]" = queue.Queue(
+            max_size
+        )
+        self._stopped = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._produce, name=name, daemon=True)
+        self._thread.start()
+
+    def _produce(self) -> None:
+        try:
+            for item in self._items:
+                if self._stopped.is_set():
+                    return
+                self._queue.put((item, None))
+        except Exception as e:
+            self._queue.put((_END, e))
+        else:
+            self._queue.put((_END, None))
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        if self._finished:
+            raise StopIteration
+
+        item, error = self._queue.get()
+        if item is _END:
+            self._finished = True
+            self._thread.join()
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        """Stop producing items and wait for the background thread to finish"""
+        self._stopped.set()
+        self._finished = True
+        while self._thread.is_alive():
+            # Thread can be blocked on the full queue
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._thread.join(0.1)
+
+        # Generator must release its resources
+        close = getattr(self._items, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self) -> "Stage[T]":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self._thread.name!r})"
@@ -0,0 +1,141 @@
+import itertools
+import sqlite3
+from typing import Container, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import converter, img_handler
+from .document import Document
+from .hasher import FileScan, FileSignature
+from .notes.cloze_note import ClozeNote
+from .notes.note import Note
+from .parser import Parser
+from .render_cache import RenderCache
+from .writer import Writer
+
+# Render cache of the worker process (see init_worker)
+_render_cache: Optional[RenderCache] = None
+
+
+class PreparedNotes(NamedTuple):
+    """Notes converted to the Anki format"""
+
+    notes: List[Note]
+    image_links: List[str]  # links to images used in the notes (before conversion)
+    edits: Dict[
+        Tuple[int, int], str
+    ]  # edits of the file with converted notes (see Writer)
+
+
+class PreparedFile(NamedTuple):
+    """Notes from the file that were prepared in a worker process.
+    Positions of the notes refer to the file with the signature.
+    """
+
+    signature: Optional[FileSignature]  # signature of the file that was parsed
+    chunks: List[PreparedNotes]
+
+
+class PreparedChunk(NamedTuple):
+    """Chunk of the notes from the file that was prepared ahead of the sync.
+    Every file has at least one chunk, even if there are no notes in it.
+    All chunks of the file share the document from which notes were parsed.
+    """
+
+    scan: FileScan
+    document: Optional[Document]  # None if the file couldn't be read
+    prepared: PreparedNotes  # empty if there was an error
+    error: Optional[Exception] = None  # error that stopped preparation of the file
+
+
+def prepare_notes(
+    notes: List[Note], document: Document, render_cache: Optional[RenderCache] = None
+) -> PreparedNotes:
+    """Convert cloze deletions, image links and markdown of the notes to the Anki format.
+    Images aren't copied to Anki Media folder, their links are returned with the notes.
+
+    Args:
+        notes: notes parsed from the document
+        document: document from which notes were parsed
+        render_cache: cache of the html
+    Returns:
+        Notes with links to their images and edits that write converted cloze deletions
+        to the document
+    """
+    converter.convert_cloze_deletions_to_anki_format(
+        note for note in notes if isinstance(note, ClozeNote)
+    )
+    writer = Writer(document)
+    writer.update_cloze_notes(notes)
+
+    image_links = img_handler.update_image_links_in(notes)
+    converter.convert_notes_to_html(notes, render_cache)
+    return PreparedNotes(notes, image_links, writer.edits)
+
+
+def iter_prepared_notes(
+    document: Document,
+    default_deck: str,
+    skipped_sections: Container[str] = (),
+    chunk_size: int = 1000,
+    render_cache: Optional[RenderCache] = None,
+) -> Iterator[PreparedNotes]:
+    """Parse notes from the document and prepare them in chunks of at most chunk_size notes.
+    Notes from the sections with hashes from skipped_sections aren't parsed.
+    """
+    notes = Parser(document, default_deck).iter_notes(skipped_sections)
+    while chunk := list(itertools.islice(notes, chunk_size)):
+        yield prepare_notes(chunk, document, render_cache)
+
+
+def init_worker(render_cache_path: Optional[str], renderer_version: str) -> None:
+    """Initialize the worker process of the pool in which files are prepared"""
+    global _render_cache
+    if render_cache_path is None:
+        return
+
+    try:
+        _render_cache = RenderCache(render_cache_path, renderer_version)
+    except sqlite3.Error:
+        # Notes are rendered without the cache if it can't be opened
+        _render_cache = None
+
+
+def prepare_file(
+    path: str,
+    default_deck: str,
+    skipped_sections: Container[str] = (),
+    chunk_size: int = 1000,
+) -> PreparedFile:
+    """Prepare all notes from the file. Is called in the worker process of the pool.
+
+    Args:
+        path: path to the file
+        default_deck: name of the deck for notes without deck
+        skipped_sections: hashes of the sections that shouldn't be parsed
+        chunk_size: maximum number of notes in one chunk
+    Returns:
+        Prepared notes with signature of the file that was parsed
+    Raises:
+        OSError: if the file can't be read
+        UnicodeDecodeError: if the file isn't encoded in UTF-8
+    """
+    global _render_cache
+    with Document.read(path) as document:
+        try:
+            chunks = list(
+                iter_prepared_notes(
+                    document, default_deck, skipped_sections, chunk_size, _render_cache
+                )
+            )
+            if _render_cache is not None:
+                _render_cache.commit()
+        except sqlite3.Error:
+            # Cache is shared by the workers and can stay locked by another one for too long.
+            # Failing cache is dropped and notes of the file are prepared again without it
+            _render_cache = None
+            chunks = list(
+                iter_prepared_notes(
+                    document, default_deck, skipped_sections, chunk_size
+                )
+            )
+
+    return PreparedFile(document.signature, chunks)
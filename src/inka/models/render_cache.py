@@ -0,0 +1,126 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, Set, Tuple, Union
+
+
+class RenderCache:
+    """Class for working with the database that stores html rendered from the Markdown.
+
+    Entries are addressed by the hash of the Markdown and the version of the renderer,
+    so they never have to be invalidated: when the renderer changes, old entries just
+    aren't used anymore. Least recently used entries are removed when the database is
+    closed, if the total size of entries exceeds max_size.
+
+    New entries are kept in memory until they are committed, so the database is locked
+    only for a short time and can be shared by several processes.
+    """
+
+    _commit_interval = 500
+    # Seconds to wait for the lock of the database held by another process
+    _busy_timeout = 30.0
+
+    def __init__(
+        self, path: Union[str, Path], version: str, max_size: int = 64 * 1024 * 1024
+    ):
+        self._path = path
+        self._version = version
+        self._max_size = max_size
+        # Cache can be used by the thread that didn't create it (but not by several at once)
+        self._connection = sqlite3.connect(
+            path, timeout=self._busy_timeout, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        # Rendered html and size of the entries that weren't committed yet
+        self._new_entries: Dict[str, Tuple[str, int]] = {}
+        # Keys of the entries that were used during this run
+        self._used_keys: Set[str] = set()
+
+    def _create_tables(self) -> None:
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS renders ("
+                "key TEXT PRIMARY KEY, "
+                "html TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "used_at REAL NOT NULL)"
+            )
+
+    def render(self, text: str, render_func: Callable[[str], str]) -> str:
+        """Get html of the text from the cache. If it's not there, render it and save the result.
+
+        Args:
+            text: Markdown text
+            render_func: function that converts Markdown to html
+        Returns:
+            html string
+        """
+        key = self._get_key(text)
+        if key in self._new_entries:
+            return self._new_entries[key][0]
+
+        row = self._connection.execute(
+            "SELECT html FROM renders WHERE key = ?", (key,)
+        ).fetchone()
+        if row:
+            self._used_keys.add(key)
+            return row[0]
+
+        html = render_func(text)
+        self._new_entries[key] = (html, len(text) + len(html))
+        if len(self._new_entries) >= self._commit_interval:
+            self.commit()
+        return html
+
+    def commit(self) -> None:
+        """Save new entries and usage time of the used entries to the database"""
+        used_at = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO renders (key, html, size, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (key, html, size, used_at)
+                    for key, (html, size) in self._new_entries.items()
+                ),
+            )
+            self._connection.executemany(
+                "UPDATE renders SET used_at = ? WHERE key = ?",
+                ((used_at, key) for key in self._used_keys),
+            )
+        self._new_entries.clear()
+        self._used_keys.clear()
+
+    def close(self) -> None:
+        """Save all changes, remove least recently used entries and close the database"""
+        self.commit()
+        with self._connection:
+            self._evict()
+        self._connection.close()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries that don't fit into the maximum size"""
+        self._connection.execute(
+            "DELETE FROM renders WHERE key IN ("
+            "SELECT key FROM ("
+            "SELECT key, SUM(size) OVER (ORDER BY used_at DESC, key) AS total "
+            "FROM renders) "
+            "WHERE total > ?)",
+            (self._max_size,),
+        )
+
+    def _get_key(self, text: str) -> str:
+        data = f"{self._version}\0{text}".encode("utf-8")
+        return hashlib.sha1(data).hexdigest()
+
+    def __enter__(self) -> "RenderCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self._path!r}, version={self._version!r})"
@@ -0,0 +1,410 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class FileState(NamedTuple):
+    """State of the file after the last sync"""
+
+    path: str
+    hash: str
+    signature: Optional[Tuple[int, int, int]]  # (size, mtime_ns, inode)
+    note_ids: List[int]
+    synced_at: float
+
+
+class GitSync(NamedTuple):
+    """Commit of the git repository at which files were synced"""
+
+    commit_hash: str
+    # Files that were modified or untracked during the sync: their changes weren't in the commit
+    uncommitted_files: List[str]
+
+
+def _synchronized(method: F) -> F:
+    """Run the method of SyncState while holding its lock"""
+
+    @functools.wraps(method)
+    def wrapper(self: "SyncState", *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return cast(F, wrapper)
+
+
+class SyncState:
+    """Class for working with the database that stores the state of the last sync.
+
+    Changes are committed in batches, so the database has to be closed (or committed)
+    for the last changes to be saved.
+
+    State can be used by several threads at once (e.g. files are scanned in the background
+    while the notes from the previous files are synced): queries are made one at a time.
+    """
+
+    _commit_interval = 500
+    # Maximum number of parameters in the query (SQLite limit in older versions)
+    _max_parameters = 999
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        self._uncommitted_changes = 0
+
+    def _create_tables(self) -> None:
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, "
+                "hash TEXT NOT NULL, "
+                "size INTEGER, "
+                "mtime_ns INTEGER, "
+                "inode INTEGER, "
+                "note_ids TEXT NOT NULL DEFAULT '[]', "
+                "synced_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sections ("
+                "path TEXT NOT NULL, "
+                "hash TEXT NOT NULL, "
+                "note_ids TEXT NOT NULL, "
+                "PRIMARY KEY (path, hash))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS note_fingerprints ("
+                "note_id INTEGER PRIMARY KEY, "
+                "fingerprint TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS note_tags ("
+                "note_id INTEGER PRIMARY KEY, "
+                "tags TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS directories ("
+                "path TEXT PRIMARY KEY, "
+                "mtime_ns INTEGER NOT NULL, "
+                "entries TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS git_syncs ("
+                "root TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "recursive INTEGER NOT NULL, "
+                "commit_hash TEXT NOT NULL, "
+                "uncommitted_files TEXT NOT NULL DEFAULT '[]', "
+                "synced_at REAL NOT NULL, "
+                "PRIMARY KEY (root, path, recursive))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS configs ("
+                "name TEXT PRIMARY KEY, "
+                "fingerprint TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+
+    @_synchronized
+    def get_file(self, path: str) -> Optional[FileState]:
+        """Get state of the file. Returns None if the file was never synced"""
+        row = self._connection.execute(
+            "SELECT path, hash, size, mtime_ns, inode, note_ids, synced_at "
+            "FROM files WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        signature = None
+        if row[2] is not None:
+            signature = (row[2], row[3], row[4])
+
+        return FileState(row[0], row[1], signature, json.loads(row[5]), row[6])
+
+    @_synchronized
+    def update_file(
+        self,
+        path: str,
+        file_hash: str,
+        signature: Optional[Tuple[int, int, int]],
+        note_ids: Optional[Iterable[int]] = None,
+    ) -> None:
+        """Update hash and signature of the file. Note IDs are kept if they're not passed"""
+        size, mtime_ns, inode = signature if signature else (None, None, None)
+        self._connection.execute(
+            "INSERT INTO files (path, hash, size, mtime_ns, inode, synced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET hash = excluded.hash, "
+            "size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "inode = excluded.inode, synced_at = excluded.synced_at",
+            (path, file_hash, size, mtime_ns, inode, time.time()),
+        )
+        if note_ids is not None:
+            self._set_note_ids(path, note_ids)
+        self._changed()
+
+    @_synchronized
+    def update_note_ids(self, path: str, note_ids: Iterable[int]) -> None:
+        """Update IDs of the notes from the file. Does nothing if the file was never synced"""
+        self._set_note_ids(path, note_ids)
+        self._changed()
+
+    @_synchronized
+    def get_note_ids(self, path: str) -> List[int]:
+        """Get IDs of the notes from the file that were synced last time"""
+        file_state = self.get_file(path)
+        return file_state.note_ids if file_state else []
+
+    @_synchronized
+    def remove_files(self) -> None:
+        """Remove information about all files (and their sections, notes, directories and synced commits)"""
+        self._connection.execute("DELETE FROM files")
+        self._connection.execute("DELETE FROM sections")
+        self._connection.execute("DELETE FROM note_fingerprints")
+        self._connection.execute("DELETE FROM directories")
+        self._connection.execute("DELETE FROM git_syncs")
+        self._changed()
+
+    @_synchronized
+    def get_sections(self, path: str) -> Dict[str, List[int]]:
+        """Get hashes of the sections from the file that were synced last time with IDs of their notes"""
+        rows = self._connection.execute(
+            "SELECT hash, note_ids FROM sections WHERE path = ?", (path,)
+        )
+        return {section_hash: json.loads(note_ids) for section_hash, note_ids in rows}
+
+    @_synchronized
+    def update_sections(self, path: str, sections: Dict[str, List[int]]) -> None:
+        """Replace synced sections of the file"""
+        self._connection.execute("DELETE FROM sections WHERE path = ?", (path,))
+        self._connection.executemany(
+            "INSERT INTO sections (path, hash, note_ids) VALUES (?, ?, ?)",
+            (
+                (path, section_hash, json.dumps(note_ids))
+                for section_hash, note_ids in sections.items()
+            ),
+        )
+        self._changed()
+
+    @_synchronized
+    def get_note_fingerprints(self, note_ids: Iterable[int]) -> Dict[int, str]:
+        """Get fingerprints of the notes that were sent to Anki. Notes without fingerprints are skipped"""
+        fingerprints: Dict[int, str] = {}
+        for batch in self._batched(list(note_ids)):
+            rows = self._connection.execute(
+                "SELECT note_id, fingerprint FROM note_fingerprints "
+                f"WHERE note_id IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            fingerprints.update(rows)
+        return fingerprints
+
+    @_synchronized
+    def update_note_fingerprints(
+        self,
+        fingerprints: Dict[int, str],
+        tags: Optional[Dict[int, List[str]]] = None,
+    ) -> None:
+        """Save fingerprints of the notes that were sent to Anki together with their tags"""
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO note_fingerprints (note_id, fingerprint) "
+            "VALUES (?, ?)",
+            fingerprints.items(),
+        )
+        if tags:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO note_tags (note_id, tags) VALUES (?, ?)",
+                (
+                    (note_id, json.dumps(note_tags))
+                    for note_id, note_tags in tags.items()
+                ),
+            )
+        self._changed()
+
+    @_synchronized
+    def get_note_tags(self, note_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """Get tags of the notes that were sent to Anki. Notes without saved tags are skipped.
+        Tags aren't removed with the files, because only these tags may be removed from the notes in Anki.
+        """
+        tags: Dict[int, List[str]] = {}
+        for batch in self._batched(list(note_ids)):
+            rows = self._connection.execute(
+                "SELECT note_id, tags FROM note_tags "
+                f"WHERE note_id IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            tags.update((note_id, json.loads(note_tags)) for note_id, note_tags in rows)
+        return tags
+
+    @_synchronized
+    def get_directory_listing(
+        self, path: str, mtime_ns: Optional[int] = None
+    ) -> Optional[List[list]]:
+        """Get saved listing of the directory. Returns None if the directory was modified since it was saved
+        (if mtime_ns is passed) or its listing wasn't saved
+        """
+        row = self._connection.execute(
+            "SELECT mtime_ns, entries FROM directories WHERE path = ?", (path,)
+        ).fetchone()
+        if not row or (mtime_ns is not None and row[0] != mtime_ns):
+            return None
+        return json.loads(row[1])
+
+    @_synchronized
+    def update_directory_listing(
+        self, path: str, mtime_ns: int, entries: Iterable[Iterable]
+    ) -> None:
+        """Save listing of the directory with its modification time"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO directories (path, mtime_ns, entries) "
+            "VALUES (?, ?, ?)",
+            (path, mtime_ns, json.dumps([list(entry) for entry in entries])),
+        )
+        self._changed()
+
+    @_synchronized
+    def remove_directory_listings(self, paths: Iterable[str]) -> None:
+        """Remove saved listings of the directories and all their subdirectories"""
+        for path in paths:
+            prefix = os.path.join(path, "")
+            self._connection.execute(
+                "DELETE FROM directories "
+                "WHERE path = ? OR substr(path, 1, length(?)) = ?",
+                (path, prefix, prefix),
+            )
+        self._changed()
+
+    @_synchronized
+    def get_git_sync(
+        self, repository_root: str, path: str, recursive: bool = False
+    ) -> Optional[GitSync]:
+        """Get commit of the git repository at which all files from the path were synced last time.
+        Files from the path are also synced by the recursive sync of the directory that contains it.
+
+        Args:
+            repository_root: path to the root of the repository
+            path: path to the file or directory inside the repository
+            recursive: files from subdirectories of the path must be synced too
+        Returns:
+            Commit with the files that weren't committed during the sync
+            or None if files from the path weren't synced with git
+        """
+        rows = self._connection.execute(
+            "SELECT path, recursive, commit_hash, uncommitted_files FROM git_syncs "
+            "WHERE root = ? ORDER BY synced_at DESC",
+            (repository_root,),
+        )
+        for synced_path, synced_recursively, commit_hash, uncommitted_files in rows:
+            if (synced_path == path and (synced_recursively or not recursive)) or (
+                synced_recursively and path.startswith(os.path.join(synced_path, ""))
+            ):
+                return GitSync(commit_hash, json.loads(uncommitted_files))
+
+        return None
+
+    @_synchronized
+    def update_git_sync(
+        self,
+        repository_root: str,
+        path: str,
+        recursive: bool,
+        commit_hash: str,
+        uncommitted_files: Iterable[str] = (),
+    ) -> None:
+        """Update commit of the git repository at which all files from the path were synced
+        and files from the path that weren't committed at that moment
+        """
+        self._connection.execute(
+            "INSERT OR REPLACE INTO git_syncs "
+            "(root, path, recursive, commit_hash, uncommitted_files, synced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                repository_root,
+                path,
+                recursive,
+                commit_hash,
+                json.dumps(list(uncommitted_files)),
+                time.time(),
+            ),
+        )
+        self._changed()
+
+    @_synchronized
+    def get_config_fingerprint(self, name: str) -> Optional[str]:
+        """Get fingerprint of the config that was used during the last sync"""
+        row = self._connection.execute(
+            "SELECT fingerprint FROM configs WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @_synchronized
+    def update_config_fingerprint(self, name: str, fingerprint: str) -> None:
+        """Update fingerprint of the config"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO configs (name, fingerprint, updated_at) "
+            "VALUES (?, ?, ?)",
+            (name, fingerprint, time.time()),
+        )
+        self._changed()
+
+    @_synchronized
+    def commit(self) -> None:
+        """Save all pending changes to the database"""
+        self._connection.commit()
+        self._uncommitted_changes = 0
+
+    @_synchronized
+    def close(self) -> None:
+        """Save all pending changes and close the database"""
+        self.commit()
+        self._connection.close()
+
+    def _set_note_ids(self, path: str, note_ids: Iterable[int]) -> None:
+        self._connection.execute(
+            "UPDATE files SET note_ids = ? WHERE path = ?",
+            (json.dumps(list(note_ids)), path),
+        )
+
+    @classmethod
+    def _batched(cls, values: List) -> Iterator[List]:
+        """Split values into batches that fit into the number of query parameters"""
+        for i in range(0, len(values), cls._max_parameters):
+            yield values[i : i + cls._max_parameters]
+
+    def _changed(self) -> None:
+        """Commit changes if there are enough of them"""
+        self._uncommitted_changes += 1
+        if self._uncommitted_changes >= self._commit_interval:
+            self.commit()
+
+    def __enter__(self) -> "SyncState":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self._path!r})"
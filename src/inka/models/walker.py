@@ -0,0 +1,344 @@
+import os
+import re
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+)
+
+from .sync_state import SyncState
+
+IGNORE_FILE_NAME = ".inkaignore"
+DEFAULT_IGNORE_PATTERNS = [".git/", "node_modules/"]
+
+_RACY_INTERVAL_NS = 2 * 10**9
+
+# (device, inode) of the file or directory
+FileId = Tuple[int, int]
+
+
+class IgnoreRules:
+    """Gitignore-style patterns that are used to skip files and directories.
+
+    Patterns are relative to the directory passed as base_dir. Rules of the parent
+    directories are checked only if none of the patterns matched the path.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[str],
+        base_dir: str,
+        parent: Optional["IgnoreRules"] = None,
+    ):
+        self._base_dir = base_dir
+        self._parent = parent
+        self._rules: List[Tuple[Pattern, bool, bool]] = []
+        for pattern in patterns:
+            rule = self._compile(pattern)
+            if rule:
+                self._rules.append(rule)
+
+    @classmethod
+    def from_file(
+        cls, path: str, parent: Optional["IgnoreRules"] = None
+    ) -> "IgnoreRules":
+        """Create rules from the ignore file. Patterns are relative to the directory of the file"""
+        with open(path, mode="rt", encoding="utf-8") as f:
+            patterns = f.read().splitlines()
+        return cls(patterns, os.path.dirname(path), parent)
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        """Check if the file or directory should be skipped"""
+        # Patterns are applied only to paths inside the base directory
+        if path.startswith(self._base_dir + os.sep):
+            relative_path = path[len(self._base_dir) + 1 :].replace(os.sep, "/")
+
+            # The last matching pattern takes precedence
+            for regex, negated, dir_only in reversed(self._rules):
+                if dir_only and not is_dir:
+                    continue
+                if regex.fullmatch(relative_path):
+                    return not negated
+
+        if self._parent:
+            return self._parent.is_ignored(path, is_dir)
+        return False
+
+    @classmethod
+    def _compile(cls, pattern: str) -> Optional[Tuple[Pattern, bool, bool]]:
+        """Convert gitignore-style pattern to the regex. Returns None if the line doesn't contain a pattern"""
+        # Trailing spaces are ignored unless they are escaped
+        pattern = pattern.rstrip("\n")
+        while pattern.endswith(" ") and not pattern.endswith("\\ "):
+            pattern = pattern[:-1]
+
+        if not pattern or pattern.startswith("#"):
+            return None
+
+        negated = pattern.startswith("!")
+        if negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\#") or pattern.startswith("\\!"):
+            pattern = pattern[1:]
+
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            return None
+
+        # Patterns without slash in the beginning or middle match at any level
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        regex = cls._translate(pattern)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+
+        return re.compile(regex, re.DOTALL), negated, dir_only
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        """Translate glob pattern to the regex string"""
+        regex: List[str] = []
+        i = 0
+        length = len(pattern)
+        while i < length:
+            char = pattern[i]
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if i + 2 == length:
+                    regex.append(".*")
+                    i += 2
+                    continue
+                if pattern[i + 2] == "/":
+                    regex.append("(?:.*/)?")
+                    i += 3
+                    continue
+
+            if char == "*":
+                regex.append("[^/]*")
+            elif char == "?":
+                regex.append("[^/]")
+            elif char == "\\" and i + 1 < length:
+                i += 1
+                regex.append(re.escape(pattern[i]))
+            elif char == "[":
+                end = pattern.find("]", i + 2)
+                if end == -1:
+                    regex.append(re.escape(char))
+                else:
+                    chars = pattern[i + 1 : end].replace("\\", "\\\\")
+                    if chars.startswith("!"):
+                        chars = "^" + chars[1:]
+                    regex.append(f"[{chars}]")
+                    i = end
+            else:
+                regex.append(re.escape(char))
+            i += 1
+
+        return "".join(regex)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(base_dir={self._base_dir!r}, parent={self._parent!r})"
+
+
+class _DirEntry(NamedTuple):
+    name: str
+    is_dir: bool  # symbolic links are followed
+    is_symlink: bool
+    inode: int
+
+
+def get_file_id(path: str) -> FileId:
+    """Get device and inode numbers of the file (symbolic links are followed)"""
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def walk_files(
+    dir_path: str,
+    extensions: Iterable[str],
+    recursive: bool,
+    seen: Optional[Set[FileId]] = None,
+    on_error: Optional[Callable[[OSError], None]] = None,
+    cache: Optional[SyncState] = None,
+) -> Iterator[str]:
+    """Iterate over paths to the files with the specified extensions in the directory.
+
+    Files and directories that match patterns from .inkaignore files (or the default
+    patterns) are skipped. Each file and directory is visited only once, even if it can
+    be reached through symbolic links. Working directory isn't changed.
+
+    If the cache is passed, listings of directories are saved in it. Directories
+    which modification time hasn't changed since then aren't listed again.
+
+    Args:
+        dir_path: path to the directory
+        extensions: extensions of the files to look for (with period)
+        recursive: search for files in subdirectories
+        seen: IDs of the already visited files and directories. Updated in place
+        on_error: function that is called with an error if some file or directory can't be read
+        cache: sync state that is used to store listings of directories
+    Returns:
+        Iterator over the paths to the files. Paths start with the real path of dir_path
+    """
+    extensions = tuple(extensions)
+    if seen is None:
+        seen = set()
+
+    root = os.path.realpath(dir_path)
+    root_stat = os.stat(root)
+    if (root_stat.st_dev, root_stat.st_ino) in seen:
+        return
+    seen.add((root_stat.st_dev, root_stat.st_ino))
+
+    rules = IgnoreRules(DEFAULT_IGNORE_PATTERNS, root)
+    stack = [(root, root_stat, rules)]
+    while stack:
+        directory, directory_stat, rules = stack.pop()
+        try:
+            entries = _list_directory(directory, directory_stat.st_mtime_ns, cache)
+            if any(entry.name == IGNORE_FILE_NAME for entry in entries):
+                rules = IgnoreRules.from_file(
+                    os.path.join(directory, IGNORE_FILE_NAME), rules
+                )
+        except OSError as e:
+            if on_error:
+                on_error(e)
+            continue
+
+        sub_directories = []
+        for entry in entries:
+            if entry.is_dir and not recursive:
+                continue
+            if not entry.is_dir and os.path.splitext(entry.name)[1] not in extensions:
+                continue
+
+            path = os.path.join(directory, entry.name)
+            if rules.is_ignored(path, entry.is_dir):
+                continue
+
+            try:
+                if entry.is_dir or entry.is_symlink:
+                    stat = os.stat(path)
+                    entry_id = (stat.st_dev, stat.st_ino)
+                else:
+                    # Regular files are on the same device as their directory
+                    entry_id = (directory_stat.st_dev, entry.inode)
+            except OSError as e:
+                if on_error:
+                    on_error(e)
+                continue
+
+            if entry_id in seen:
+                continue
+            seen.add(entry_id)
+
+            if entry.is_dir:
+                sub_directories.append((path, stat, rules))
+            else:
+                yield path
+
+        # Directories are visited in alphabetical order
+        stack.extend(reversed(sub_directories))
+
+
+def filter_ignored(paths: Iterable[str], root: str) -> Iterator[str]:
+    """Skip files that match patterns from .inkaignore files (or the default patterns).
+
+    Args:
+        paths: paths to the files inside the root directory
+        root: real path to the directory from which the ignore files are applied
+    Returns:
+        Iterator over the paths to the files that are not ignored
+    """
+    # Rules for each directory. None if directory itself is ignored
+    directory_rules: Dict[str, Optional[IgnoreRules]] = {}
+
+    def get_rules(directory: str) -> Optional[IgnoreRules]:
+        if directory in directory_rules:
+            return directory_rules[directory]
+
+        if directory == root or not directory.startswith(root + os.sep):
+            rules: Optional[IgnoreRules] = IgnoreRules(DEFAULT_IGNORE_PATTERNS, root)
+        else:
+            rules = get_rules(os.path.dirname(directory))
+            if rules and rules.is_ignored(directory, True):
+                rules = None
+
+        ignore_file = os.path.join(directory, IGNORE_FILE_NAME)
+        if rules and os.path.isfile(ignore_file):
+            rules = IgnoreRules.from_file(ignore_file, rules)
+
+        directory_rules[directory] = rules
+        return rules
+
+    for path in paths:
+        rules = get_rules(os.path.dirname(path))
+        if rules and not rules.is_ignored(path, False):
+            yield path
+
+
+def _list_directory(
+    directory: str, mtime_ns: int, cache: Optional[SyncState]
+) -> List[_DirEntry]:
+    """Get sorted list of files and directories in the directory.
+    Listing is taken from the cache if the directory wasn't modified since it was saved.
+    Listings of the directories that were removed (or can't be read anymore) are removed from the cache.
+    """
+    if not cache:
+        return _scan_directory(directory)
+
+    listing = cache.get_directory_listing(directory, mtime_ns)
+    if listing is not None:
+        return [_DirEntry(*entry) for entry in listing]
+
+    # Listing that was saved before the directory was modified
+    old_entries = [
+        _DirEntry(*entry) for entry in cache.get_directory_listing(directory) or []
+    ]
+    try:
+        entries = _scan_directory(directory)
+    except OSError:
+        cache.remove_directory_listings([directory])
+        raise
+
+    directories = {entry.name for entry in entries if entry.is_dir}
+    removed = [
+        os.path.join(directory, entry.name)
+        for entry in old_entries
+        if entry.is_dir and entry.name not in directories
+    ]
+    if removed:
+        cache.remove_directory_listings(removed)
+
+    # Directory can still change without changing its modification time (mtime granularity)
+    if time.time_ns() - mtime_ns > _RACY_INTERVAL_NS:
+        cache.update_directory_listing(directory, mtime_ns, entries)
+
+    return entries
+
+
+def _scan_directory(directory: str) -> List[_DirEntry]:
+    """Get sorted list of files and directories in the directory from the file system"""
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if not (is_dir or entry.is_file()):
+                    continue  # broken links and special files
+                entries.append(
+                    _DirEntry(entry.name, is_dir, entry.is_symlink(), entry.inode())
+                )
+            except OSError:
+                continue
+
+    entries.sort()
+    return entries
@@ -1,7 +1,6 @@
-import re
-from pathlib import Path
-from typing import Iterable, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
+from .document import Document
 from .notes.basic_note import BasicNote
 from .notes.cloze_note import ClozeNote
 from .notes.note import Note
@@ -9,40 +8,47 @@ from .parser import Parser
 
 
 class Writer:
-    """Class for editing file with notes"""
+    """Class for editing file with notes.
 
-    def __init__(self, file_path: Union[str, Path], notes: Iterable[Note]):
-        self._file_path = file_path
+    Notes are found by the positions recorded by Parser in the text of the document.
+    Edits are collected and applied in one pass over the text, sorted by position,
+    so the whole text doesn't have to be in memory. Nothing is written to the file
+    system until save() is called.
+
+    Methods work with the notes passed to them or with the notes passed to the constructor.
+    Edits can be moved to another writer of the same text (e.g. from another process).
+    """
+
+    def __init__(self, document: Document, notes: Iterable[Note] = ()):
+        self._document = document
         self._notes = notes
 
-        with open(self._file_path, mode="rt", encoding="utf-8") as f:
-            self._file_content = f.read()
-        self._note_strings = Parser.get_note_strings(self._file_content)
+        # Replacements for the ranges of the text from which notes were parsed
+        self._edits: Dict[Tuple[int, int], str] = {}
 
-    def update_note_ids(self):
-        """Update lines with IDs of the notes from the file"""
-        for note in self._notes:
-            # Find note's question in file string
-            note_question = note.get_raw_question_field()
-            question_string_start = self._file_content.find(note_question)
-            if question_string_start == -1:
-                continue
+    @property
+    def edits(self) -> Dict[Tuple[int, int], str]:
+        """Edits that weren't saved yet: replacements for the ranges of the text"""
+        return dict(self._edits)
 
-            matches = re.finditer(
-                r"(<!--ID:\S+-->)?(\n\d+\.\s*)",
-                self._file_content[:question_string_start],
-                re.MULTILINE,
-            )
-            if not matches:
-                # Note may not be found cause it was deleted
-                continue
+    def add_edits(self, edits: Mapping[Tuple[int, int], str]) -> None:
+        """Add edits made by another writer of the same text"""
+        self._edits.update(edits)
+
+    @property
+    def _file_content(self) -> str:
+        """Text of the document with all edits applied"""
+        return "".join(self._iter_content())
 
-            # Search for existing line with ID
-            question_match = list(matches)[-1]
-            existing_id = Parser.get_id(question_match.group(0))
+    def update_note_ids(self, notes: Optional[Iterable[Note]] = None):
+        """Update lines with IDs of the notes from the file"""
+        for note in self._notes if notes is None else notes:
+            # Note may not be found cause it wasn't parsed from this file
+            if note.span is None:
+                continue
 
             # Skip if ID hasn't changed
-            if existing_id == note.anki_id:
+            if note.span.anki_id == note.anki_id:
                 continue
 
             id_string = f"<!--ID:{note.anki_id}-->\n"
@@ -50,91 +56,99 @@ class Writer:
                 # Delete ID from note in file if note object has no ID
                 id_string = ""
 
-            # index of newline character that comes before question
-            newline_index = question_match.start(2)
-
-            if existing_id is None:
-                # Add line with ID after newline
-                self._file_content = (
-                    self._file_content[: newline_index + 1]
-                    + id_string
-                    + self._file_content[newline_index + 1 :]
-                )
-            else:
-                # Substitute existing ID with the new one
-                self._file_content = self._file_content.replace(
-                    f"<!--ID:{existing_id}-->\n", id_string
-                )
-
-        self._save()
-
-    def update_fields_of_basic_notes(self):
+            # Add line with ID before question or substitute existing ID with the new one
+            self._edits[note.span.id] = id_string
+
+    def update_fields_of_basic_notes(self, notes: Optional[Iterable[Note]] = None):
         """Update question and answer fields in notes in file"""
-        for note in self._notes:
+        for note in self._notes if notes is None else notes:
             if not isinstance(note, BasicNote):
                 continue
 
-            if not note.changed:
+            if not note.changed or note.span is None or note.span.answer is None:
                 continue
 
-            # Find string with this note by its ID
-            note_string = self._get_note_string_by_id(note.anki_id)
-
             # Substitute question field
-            current_question = Parser.get_question(note_string)
-            self._file_content = self._file_content.replace(
-                current_question, note.raw_front_md
-            )
+            self._edits[note.span.question] = note.raw_front_md
 
-            # Create new answer field (with '>')
-            current_answer = Parser.get_answer(note_string).rstrip()
+            # Create new answer field (with '>') and substitute the old one
             lines = note.raw_back_md.replace("\n\n", "\n").splitlines()
             new_answer = "\n".join(map(lambda line: f"> {line}", lines))
+            self._edits[note.span.answer] = new_answer
 
-            # Substitute answer field
-            self._file_content = self._file_content.replace(current_answer, new_answer)
-
-        self._save()
-
-    def delete_notes(self):
+    def delete_notes(self, notes: Optional[Iterable[Note]] = None):
         """Delete notes marked for deletion from the file"""
-        for note in self._notes:
-            if not note.to_delete:
+        for note in self._notes if notes is None else notes:
+            if not note.to_delete or note.span is None:
                 continue
 
-            # Find string with this note by its ID
-            note_string = self._get_note_string_by_id(note.anki_id)
+            # Delete note text from file (with all edits inside it)
+            self._edits[(note.span.start, note.span.end)] = ""
 
-            # Delete note text from file
-            self._file_content = self._file_content.replace(note_string, "")
-
-        self._save()
-
-    def update_cloze_notes(self):
+    def update_cloze_notes(self, notes: Optional[Iterable[Note]] = None):
         """Updates all cloze notes with the values from updated_text_md field"""
-        for note in self._notes:
-            if not isinstance(note, ClozeNote):
+        for note in self._notes if notes is None else notes:
+            if not isinstance(note, ClozeNote) or note.span is None:
                 continue
 
-            self._file_content = self._file_content.replace(
-                note.raw_text_md, note.updated_text_md, 1
-            )
+            if note.updated_text_md != note.raw_text_md:
+                self._edits[note.span.question] = note.updated_text_md
             note.raw_text_md = note.updated_text_md  # update info about raw text
 
-        self._save()
-
-    def _save(self):
-        """Save file state into the file system"""
-        with open(self._file_path, mode="wt", encoding="utf-8") as f:
-            f.write(self._file_content)
-        self._note_strings = Parser.get_note_strings(self._file_content)
-
-    def _get_note_string_by_id(self, note_id: int) -> Optional[str]:
-        """Gets note string from the file by its ID. If note wasn't found returns None"""
-        for string in self._note_strings:
-            if string.find(str(note_id)) != -1:
-                return string
-        return None
+    def save(
+        self, note_ids_of_sections: Optional[Dict[str, List[Optional[int]]]] = None
+    ) -> bool:
+        """Save all edits into the file system. File isn't written if there are no edits.
+        Positions of the notes refer to the old text after the file is saved.
+        If note_ids_of_sections is passed, IDs of the notes from each section of the written text
+        are added to it (see Parser.get_note_ids_of_sections), so the text doesn't have to be parsed again.
+        Returns True if the file was written.
+        """
+        if not self._edits:
+            return False
+
+        chunks = self._iter_content()
+        if note_ids_of_sections is not None:
+            chunks = Parser.collect_note_ids_of_sections(chunks, note_ids_of_sections)
+        self._document.write_chunks(chunks)
+        self._edits.clear()
+        return True
+
+    def _iter_content(self) -> Iterator[str]:
+        """Iterate over the text of the document with all edits applied"""
+        # Edits of the same position are sorted so that the largest range goes first
+        edits = sorted(self._edits.items(), key=lambda edit: (edit[0][0], -edit[0][1]))
+        edit_index = 0
+        position = 0  # position in the original text up to which it was processed
+        chunk_start = 0  # position of the current chunk in the original text
+        for chunk in self._document.iter_text():
+            chunk_end = chunk_start + len(chunk)
+            while edit_index < len(edits):
+                (start, end), replacement = edits[edit_index]
+                # Skip edits inside the range that was already replaced (e.g. deleted note)
+                if start < position:
+                    edit_index += 1
+                    continue
+                if start > chunk_end:
+                    break
+
+                yield chunk[position - chunk_start : start - chunk_start]
+                yield replacement
+                position = end
+                edit_index += 1
+
+            if position < chunk_end:
+                yield chunk[max(position - chunk_start, 0) :]
+                position = chunk_end
+            chunk_start = chunk_end
+
+        # Edits at the end of the text
+        for (start, end), replacement in edits[edit_index:]:
+            if start >= position:
+                yield replacement
+                position = end
 
     def __repr__(self):
-        return f"{type(self).__name__}(file_path={self._file_path!r}, notes={self._notes!r})"
+        return (
+            f"{type(self).__name__}(document={self._document!r}, notes={self._notes!r})"
+        )
@@ -9,6 +9,7 @@ from PIL import Image as Img
 from inka.models.anki_api import AnkiApi
 from inka.models.anki_media import AnkiMedia
 from inka.models.config import Config
+from inka.models.document import Document
 from inka.models.parser import Parser
 
 DEFAULT_ANKI_FOLDERS = {
@@ -42,7 +43,7 @@ def anki_media_mock(mocker) -> MagicMock:
 @pytest.fixture
 def fake_parser() -> Parser:
     """Parser class with dummy filename, default_deck. It uses 'test' profile."""
-    return Parser("file_doesnt_exist.md", "")
+    return Parser(Document("file_doesnt_exist.md", b""), "")
 
 
 @pytest.fixture
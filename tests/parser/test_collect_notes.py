@@ -0,0 +1,90 @@
+from inka.models.document import Document
+from inka.models.parser import Parser
+
+TEXT = (
+    "Intro\n"
+    "---\n"
+    "Deck: Abraham\n"
+    "\n"
+    "<!--ID:1111111111-->\n"
+    "1. Some question?\n"
+    "\n"
+    "> First answer\n"
+    "> More\n"
+    "\n"
+    "2.   Some {cloze}  \n"
+    "---\n"
+)
+
+
+def test_collect_notes_records_spans_of_notes():
+    notes = Parser(Document("file.md", TEXT.encode("utf-8")), "").collect_notes()
+    basic, cloze = [note.span for note in notes]
+
+    assert basic.line == 5
+    assert TEXT[basic.start : basic.end] == (
+        "<!--ID:1111111111-->\n1. Some question?\n\n> First answer\n> More\n\n"
+    )
+    assert TEXT[slice(*basic.id)] == "<!--ID:1111111111-->\n"
+    assert TEXT[slice(*basic.question)] == "Some question?"
+    assert TEXT[slice(*basic.answer)] == "> First answer\n> More"
+
+    assert cloze.line == 11
+    assert TEXT[cloze.start : cloze.end] == "2.   Some {cloze}  \n"
+    assert cloze.id == (cloze.start, cloze.start)
+    assert TEXT[slice(*cloze.question)] == "Some {cloze}"
+    assert cloze.answer is None
+
+
+def test_collect_notes_counts_lines_across_sections():
+    text = "---\n1. Q\n> A\n---\n\n---\n1. Q2\n> A2\n---"
+    notes = Parser(Document("file.md", text.encode("utf-8")), "Deck").collect_notes()
+
+    assert [note.span.line for note in notes] == [2, 7]
+
+
+def test_collect_notes_records_id_from_file():
+    notes = Parser(Document("file.md", TEXT.encode("utf-8")), "").collect_notes()
+
+    assert [note.span.anki_id for note in notes] == [1111111111, None]
+
+
+def test_iter_notes_reads_document_in_chunks(mocker):
+    mocker.patch.object(Document, "_chunk_size", 8)
+    document = Document("file.md", TEXT.encode("utf-8"))
+
+    notes = Parser(document, "").iter_notes()
+
+    expected = Parser(Document("file.md", TEXT.encode("utf-8")), "").collect_notes()
+    assert [note.span for note in notes] == [note.span for note in expected]
+
+
+def test_iter_notes_skips_sections_with_passed_hashes():
+    text = "---\n1. Q\n> A\n---\n\n---\n1. Q2\n> A2\n---"
+    parser = Parser(Document("file.md", text.encode("utf-8")), "Deck")
+
+    notes = parser.iter_notes({Parser.get_section_hash("1. Q\n> A\n")})
+
+    assert [note.span.line for note in notes] == [7]
+
+
+def test_get_note_ids_of_sections():
+    text = "---\n<!--ID:123-->\n1. Q\n> A\n2. Q2\n> A2\n---\n---\nText\n---"
+    parser = Parser(Document("file.md", text.encode("utf-8")), "Deck")
+
+    assert parser.get_note_ids_of_sections() == {
+        Parser.get_section_hash("<!--ID:123-->\n1. Q\n> A\n2. Q2\n> A2\n"): [123, None],
+        Parser.get_section_hash("Text\n"): [],
+    }
+
+
+def test_collect_note_ids_of_sections_passes_chunks_through():
+    text = "---\n<!--ID:123-->\n1. Q\n> A\n2. Q2\n> A2\n---\n---\nText\n---"
+    parser = Parser(Document("file.md", text.encode("utf-8")), "Deck")
+    chunks = [text[i : i + 5] for i in range(0, len(text), 5)]
+    note_ids = {}
+
+    passed = list(Parser.collect_note_ids_of_sections(chunks, note_ids))
+
+    assert passed == chunks
+    assert note_ids == parser.get_note_ids_of_sections()
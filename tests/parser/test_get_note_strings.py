@@ -331,6 +331,15 @@ test_cases = {
             "\n"
         ),
     ],
+    # ID comment ends the note even in the middle of the line
+    ("1. Question <!--ID:123--> text\n" "> Answer\n" "2. Q\n" "> A"): [
+        "1. Question ",
+        "2. Q\n> A",
+    ],
+    # line with ID that isn't followed by a note
+    ("<!--ID:123-->\n" "Text\n" "<!--ID:456-->\n" "1. Q\n" "> A"): [
+        "<!--ID:456-->\n1. Q\n> A"
+    ],
 }
 
 
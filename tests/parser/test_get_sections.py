@@ -25,6 +25,10 @@ test_cases = {
         "First one\n",
         "Second one\n",
     ],
+    # first line of the section never ends it
+    ("---\n" "---\n" "Text\n" "---"): ["---\nText\n"],
+    # section without end
+    ("---\n" "Text\n"): [],
 }
 
 
@@ -0,0 +1,469 @@
+import itertools
+import re
+import sqlite3
+from typing import List
+
+import anki.collection
+import anki.notes
+import anki.utils
+import pytest
+
+from inka.exceptions import AnkiApiError, DuplicateNoteError
+from inka.models.anki_api import AnkiApi
+from inka.models.config import Config
+from inka.models.notes.basic_note import BasicNote
+
+BASIC_MODEL = {
+    "id": 1,
+    "name": "Inka Basic",
+    "flds": [{"name": "Front"}, {"name": "Back"}],
+}
+
+
+class FakeDb:
+    """Database of the collection with the notes and cards tables (as DBProxy of Anki)"""
+
+    def __init__(self):
+        self._connection = sqlite3.connect(":memory:")
+        self._connection.execute(
+            "CREATE TABLE notes "
+            "(id INTEGER PRIMARY KEY, mid INTEGER, flds TEXT, tags TEXT, csum INTEGER)"
+        )
+        self._connection.execute(
+            "CREATE TABLE cards "
+            "(id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER, odid INTEGER)"
+        )
+        self.queries: List[str] = []
+
+    def all(self, sql, *args):
+        self.queries.append(sql)
+        return self._connection.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.all(sql, *args)]
+
+    def add_note(self, note_id, fields, tags="", model_id=1, deck_id=1):
+        checksum = AnkiApi._get_checksum(strip_html(fields[0]))
+        self._connection.execute(
+            "INSERT INTO notes VALUES (?, ?, ?, ?, ?)",
+            (note_id, model_id, anki.utils.join_fields(fields), tags, checksum),
+        )
+        self._connection.execute(
+            "INSERT INTO cards VALUES (?, ?, ?, 0)", (note_id * 10, note_id, deck_id)
+        )
+
+
+class FakeAnkiNote:
+    """Note of Anki that isn't created by the backend"""
+
+    def __init__(self, collection, model):
+        self.id = 0
+        self.mid = model["id"]
+        self.tags: List[str] = []
+        self.fields: List[str] = []
+
+
+def strip_html(text: str) -> str:
+    """Remove html tags from the text (as Anki does for the first field)"""
+    return re.sub(r"<[^>]*>", "", text)
+
+
+@pytest.fixture
+def db() -> FakeDb:
+    """Database of the collection without notes"""
+    return FakeDb()
+
+
+@pytest.fixture
+def collection(mocker, db):
+    """Mock of Anki collection with the database from 'db' fixture"""
+    collection = mocker.MagicMock()
+    collection.db = db
+    collection._backend.strip_html.side_effect = lambda text, mode: strip_html(text)
+    collection.models.by_name.side_effect = lambda name: (
+        BASIC_MODEL if name == BASIC_MODEL["name"] else None
+    )
+    collection.models.get.side_effect = lambda model_id: (
+        BASIC_MODEL if model_id == BASIC_MODEL["id"] else None
+    )
+    collection.decks.id.side_effect = lambda name, create: {"Deck": 1, "Other": 2}.get(
+        name
+    )
+    collection.tags.split.side_effect = str.split
+
+    ids = itertools.count(100)
+
+    def add_notes(requests):
+        for request in requests:
+            note = request.note
+            note.id = next(ids)
+            db.add_note(note.id, note.fields, " ".join(note.tags), note.mid)
+
+    collection.add_notes.side_effect = add_notes
+    return collection
+
+
+@pytest.fixture
+def anki_api(mocker, tmp_path, collection) -> AnkiApi:
+    """Instance of AnkiApi class with the collection from 'collection' fixture"""
+    mocker.patch.object(anki.notes, "Note", FakeAnkiNote)
+    mocker.patch.object(
+        anki.collection,
+        "AddNoteRequest",
+        mocker.Mock(side_effect=lambda note, deck_id: mocker.Mock(note=note)),
+        create=True,
+    )
+    anki_api = AnkiApi.__new__(AnkiApi)
+    anki_api._cfg = Config(tmp_path / "config.ini")
+    anki_api._collection = collection
+    anki_api._models = {}
+    anki_api._deck_ids = {}
+    anki_api._note_ids = {}
+    anki_api._checksums = {}
+    return anki_api
+
+
+def make_note(front, back="back", tags=(), deck="Deck", anki_id=None) -> BasicNote:
+    """Basic note with the fields converted to html"""
+    note = BasicNote(front, back, list(tags), deck, anki_id)
+    note.front_html = f"<p>{front}</p>"
+    note.back_html = f"<p>{back}</p>"
+    return note
+
+
+# add_notes
+def test_add_notes_adds_all_notes_in_one_request(anki_api, collection):
+    notes = [make_note("first", tags=["tag"]), make_note("second", deck="Other")]
+
+    note_ids, errors = anki_api.add_notes(notes)
+
+    assert note_ids == [100, 101]
+    assert errors == []
+    collection.add_notes.assert_called_once()
+    collection.add_note.assert_not_called()
+    requests = anki.collection.AddNoteRequest.call_args_list
+    assert [request.kwargs["deck_id"] for request in requests] == [1, 2]
+    assert requests[0].kwargs["note"].fields == ["<p>first</p>", "<p>back</p>"]
+    assert requests[0].kwargs["note"].tags == ["tag"]
+
+
+def test_add_notes_looks_up_note_type_and_deck_once(anki_api, collection):
+    anki_api.add_notes([make_note("first"), make_note("second")])
+
+    collection.models.by_name.assert_called_once_with("Inka Basic")
+    collection.decks.id.assert_called_once_with("Deck", create=True)
+
+
+def test_add_notes_one_by_one_when_collection_can_not_add_them_at_once(
+    anki_api, collection
+):
+    del collection.add_notes
+    ids = iter([100, 101])
+    collection.add_note.side_effect = lambda note, deck_id: setattr(
+        note, "id", next(ids)
+    )
+
+    note_ids, errors = anki_api.add_notes([make_note("first"), make_note("second")])
+
+    assert note_ids == [100, 101]
+    assert errors == []
+    assert collection.add_note.call_count == 2
+
+
+def test_add_notes_skips_duplicates_among_added_notes(anki_api, collection):
+    notes = [make_note("same"), make_note("same", back="other"), make_note("another")]
+
+    note_ids, errors = anki_api.add_notes(notes)
+
+    assert note_ids == [100, None, 101]
+    assert len(errors) == 1
+    assert isinstance(errors[0], DuplicateNoteError)
+    assert errors[0].note is notes[1]
+
+
+def test_add_notes_when_note_type_does_not_exist(anki_api, collection):
+    collection.models.by_name.side_effect = lambda name: None
+    note = make_note("first")
+
+    note_ids, errors = anki_api.add_notes([note])
+
+    assert note_ids == [None]
+    assert isinstance(errors[0], AnkiApiError)
+    assert errors[0].note is note
+
+
+def test_add_notes_when_first_field_is_empty(anki_api):
+    note = make_note("")
+
+    note_ids, errors = anki_api.add_notes([note])
+
+    assert note_ids == [None]
+    assert str(errors[0]) == "first field is empty! Note wasn't added."
+
+
+# update_notes
+def test_update_notes_writes_only_changed_notes(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>old</p>"])
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"])
+    anki_note = {"Front": "<p>first</p>", "Back": "<p>old</p>"}
+    collection.get_note.return_value = anki_note
+    notes = [make_note("first", "new", anki_id=1), make_note("second", anki_id=2)]
+
+    errors = anki_api.update_notes(notes)
+
+    assert errors == []
+    collection.get_note.assert_called_once_with(1)
+    collection.update_notes.assert_called_once_with([anki_note])
+    assert anki_note == {"Front": "<p>first</p>", "Back": "<p>new</p>"}
+
+
+def test_update_notes_when_nothing_has_changed(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "tag")
+
+    errors = anki_api.update_notes([make_note("first", tags=["tag"], anki_id=1)])
+
+    assert errors == []
+    collection.update_notes.assert_not_called()
+    collection.tags.bulk_add.assert_not_called()
+    collection.tags.bulk_remove.assert_not_called()
+    collection.set_deck.assert_not_called()
+
+
+def test_update_notes_reads_all_notes_at_once(anki_api, db):
+    for note_id in range(1, 4):
+        db.add_note(note_id, [f"<p>{note_id}</p>", "<p>back</p>"])
+
+    anki_api.update_notes([make_note(str(i), anki_id=i) for i in range(1, 4)])
+
+    assert sum(query.startswith("SELECT id, mid, flds") for query in db.queries) == 1
+    assert sum(query.startswith("SELECT id, nid") for query in db.queries) == 1
+
+
+def test_update_notes_when_note_is_not_in_anki(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    missing_note = make_note("second", anki_id=2)
+
+    errors = anki_api.update_notes([make_note("first", anki_id=1), missing_note])
+
+    assert len(errors) == 1
+    assert errors[0].note is missing_note
+    collection.update_notes.assert_not_called()
+
+
+# has_note
+def test_has_note_reads_ids_of_note_type_once(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"], model_id=2)
+
+    assert anki_api.has_note(make_note("first", anki_id=1))
+    assert not anki_api.has_note(make_note("second", anki_id=2))
+    assert not anki_api.has_note(make_note("third", anki_id=3))
+    assert len(db.queries) == 1
+
+
+def test_has_note_when_note_has_no_id(anki_api, db):
+    assert not anki_api.has_note(make_note("first"))
+    assert db.queries == []
+
+
+def test_has_note_knows_about_added_notes(anki_api, db):
+    assert not anki_api.has_note(make_note("first", anki_id=100))
+
+    anki_api.add_notes([make_note("first")])
+
+    assert anki_api.has_note(make_note("first", anki_id=100))
+
+
+# update_note_ids
+def test_update_note_ids_returns_notes_that_were_not_found(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"])
+    notes = [
+        make_note("first", anki_id=1),
+        make_note("second", anki_id=5),
+        make_note("third", anki_id=6),
+        make_note("fourth"),
+    ]
+
+    not_found = anki_api.update_note_ids(notes)
+
+    assert not_found == [notes[2], notes[3]]
+    assert [note.anki_id for note in notes] == [1, 2, None, None]
+
+
+# _find_notes_by_first_field
+def test_find_notes_by_first_field_in_one_query(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"])
+
+    note_ids = anki_api._find_notes_by_first_field(
+        [make_note("second"), make_note("first"), make_note("third")]
+    )
+
+    assert note_ids == [2, 1, None]
+    assert len(db.queries) == 1
+    assert "WHERE csum IN" in db.queries[0]
+
+
+def test_find_notes_by_first_field_compares_fields_with_same_checksum(anki_api, db):
+    # Checksum is calculated without html, but fields are compared as they are
+    db.add_note(1, ["<b>first</b>", "<p>back</p>"])
+    db.add_note(2, ["<p>first</p>", "<p>back</p>"], model_id=2)
+
+    assert anki_api._find_notes_by_first_field([make_note("first")]) == [None]
+
+
+def test_find_notes_by_first_field_returns_oldest_note(anki_api, db):
+    db.add_note(2, ["<p>first</p>", "<p>back</p>"])
+    db.add_note(1, ["<p>first</p>", "<p>other</p>"])
+
+    assert anki_api._find_notes_by_first_field([make_note("first")]) == [1]
+
+
+def test_find_notes_by_first_field_without_notes(anki_api, db):
+    assert anki_api._find_notes_by_first_field([]) == []
+    assert db.queries == []
+
+
+# _is_duplicate
+def test_is_duplicate_reads_checksums_of_note_type_once(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+
+    assert anki_api._is_duplicate(1, "first")
+    assert not anki_api._is_duplicate(1, "second")
+    assert not anki_api._is_duplicate(1, "third")
+    assert sum(query.startswith("SELECT csum") for query in db.queries) == 1
+
+
+def test_is_duplicate_compares_fields_with_same_checksum(anki_api, db, mocker):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    mocker.patch.object(AnkiApi, "_get_checksum", return_value=0)
+    db.add_note(2, ["<p>other</p>", "<p>back</p>"])
+
+    assert not anki_api._is_duplicate(1, "second")
+    assert anki_api._is_duplicate(1, "other")
+
+
+def test_is_duplicate_when_note_type_differs(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], model_id=2)
+
+    assert not anki_api._is_duplicate(1, "first")
+
+
+def test_add_notes_skips_duplicates_of_notes_in_anki(anki_api, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"])
+    notes = [make_note("first", back="other"), make_note("second")]
+
+    note_ids, errors = anki_api.add_notes(notes)
+
+    assert note_ids == [None, 100]
+    assert isinstance(errors[0], DuplicateNoteError)
+    assert errors[0].note is notes[0]
+
+
+def test_add_notes_remembers_checksums_of_added_notes(anki_api, db):
+    anki_api.add_notes([make_note("first")])
+
+    note_ids, errors = anki_api.add_notes([make_note("first")])
+
+    assert note_ids == [None]
+    assert isinstance(errors[0], DuplicateNoteError)
+
+
+# update_notes: decks and tags
+def test_update_notes_moves_cards_to_deck_together(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], deck_id=1)
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"], deck_id=1)
+    db.add_note(3, ["<p>third</p>", "<p>back</p>"], deck_id=2)
+    notes = [
+        make_note(front, deck="Other", anki_id=i)
+        for i, front in enumerate(["first", "second", "third"], start=1)
+    ]
+
+    anki_api.update_notes(notes)
+
+    collection.set_deck.assert_called_once_with([10, 20], 2)
+    collection.update_notes.assert_not_called()
+
+
+def test_update_notes_uses_home_deck_of_cards_in_filtered_deck(
+    anki_api, collection, db
+):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], deck_id=3)
+    db.all("UPDATE cards SET odid = 2 WHERE id = 10")
+
+    anki_api.update_notes([make_note("first", deck="Other", anki_id=1)])
+
+    collection.set_deck.assert_not_called()
+
+
+def test_update_notes_adds_and_removes_tags_together(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "old kept")
+    db.add_note(2, ["<p>second</p>", "<p>back</p>"], "old kept")
+    notes = [
+        make_note("first", tags=["kept", "new"], anki_id=1),
+        make_note("second", tags=["kept", "new"], anki_id=2),
+    ]
+
+    anki_api.update_notes(notes, {1: ["old", "kept"], 2: ["old", "kept"]})
+
+    collection.tags.bulk_add.assert_called_once_with([1, 2], "new")
+    collection.tags.bulk_remove.assert_called_once_with([1, 2], "old")
+    collection.update_notes.assert_not_called()
+
+
+def test_update_notes_compares_tags_case_insensitively(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "Tag")
+
+    anki_api.update_notes([make_note("first", tags=["tag"], anki_id=1)], {1: ["Tag"]})
+
+    collection.tags.bulk_add.assert_not_called()
+    collection.tags.bulk_remove.assert_not_called()
+
+
+def test_update_notes_keeps_tags_that_were_not_synced(anki_api, collection, db):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "leech marked synced user")
+
+    anki_api.update_notes([make_note("first", anki_id=1)], {1: ["synced"]})
+
+    collection.tags.bulk_remove.assert_called_once_with([1], "synced")
+
+
+def test_update_notes_without_synced_tags_does_not_remove_tags(
+    anki_api, collection, db
+):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "leech")
+
+    anki_api.update_notes([make_note("first", tags=["tag"], anki_id=1)])
+
+    collection.tags.bulk_add.assert_called_once_with([1], "tag")
+    collection.tags.bulk_remove.assert_not_called()
+
+
+def test_update_notes_sets_tags_when_child_of_removed_tag_is_kept(
+    anki_api, collection, db
+):
+    db.add_note(1, ["<p>first</p>", "<p>back</p>"], "parent parent::child leech")
+    anki_note = collection.get_note.return_value
+
+    anki_api.update_notes(
+        [make_note("first", tags=["parent::child"], anki_id=1)], {1: ["parent"]}
+    )
+
+    assert anki_note.tags == ["parent::child", "leech"]
+    collection.update_notes.assert_called_once_with([anki_note])
+    collection.tags.bulk_remove.assert_not_called()
+
+
+def test_update_notes_keeps_tags_that_were_not_synced_when_fields_change(
+    anki_api, collection, db
+):
+    db.add_note(1, ["<p>first</p>", "<p>old</p>"], "synced leech")
+    anki_note = collection.get_note.return_value
+
+    anki_api.update_notes(
+        [make_note("first", "new", tags=["tag"], anki_id=1)], {1: ["synced"]}
+    )
+
+    assert anki_note.tags == ["leech", "tag"]
+    collection.update_notes.assert_called_once_with([anki_note])
@@ -9,13 +9,6 @@ def basic_note() -> BasicNote:
     return BasicNote("front content", "back content", ["tag1", "tag2"], "deck name")
 
 
-def test_search_query(basic_note):
-    basic_note.front_html = "<p>front content</p>"
-    expected = '"<p>front content</p>"'
-
-    assert basic_note.search_query == expected
-
-
 def test_convert_fields_to_html_when_function_passed(basic_note):
     new_text = "new text"
 
@@ -9,13 +9,6 @@ def cloze_note() -> ClozeNote:
     return ClozeNote("text content", ["tag1", "tag2"], "deck name")
 
 
-def test_search_query(cloze_note):
-    cloze_note.text_html = "<p>front content</p>"
-    expected = '"<p>front content</p>"'
-
-    assert cloze_note.search_query == expected
-
-
 def test_convert_fields_to_html_when_function_passed(cloze_note):
     new_text = "new text"
 
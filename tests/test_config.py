@@ -162,3 +162,23 @@ def test_new_options_removed_by_reset(config, config_path, default_config_string
 
     with open(config_path, mode="rt", encoding="utf-8") as f:
         assert f.read() == default_config_string
+
+
+def test_get_fingerprint_is_same_for_same_options(config, config_path):
+    assert config.get_fingerprint() == Config(config_path).get_fingerprint()
+
+
+def test_get_fingerprint_changes_with_note_options(config):
+    fingerprint = config.get_fingerprint()
+
+    config.update_option_value("anki", "front_field", "Question")
+
+    assert config.get_fingerprint() != fingerprint
+
+
+def test_get_fingerprint_does_not_change_with_unrelated_options(config):
+    fingerprint = config.get_fingerprint()
+
+    config.update_option_value("highlight", "style", "github")
+
+    assert config.get_fingerprint() == fingerprint
@@ -3,6 +3,7 @@ import pytest
 from inka.models import converter
 from inka.models.notes.basic_note import BasicNote
 from inka.models.notes.cloze_note import ClozeNote
+from inka.models.render_cache import RenderCache
 
 
 @pytest.fixture
@@ -252,6 +253,11 @@ convert_cloze_test_cases = {
         r"{{c3::Paris}} is the capital and most populous city of {{c3::France}},"
         r" with a {{c1::estimated::my hint}} population of {{c4::2,148,271}} residents"
     ),
+    # same text inside and outside of cloze deletion
+    "{{c1::{a}}} {a}": "{{c1::{a}}} {{c2::a}}",
+    "{a} {{c1::{a}}}": "{{c1::a}} {{c1::{a}}}",
+    # text that looks like internal placeholders
+    "{INLINE_CODE_PLACEHOLDER} `code`": "{{c1::INLINE_CODE_PLACEHOLDER}} `code`",
 }
 
 md_to_html_test_cases = {
@@ -308,6 +314,23 @@ md_to_html_test_cases = {
     "$$\\sqrt{2}$$ some text $\\sqrt{6}$ in between $$\n\\sqrt{2}\n\\frac{1}{2}\n$$": (
         "<p>\\[\\sqrt{2}\\] some text \\(\\sqrt{6}\\) in between \\[\n\\sqrt{2}\n\\frac{1}{2}\n\\]</p>"
     ),
+    # block mathjax with something that looks like a tag
+    "$$\n<x, y>\n$$": "<p>\\[<x, y>\\]</p>",
+    # line break, quote and horizontal rule
+    "Line  \nbreak\n\n> quote\n\n---\n": (
+        "<p>Line<br />break</p><blockquote><p>quote</p></blockquote><hr />"
+    ),
+    # table
+    "| a | b |\n|---|:-:|\n| 1 | 2 |\n": (
+        '<table><thead><tr>  <th>a</th>  <th style="text-align:center">b</th></tr></thead>'
+        '<tbody><tr>  <td>1</td>  <td style="text-align:center">2</td></tr></tbody></table>'
+    ),
+    # footnote
+    "Text[^1]\n\n[^1]: Note\n": (
+        '<p>Text<sup class="footnote-ref" id="fnref-1"><a href="#fn-1">1</a></sup></p>'
+        '<section class="footnotes"><ol><li id="fn-1">'
+        '<p>Note<a href="#fnref-1" class="footnote">&#8617;</a></p></li></ol></section>'
+    ),
 }
 
 
@@ -364,3 +387,14 @@ def test_convert_cards_to_html_works_with_multiple_cards():
     assert basic_note2.front_html == expected2
     assert basic_note2.back_html == expected1
     assert cloze_note.text_html == expected3
+
+
+def test_convert_cards_to_html_takes_fields_from_cache(tmp_path, mocker):
+    note = BasicNote(front_md="same", back_md="same", tags=[], deck_name="")
+    render = mocker.spy(converter, "_convert_md_to_html")
+
+    with RenderCache(tmp_path / "render_cache.db", "1") as cache:
+        converter.convert_notes_to_html([note], cache)
+
+    assert note.front_html == note.back_html == "<p>same</p>"
+    render.assert_called_once_with("same")
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from inka.models.document import Document
+from inka.models.hasher import Hasher
+
+
+@pytest.fixture
+def test_file(tmp_path) -> str:
+    path = str(tmp_path / "file.md")
+    with open(path, mode="wb") as f:
+        f.write(b"Hello, **WORLD**!")
+    return path
+
+
+def test_read_when_file_exists(test_file):
+    document = Document.read(test_file)
+
+    assert document.path == test_file
+    assert document.text == "Hello, **WORLD**!"
+    assert document.signature == Hasher.get_signature(test_file)
+
+
+def test_read_when_file_does_not_exist_raises_error():
+    with pytest.raises(FileNotFoundError):
+        Document.read("does_not_exist.md")
+
+
+def test_text_when_file_is_not_utf8_raises_error(test_file):
+    with open(test_file, mode="wb") as f:
+        f.write(b"\xff\xfe")
+
+    with Document.read(test_file) as document:
+        with pytest.raises(UnicodeDecodeError):
+            document.text
+
+
+def test_text_has_translated_newlines():
+    document = Document("file.md", b"one\r\ntwo\rthree\n")
+
+    assert document.text == "one\ntwo\nthree\n"
+
+
+def test_iter_text_splits_text_after_newlines(mocker):
+    mocker.patch.object(Document, "_chunk_size", 4)
+    document = Document("file.md", "one\r\ntwo\nпривет\nend".encode("utf-8"))
+
+    assert list(document.iter_text()) == ["one\n", "two\n", "привет\n", "end"]
+
+
+def test_read_when_file_is_empty(test_file):
+    open(test_file, mode="wb").close()
+
+    with Document.read(test_file) as document:
+        assert document.text == ""
+        assert document.hash == Hasher.calculate_hash(test_file)
+
+
+def test_hash_is_same_as_hash_of_file(test_file):
+    document = Document.read(test_file)
+
+    assert document.hash == Hasher.calculate_hash(test_file)
+
+
+def test_write_saves_text_to_file_system(test_file):
+    document = Document.read(test_file)
+
+    document.write("New text\n")
+
+    with open(test_file, mode="rt", encoding="utf-8") as f:
+        assert f.read() == "New text\n"
+
+
+def test_write_updates_hash_and_signature(test_file):
+    document = Document.read(test_file)
+    os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+
+    document.write("New text\n")
+
+    assert document.text == "New text\n"
+    assert document.hash == Hasher.calculate_hash(test_file)
+    assert document.signature == Hasher.get_signature(test_file)
+
+
+def test_write_chunks_can_use_text_of_document(test_file):
+    with Document.read(test_file) as document:
+        document.write_chunks(chunk.upper() for chunk in document.iter_text())
+
+        assert document.text == "HELLO, **WORLD**!"
+        assert document.hash == Hasher.calculate_hash(test_file)
+
+
+def test_write_keeps_permissions_of_file(test_file):
+    os.chmod(test_file, 0o640)
+    document = Document.read(test_file)
+
+    document.write("New text\n")
+
+    assert os.stat(test_file).st_mode & 0o777 == 0o640
+
+
+def test_write_does_not_leave_temporary_files(test_file):
+    document = Document.read(test_file)
+
+    document.write("New text\n")
+
+    assert os.listdir(os.path.dirname(test_file)) == ["file.md"]
+
+
+def test_write_through_symbolic_link_keeps_link(test_file, tmp_path):
+    link = tmp_path / "link.md"
+    link.symlink_to(test_file)
+    document = Document.read(str(link))
+
+    document.write("New text\n")
+
+    assert link.is_symlink()
+    with open(test_file, mode="rt", encoding="utf-8") as f:
+        assert f.read() == "New text\n"
+
+
+def test_repr_method():
+    assert repr(Document("file.md", b"")) == "Document(path='file.md')"
@@ -0,0 +1,167 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from inka import cli
+from inka.exceptions import GitError
+from inka.models import git
+from inka.models.sync_state import SyncState
+
+EXTENSIONS = [".md"]
+
+
+def run_git(directory: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-C", str(directory), *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+def commit(directory: Path) -> str:
+    run_git(directory, "add", "-A")
+    run_git(directory, "commit", "-q", "-m", "commit")
+    return git.get_head_commit(str(directory))
+
+
+@pytest.fixture
+def repository(tmp_path) -> Path:
+    """Temporary git repository without commits"""
+    path = Path(os.path.realpath(tmp_path)) / "repository"
+    path.mkdir()
+    run_git(path, "init", "-q")
+    run_git(path, "config", "user.name", "Test")
+    run_git(path, "config", "user.email", "test@example.com")
+    return path
+
+
+@pytest.fixture
+def committed_repository(repository) -> Path:
+    """Temporary git repository with Markdown files in the first commit"""
+    for path in ["first.md", "second.md", "image.png", "sub/third.md"]:
+        (repository / path).parent.mkdir(parents=True, exist_ok=True)
+        (repository / path).write_text("text", encoding="utf-8")
+    commit(repository)
+    return repository
+
+
+def changed_files(repository: Path, since: str, recursive: bool = True) -> list:
+    files = git.get_changed_files(
+        str(repository), since, str(repository), EXTENSIONS, recursive
+    )
+    return [os.path.relpath(file, repository) for file in files]
+
+
+def test_get_repository_root(repository):
+    (repository / "sub").mkdir()
+
+    assert git.get_repository_root(str(repository / "sub")) == str(repository)
+
+
+def test_get_repository_root_when_path_is_file(repository):
+    (repository / "file.md").write_text("text", encoding="utf-8")
+
+    assert git.get_repository_root(str(repository / "file.md")) == str(repository)
+
+
+def test_get_repository_root_when_path_is_not_in_repository(tmp_path):
+    assert git.get_repository_root(str(tmp_path)) is None
+
+
+def test_get_head_commit_when_there_are_no_commits(repository):
+    assert git.get_head_commit(str(repository)) is None
+
+
+def test_get_head_commit(committed_repository):
+    head = git.get_head_commit(str(committed_repository))
+
+    assert len(head) == 40
+
+
+def test_get_changed_files_when_nothing_changed(committed_repository):
+    head = git.get_head_commit(str(committed_repository))
+
+    assert changed_files(committed_repository, head) == []
+
+
+def test_get_changed_files_includes_committed_changes(committed_repository):
+    head = git.get_head_commit(str(committed_repository))
+    (committed_repository / "first.md").write_text("new text", encoding="utf-8")
+    commit(committed_repository)
+
+    assert changed_files(committed_repository, head) == ["first.md"]
+
+
+def test_get_changed_files_includes_uncommitted_and_untracked_files(
+    committed_repository,
+):
+    head = git.get_head_commit(str(committed_repository))
+    (committed_repository / "sub" / "third.md").write_text("new", encoding="utf-8")
+    (committed_repository / "new.md").write_text("text", encoding="utf-8")
+    (committed_repository / "new.png").write_text("text", encoding="utf-8")
+
+    assert sorted(changed_files(committed_repository, head)) == [
+        "new.md",
+        "sub/third.md",
+    ]
+
+
+def test_get_changed_files_excludes_deleted_files(committed_repository):
+    head = git.get_head_commit(str(committed_repository))
+    (committed_repository / "first.md").unlink()
+    (committed_repository / "second.md").write_text("new", encoding="utf-8")
+
+    assert changed_files(committed_repository, head) == ["second.md"]
+
+
+def test_get_changed_files_non_recursive(committed_repository):
+    head = git.get_head_commit(str(committed_repository))
+    (committed_repository / "first.md").write_text("new", encoding="utf-8")
+    (committed_repository / "sub" / "third.md").write_text("new", encoding="utf-8")
+
+    assert changed_files(committed_repository, head, recursive=False) == ["first.md"]
+
+
+def test_get_changed_files_when_revision_is_incorrect(committed_repository):
+    with pytest.raises(GitError):
+        changed_files(committed_repository, "incorrect-revision")
+
+
+# filter_files
+def test_filter_files():
+    files = ["/dir/a.md", "/dir/a.png", "/dir/sub/b.md", "/dir2/c.md", "/dir/a.md"]
+
+    assert git.filter_files(files, "/dir", EXTENSIONS, True) == [
+        "/dir/a.md",
+        "/dir/sub/b.md",
+    ]
+    assert git.filter_files(files, "/dir", EXTENSIONS, False) == ["/dir/a.md"]
+    assert git.filter_files(files, "/dir/a.md", EXTENSIONS, False) == ["/dir/a.md"]
+
+
+# changed files of the synced repository
+def test_changes_reverted_without_commit_are_synced_again(
+    committed_repository, tmp_path
+):
+    first = str(committed_repository / "first.md")
+    with SyncState(tmp_path / "sync_state.db") as state:
+        _, _, commits = cli.get_changed_files_from_git(
+            [str(committed_repository)], True, None, state
+        )
+        cli.update_git_commits(state, commits, True)
+        # Uncommitted change is synced
+        (committed_repository / "first.md").write_text("new", encoding="utf-8")
+        files, _, commits = cli.get_changed_files_from_git(
+            [str(committed_repository)], True, None, state
+        )
+        cli.update_git_commits(state, commits, True)
+        assert files == [first]
+
+        run_git(committed_repository, "checkout", "--", "first.md")
+
+        files, _, _ = cli.get_changed_files_from_git(
+            [str(committed_repository)], True, None, state
+        )
+        assert files == [first]
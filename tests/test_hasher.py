@@ -2,7 +2,8 @@ import os
 
 import pytest
 
-from inka.models.hasher import Hasher
+from inka.models.hasher import FileScan, Hasher
+from inka.models.sync_state import SyncState
 
 
 @pytest.fixture
@@ -15,28 +16,34 @@ def test_file(tmp_path) -> str:
 
 
 @pytest.fixture
-def file_with_hashes(tmp_path) -> str:
-    path = str(tmp_path / "test_file_with_hashes.json")
-    with open(path, mode="wt", encoding="utf-8") as f:
-        f.write(
-            "{\n"
-            '"fake1.md": "724ae4e3bf11c04581daf1bb4de43161",\n'
-            '"fake2.md": "123ae4a4bf1ac04581daf1bb4de43161"\n'
-            "}"
-        )
+def old_test_file(test_file) -> str:
+    """Test file with modification time far enough in the past"""
+    os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+    return test_file
 
-    yield path
-    os.remove(path)
+
+@pytest.fixture
+def state(tmp_path) -> SyncState:
+    state = SyncState(tmp_path / "sync_state.db")
+    state.update_file(
+        "fake1.md",
+        "82f5e46fd748645c99b709e49269e0e7690a9b10",
+        (17, 1_000_000_000, 42),
+    )
+    state.update_file("fake2.md", "123ae4a4bf1ac04581daf1bb4de43161", None)
+
+    yield state
+    state.close()
 
 
 @pytest.fixture
-def hasher(file_with_hashes: str) -> Hasher:
-    return Hasher(file_with_hashes)
+def hasher(state: SyncState) -> Hasher:
+    return Hasher(state)
 
 
 # calculate_hash
 def test_calculate_hash_when_file_exists(test_file):
-    expected = "724ae4e3bf11c04581daf1bb4de43161"
+    expected = "82f5e46fd748645c99b709e49269e0e7690a9b10"
 
     assert Hasher.calculate_hash(test_file) == expected
 
@@ -46,9 +53,31 @@ def test_calculate_hash_when_file_does_not_exist_raises_error():
         Hasher.calculate_hash("does_not_exist.json")
 
 
+def test_calculate_hash_of_data(test_file):
+    with open(test_file, mode="rb") as f:
+        data = f.read()
+
+    assert Hasher.calculate_hash_of_data(data) == Hasher.calculate_hash(test_file)
+
+
+# get_signature
+def test_get_signature_when_file_exists(old_test_file):
+    stat = os.stat(old_test_file)
+    expected = (17, 1_000_000_000, stat.st_ino)
+
+    assert Hasher.get_signature(old_test_file) == expected
+
+
+def test_get_signature_when_file_does_not_exist_raises_error():
+    with pytest.raises(FileNotFoundError):
+        Hasher.get_signature("does_not_exist.json")
+
+
 # has_changed
 def test_has_changed_when_file_hash_exists_in_data_file_and_hash_same(hasher):
-    assert not hasher.has_changed("fake1.md", "724ae4e3bf11c04581daf1bb4de43161")
+    assert not hasher.has_changed(
+        "fake1.md", "82f5e46fd748645c99b709e49269e0e7690a9b10"
+    )
 
 
 def test_has_changed_when_file_hash_exists_in_data_file_and_hashes_different(hasher):
@@ -60,57 +89,148 @@ def test_has_changed_when_file_hash_does_not_exist_in_data_file(hasher):
 
 
 # update_hash
-def test_update_hash_when_file_hash_exists_in_data_file(hasher, file_with_hashes):
+def test_update_hash_when_file_hash_exists_in_state(hasher, state):
     new_hash = "111ae1e31111c04581daf1bb4de43161"
-    expected = (
-        "{"
-        f'"fake1.md": "{new_hash}", '
-        '"fake2.md": "123ae4a4bf1ac04581daf1bb4de43161"'
-        "}"
-    )
 
-    hasher.update_hash("fake1.md", new_hash)
+    hasher.update_hash("fake1.md", new_hash, (1, 2_000_000_000, 3))
 
-    with open(file_with_hashes, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+    file_state = state.get_file("fake1.md")
+    assert file_state.hash == new_hash
+    assert file_state.signature == (1, 2_000_000_000, 3)
 
 
-def test_update_hash_when_file_hash_does_not_exist_in_data_file(
-    hasher, file_with_hashes
-):
+def test_update_hash_when_file_hash_does_not_exist_in_state(hasher, state):
     filename = "my_file_path.md"
     new_hash = "111ae1e31111c04581daf1bb4de43161"
-    expected = (
-        "{"
-        '"fake1.md": "724ae4e3bf11c04581daf1bb4de43161", '
-        '"fake2.md": "123ae4a4bf1ac04581daf1bb4de43161", '
-        f'"{filename}": "{new_hash}"'
-        "}"
+
+    hasher.update_hash(filename, new_hash, (1, 2_000_000_000, 3))
+
+    file_state = state.get_file(filename)
+    assert file_state.hash == new_hash
+    assert file_state.signature == (1, 2_000_000_000, 3)
+    assert state.get_file("fake1.md").hash == "82f5e46fd748645c99b709e49269e0e7690a9b10"
+
+
+def test_update_hash_saves_note_ids(hasher, state):
+    hasher.update_hash(
+        "fake1.md", "111ae1e31111c04581daf1bb4de43161", (1, 2_000_000_000, 3), [1, 2]
+    )
+
+    assert state.get_note_ids("fake1.md") == [1, 2]
+
+
+def test_update_hash_saves_sections(hasher):
+    hasher.update_hash(
+        "fake1.md",
+        "111ae1e31111c04581daf1bb4de43161",
+        (1, 2_000_000_000, 3),
+        [1, 2],
+        {"section": [1, 2]},
     )
 
-    hasher.update_hash(filename, new_hash)
+    assert hasher.get_synced_sections("fake1.md") == {"section": [1, 2]}
 
-    with open(file_with_hashes, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
 
+def test_update_hash_without_signature_uses_current_one(hasher, state, old_test_file):
+    hasher.update_hash(old_test_file, "111ae1e31111c04581daf1bb4de43161")
 
-# reset_hashes
-def test_reset_hashes_when_data_file_does_not_exist():
-    path = "some_random_path.json"
-    hasher = Hasher(path)
-    expected = "{}"
+    assert state.get_file(old_test_file).signature == Hasher.get_signature(
+        old_test_file
+    )
 
-    hasher.reset_hashes()
 
-    with open(path, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
-    os.remove(path)
+def test_update_hash_does_not_save_signature_of_recently_modified_file(
+    hasher, state, test_file
+):
+    signature = Hasher.get_signature(test_file)
 
+    hasher.update_hash(test_file, "111ae1e31111c04581daf1bb4de43161", signature)
 
-def test_reset_hashes_when_data_file_contains_hashes(hasher, file_with_hashes):
-    expected = "{}"
+    assert state.get_file(test_file).signature is None
+    assert not hasher.has_changed(test_file, "111ae1e31111c04581daf1bb4de43161")
 
+
+def test_update_note_fingerprints(hasher):
+    hasher.update_note_fingerprints({1: "fingerprint"})
+
+    assert hasher.get_note_fingerprints([1, 2]) == {1: "fingerprint"}
+
+
+def test_update_note_fingerprints_with_tags(hasher):
+    hasher.update_note_fingerprints({1: "fingerprint"}, {1: ["tag"]})
+
+    assert hasher.get_synced_tags([1, 2]) == {1: ["tag"]}
+
+
+# reset_hashes
+def test_reset_hashes_when_state_contains_hashes(hasher, state):
     hasher.reset_hashes()
 
-    with open(file_with_hashes, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+    assert state.get_file("fake1.md") is None
+    assert state.get_file("fake2.md") is None
+
+
+# scan_files
+def test_scan_files_when_file_was_not_synced(hasher, test_file):
+    scans = list(hasher.scan_files([test_file]))
+
+    assert scans == [
+        FileScan(
+            test_file,
+            Hasher.get_signature(test_file),
+            "82f5e46fd748645c99b709e49269e0e7690a9b10",
+            True,
+        )
+    ]
+
+
+def test_scan_files_when_signature_has_not_changed(hasher, old_test_file, mocker):
+    signature = Hasher.get_signature(old_test_file)
+    hasher.update_hash(old_test_file, "cached hash", signature)
+    calculate_hash = mocker.spy(Hasher, "calculate_hash")
+
+    scans = list(hasher.scan_files([old_test_file]))
+
+    assert scans == [FileScan(old_test_file, signature, "cached hash", False)]
+    calculate_hash.assert_not_called()
+
+
+def test_scan_files_when_only_signature_has_changed(hasher, state, old_test_file):
+    file_hash = "82f5e46fd748645c99b709e49269e0e7690a9b10"
+    hasher.update_hash(old_test_file, file_hash, (17, 1_000_000_000, 1))
+    signature = Hasher.get_signature(old_test_file)
+
+    scans = list(hasher.scan_files([old_test_file]))
+
+    assert scans == [FileScan(old_test_file, signature, file_hash, False)]
+    assert state.get_file(old_test_file).signature == signature
+
+
+def test_scan_files_when_content_has_changed(hasher, old_test_file):
+    hasher.update_hash(old_test_file, "old hash", (17, 1_000_000_000, 1))
+
+    scans = list(hasher.scan_files([old_test_file]))
+
+    assert scans[0].changed
+
+
+def test_scan_files_when_file_does_not_exist(hasher):
+    scans = list(hasher.scan_files(["does_not_exist.md"]))
+
+    assert scans == [FileScan("does_not_exist.md", None, None, True)]
+
+
+def test_scan_files_consumes_paths_lazily(hasher, test_file, mocker):
+    mocker.patch.object(Hasher, "_scan_window", 1)
+    consumed = []
+
+    def paths():
+        for path in (test_file, "does_not_exist.md"):
+            consumed.append(path)
+            yield path
+
+    scans = hasher.scan_files(paths())
+
+    assert next(scans).path == test_file
+    assert consumed == [test_file]
+    assert [scan.path for scan in scans] == ["does_not_exist.md"]
@@ -169,7 +169,7 @@ def test_update_image_links_when_basic_and_cloze_notes():
 
 # Copy images
 def test_copy_images_to_with_one_image_link(anki_media, image, path_to_anki_image):
-    img_handler._copy_images_to(anki_media, [f"![some image]({image})"])
+    img_handler.copy_images_to(anki_media, [f"![some image]({image})"])
 
     assert os.path.exists(path_to_anki_image)
 
@@ -177,7 +177,7 @@ def test_copy_images_to_with_one_image_link(anki_media, image, path_to_anki_imag
 def test_copy_images_to_with_multiple_image_links(
     anki_media, image, path_to_anki_image, another_image, path_to_another_anki_image
 ):
-    img_handler._copy_images_to(
+    img_handler.copy_images_to(
         anki_media, [f"![some image]({image})", f"![some image]({another_image})"]
     )
 
@@ -187,58 +187,38 @@ def test_copy_images_to_with_multiple_image_links(
 
 def test_copy_images_to_with_non_existing_image_raises_error(anki_media):
     with pytest.raises(FileNotFoundError):
-        img_handler._copy_images_to(anki_media, ["![](/path/to/non-existing.png)"])
+        img_handler.copy_images_to(anki_media, ["![](/path/to/non-existing.png)"])
 
 
 def test_copy_images_to_when_exists_different_image_with_same_name_raises_error(
     anki_media, image, image_anki
 ):
     with pytest.raises(FileExistsError):
-        img_handler._copy_images_to(anki_media, [f"![some image]({image})"])
+        img_handler.copy_images_to(anki_media, [f"![some image]({image})"])
 
 
-def test_handle_images_if_no_images_then_fields_remain_same(anki_media):
-    card = BasicNote("Some text", "Another text", tags=[], deck_name="deck")
-
-    img_handler.handle_images_in([card], anki_media)
-
-    assert card.updated_front_md == card.raw_front_md
-
-
-def test_handle_images_when_cards_have_images(anki_media, image, another_image):
-    image_link1 = f"![some image]({image})"
-    image_link2 = f"![another img]({another_image})"
-    card1 = BasicNote(
-        f"Some text {image_link1}",
-        f"{image_link2} Another text",
-        tags=[],
-        deck_name="deck",
-    )
-    card2 = BasicNote(
-        "Question here", f"And answer here {image_link2}", tags=[], deck_name="deck"
-    )
-    expected_front1 = f"Some text ![some image]({os.path.basename(image)})"
-    expected_front2 = "Question here"
-    expected_back1 = f"![another img]({os.path.basename(another_image)}) Another text"
-    expected_back2 = (
-        f"And answer here ![another img]({os.path.basename(another_image)})"
-    )
+def test_copy_images_to_resolves_relative_path_against_base_dir(
+    anki_media, tmp_path, image, path_to_anki_image
+):
+    os.makedirs(tmp_path / "images")
+    os.replace(image, tmp_path / "images" / image)
 
-    img_handler.handle_images_in([card1, card2], anki_media)
+    try:
+        img_handler.copy_images_to(
+            anki_media, [f"![some image](images/{image})"], str(tmp_path)
+        )
+    finally:
+        os.replace(tmp_path / "images" / image, image)
 
-    assert expected_front1 == card1.raw_front_md
-    assert expected_front2 == card2.raw_front_md
-    assert expected_back1 == card1.raw_back_md
-    assert expected_back2 == card2.raw_back_md
+    assert os.path.exists(path_to_anki_image)
 
 
-def test_handle_images_copies_images_to_anki_media(
-    anki_media, image, path_to_anki_image
-):
-    card = BasicNote(
-        "Some text", f"Another text ![img]({image})", tags=[], deck_name="deck"
-    )
+def test_update_image_links_in_returns_original_links():
+    card1 = BasicNote("![](path/img1.png)", "![](img2.png)", tags=[], deck_name="")
+    card2 = ClozeNote("{![](path/img1.png)}", tags=[], deck_name="")
 
-    img_handler.handle_images_in([card], anki_media)
+    links = img_handler.update_image_links_in([card1, card2])
 
-    os.path.exists(path_to_anki_image)
+    assert sorted(links) == ["![](img2.png)", "![](path/img1.png)"]
+    assert card1.updated_front_md == "![](img1.png)"
+    assert card2.updated_text_md == "{![](img1.png)}"
@@ -1,23 +1,32 @@
 import pytest
 
-from inka.models.notes.note import Note
-
-create_search_anki_query_test_cases = {
-    # backward slashes
-    r"$\sqrt{5}$": r'"$\\sqrt{5}$"',
-    # double quotes
-    'text and "quote"': r'"text and \"quote\""',
-    # underscores
-    "I have some_long_name in here": r'"I have some\_long\_name in here"',
-    # colons
-    "I like: colons a:b:c, yeah": r'"I like\: colons a\:b\:c, yeah"',
-    # doesn't escape parenthesis
-    "We have (much) to say": r'"We have (much) to say"',
-    # doesn't escape hyphen
-    "The hyphen - is a punctuation mark": r'"The hyphen - is a punctuation mark"',
-}
-
-
-@pytest.mark.parametrize("text, expected", create_search_anki_query_test_cases.items())
-def test_escapes_colon(text, expected):
-    assert Note.create_anki_search_query(text) == expected
+from inka.models.notes.basic_note import BasicNote
+
+
+def test_get_fingerprint_is_same_for_same_notes(config):
+    note = BasicNote("front", "back", ["tag"], "deck")
+    same_note = BasicNote("front", "back", ["tag"], "deck")
+
+    assert note.get_fingerprint(config) == same_note.get_fingerprint(config)
+
+
+@pytest.mark.parametrize(
+    "attribute, value",
+    [("front_html", "<p>new</p>"), ("tags", ["new"]), ("deck_name", "new")],
+)
+def test_get_fingerprint_changes_when_note_changes(config, attribute, value):
+    note = BasicNote("front", "back", ["tag"], "deck")
+    fingerprint = note.get_fingerprint(config)
+
+    setattr(note, attribute, value)
+
+    assert note.get_fingerprint(config) != fingerprint
+
+
+def test_get_fingerprint_changes_when_note_type_changes(config):
+    note = BasicNote("front", "back", ["tag"], "deck")
+    fingerprint = note.get_fingerprint(config)
+
+    config.update_option_value("anki", "basic_type", "Another type")
+
+    assert note.get_fingerprint(config) != fingerprint
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from inka.models.pipeline import Stage
+
+
+def test_stage_returns_all_items():
+    with Stage(iter(range(10)), max_size=2) as stage:
+        assert list(stage) == list(range(10))
+
+
+def test_stage_produces_items_in_another_thread():
+    def items():
+        yield threading.current_thread().name
+
+    with Stage(items(), name="producer") as stage:
+        assert list(stage) == ["producer"]
+
+
+def test_stage_reraises_error_after_produced_items():
+    def items():
+        yield 1
+        raise ValueError("error")
+
+    with Stage(items()) as stage:
+        assert next(stage) == 1
+        with pytest.raises(ValueError):
+            next(stage)
+
+
+def test_stage_is_chained_with_another_stage():
+    with Stage(iter(range(5))) as first:
+        with Stage((item * 2 for item in first)) as second:
+            assert list(second) == [0, 2, 4, 6, 8]
+
+
+def test_close_stops_producer_blocked_on_full_queue():
+    closed = threading.Event()
+
+    def items():
+        try:
+            yield from range(100)
+        finally:
+            closed.set()
+
+    stage = Stage(items(), max_size=1)
+    assert next(stage) == 0
+
+    stage.close()
+
+    assert closed.is_set()
+    with pytest.raises(StopIteration):
+        next(stage)
@@ -0,0 +1,102 @@
+import pickle
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from inka.models import preparer
+from inka.models.document import Document
+from inka.models.notes.basic_note import BasicNote
+from inka.models.notes.cloze_note import ClozeNote
+
+
+@pytest.fixture
+def file(tmp_path: Path) -> Path:
+    """Temporary markdown file with one basic and one cloze note"""
+    file_path = tmp_path / "file.md"
+    file_path.write_text(
+        "---\n"
+        "\n"
+        "1. Question ![](images/img.png)\n"
+        "\n"
+        "> Answer\n"
+        "\n"
+        "2. Cloze {deletion}\n"
+        "\n"
+        "---\n",
+        encoding="utf-8",
+    )
+    return file_path
+
+
+def test_prepare_notes_converts_notes_to_anki_format(file):
+    basic_note = BasicNote("Question ![](images/img.png)", "Answer", [], "")
+    cloze_note = ClozeNote("Cloze {deletion}", [], "")
+
+    prepared = preparer.prepare_notes([basic_note, cloze_note], Document.read(file))
+
+    assert prepared.notes == [basic_note, cloze_note]
+    assert prepared.image_links == ["![](images/img.png)"]
+    assert basic_note.front_html == '<p>Question <img src="img.png" alt="" /></p>'
+    assert cloze_note.text_html == "<p>Cloze {{c1::deletion}}</p>"
+
+
+def test_iter_prepared_notes_returns_chunks_with_their_edits(file):
+    document = Document.read(file)
+
+    chunks = list(preparer.iter_prepared_notes(document, "deck", chunk_size=1))
+
+    assert [len(chunk.notes) for chunk in chunks] == [1, 1]
+    assert chunks[0].edits == {}
+    assert list(chunks[1].edits.values()) == ["Cloze {{c1::deletion}}"]
+
+
+def test_prepare_file(file):
+    prepared = preparer.prepare_file(str(file), "deck")
+
+    assert prepared.signature == Document.read(file).signature
+    assert [len(chunk.notes) for chunk in prepared.chunks] == [2]
+
+
+def test_prepare_file_result_can_be_sent_to_another_process(file):
+    prepared = preparer.prepare_file(str(file), "deck")
+
+    copy = pickle.loads(pickle.dumps(prepared))
+
+    assert copy.chunks[0].notes == prepared.chunks[0].notes
+    assert copy.chunks[0].edits == prepared.chunks[0].edits
+
+
+def test_prepare_file_uses_render_cache_of_worker(file, tmp_path, mocker):
+    mocker.patch.object(preparer, "_render_cache", None)
+    preparer.init_worker(str(tmp_path / "render_cache.db"), "1")
+    commit = mocker.spy(preparer._render_cache, "commit")
+
+    preparer.prepare_file(str(file), "deck")
+
+    commit.assert_called_once()
+    preparer._render_cache.close()
+
+
+def test_prepare_file_without_render_cache_when_it_fails(file, tmp_path, mocker):
+    mocker.patch.object(preparer, "_render_cache", None)
+    preparer.init_worker(str(tmp_path / "render_cache.db"), "1")
+    cache = preparer._render_cache
+    mocker.patch.object(
+        cache, "render", side_effect=sqlite3.OperationalError("database is locked")
+    )
+
+    prepared = preparer.prepare_file(str(file), "deck")
+
+    assert preparer._render_cache is None
+    assert len(prepared.chunks[0].notes) == 2
+    assert prepared.chunks[0].notes[0].front_html.startswith("<p>Question")
+    cache.close()
+
+
+def test_init_worker_when_render_cache_can_not_be_opened(tmp_path, mocker):
+    mocker.patch.object(preparer, "_render_cache", None)
+
+    preparer.init_worker(str(tmp_path / "missing" / "render_cache.db"), "1")
+
+    assert preparer._render_cache is None
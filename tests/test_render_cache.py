@@ -0,0 +1,85 @@
+import pytest
+
+from inka.models.render_cache import RenderCache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    """Temporary path to the render cache database"""
+    return tmp_path / "render_cache.db"
+
+
+@pytest.fixture
+def cache(cache_path) -> RenderCache:
+    """Instance of RenderCache class. Path to database specified by 'cache_path' fixture"""
+    cache = RenderCache(cache_path, "1")
+    yield cache
+    cache.close()
+
+
+def test_render_when_text_is_not_in_cache(cache, mocker):
+    render = mocker.Mock(return_value="<p>text</p>")
+
+    assert cache.render("text", render) == "<p>text</p>"
+    render.assert_called_once_with("text")
+
+
+def test_render_when_text_is_in_cache(cache, mocker):
+    cache.render("text", lambda text: "<p>text</p>")
+    render = mocker.Mock()
+
+    assert cache.render("text", render) == "<p>text</p>"
+    render.assert_not_called()
+
+
+def test_render_saves_results_to_database(cache_path, mocker):
+    with RenderCache(cache_path, "1") as cache:
+        cache.render("text", lambda text: "<p>text</p>")
+    render = mocker.Mock()
+
+    with RenderCache(cache_path, "1") as cache:
+        assert cache.render("text", render) == "<p>text</p>"
+    render.assert_not_called()
+
+
+def test_render_when_version_has_changed(cache_path, mocker):
+    with RenderCache(cache_path, "1") as cache:
+        cache.render("text", lambda text: "<p>old</p>")
+    render = mocker.Mock(return_value="<p>new</p>")
+
+    with RenderCache(cache_path, "2") as cache:
+        assert cache.render("text", render) == "<p>new</p>"
+    render.assert_called_once_with("text")
+
+
+def test_close_removes_least_recently_used_entries(cache_path, mocker):
+    time = mocker.patch("inka.models.render_cache.time.time", return_value=1)
+    with RenderCache(cache_path, "1") as cache:
+        cache.render("old", lambda text: "1234")
+        cache.render("new", lambda text: "1234")
+
+    # Entry that was used recently is kept, even though it was saved first
+    time.return_value = 2
+    with RenderCache(cache_path, "1", max_size=14) as cache:
+        cache.render("old", lambda text: "other")
+        cache.render("newest", lambda text: "1")
+
+    render = mocker.Mock(return_value="")
+    with RenderCache(cache_path, "1") as cache:
+        assert cache.render("old", render) == "1234"
+        assert cache.render("newest", render) == "1"
+        assert cache.render("new", render) == ""
+    render.assert_called_once_with("new")
+
+
+def test_repr_method(cache_path):
+    with RenderCache(cache_path, "1") as cache:
+        assert repr(cache) == f"RenderCache(path={cache_path!r}, version='1')"
+
+
+def test_commit_makes_entries_available_to_other_connections(cache, cache_path):
+    cache.render("text", lambda text: "<p>text</p>")
+    cache.commit()
+
+    with RenderCache(cache_path, "1") as other_cache:
+        assert other_cache.render("text", lambda text: "") == "<p>text</p>"
@@ -0,0 +1,297 @@
+import threading
+
+import pytest
+
+from inka.models.sync_state import FileState, GitSync, SyncState
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    """Temporary path to the sync state database"""
+    return tmp_path / "sync_state.db"
+
+
+@pytest.fixture
+def state(state_path) -> SyncState:
+    """Instance of SyncState class. Path to database specified by 'state_path' fixture"""
+    state = SyncState(state_path)
+    yield state
+    state.close()
+
+
+def test_get_file_when_file_was_not_synced(state):
+    assert state.get_file("file.md") is None
+
+
+def test_update_file_when_file_was_not_synced(state):
+    state.update_file("file.md", "hash", (1, 2, 3), [123, 456])
+
+    file_state = state.get_file("file.md")
+    assert isinstance(file_state, FileState)
+    assert file_state.path == "file.md"
+    assert file_state.hash == "hash"
+    assert file_state.signature == (1, 2, 3)
+    assert file_state.note_ids == [123, 456]
+    assert file_state.synced_at > 0
+
+
+def test_update_file_without_signature(state):
+    state.update_file("file.md", "hash", None)
+
+    assert state.get_file("file.md").signature is None
+
+
+def test_update_file_keeps_note_ids_if_they_are_not_passed(state):
+    state.update_file("file.md", "hash", (1, 2, 3), [123, 456])
+
+    state.update_file("file.md", "new hash", (4, 5, 6))
+
+    file_state = state.get_file("file.md")
+    assert file_state.hash == "new hash"
+    assert file_state.signature == (4, 5, 6)
+    assert file_state.note_ids == [123, 456]
+
+
+def test_update_note_ids(state):
+    state.update_file("file.md", "hash", (1, 2, 3), [123, 456])
+
+    state.update_note_ids("file.md", [789])
+
+    assert state.get_note_ids("file.md") == [789]
+
+
+def test_get_note_ids_when_file_was_not_synced(state):
+    assert state.get_note_ids("file.md") == []
+
+
+def test_remove_files(state):
+    state.update_file("file.md", "hash", (1, 2, 3))
+    state.update_file("another.md", "hash", (1, 2, 3))
+
+    state.remove_files()
+
+    assert state.get_file("file.md") is None
+    assert state.get_file("another.md") is None
+
+
+def test_remove_files_removes_sections(state):
+    state.update_sections("file.md", {"hash": [123]})
+
+    state.remove_files()
+
+    assert state.get_sections("file.md") == {}
+
+
+def test_get_sections_when_file_was_not_synced(state):
+    assert state.get_sections("file.md") == {}
+
+
+def test_update_sections_replaces_old_sections(state):
+    state.update_sections("file.md", {"old": [1], "same": [2, 3]})
+    state.update_sections("another.md", {"other": []})
+
+    state.update_sections("file.md", {"same": [2, 3], "new": []})
+
+    assert state.get_sections("file.md") == {"same": [2, 3], "new": []}
+    assert state.get_sections("another.md") == {"other": []}
+
+
+def test_get_note_fingerprints_skips_unknown_notes(state):
+    state.update_note_fingerprints({1: "one", 2: "two"})
+
+    assert state.get_note_fingerprints([1, 3]) == {1: "one"}
+
+
+def test_get_note_fingerprints_of_many_notes(state, mocker):
+    mocker.patch.object(SyncState, "_max_parameters", 2)
+    state.update_note_fingerprints({i: str(i) for i in range(5)})
+
+    assert state.get_note_fingerprints(range(5)) == {i: str(i) for i in range(5)}
+
+
+def test_update_note_fingerprints_replaces_old_fingerprints(state):
+    state.update_note_fingerprints({1: "old"})
+
+    state.update_note_fingerprints({1: "new"})
+
+    assert state.get_note_fingerprints([1]) == {1: "new"}
+
+
+def test_remove_files_removes_note_fingerprints(state):
+    state.update_note_fingerprints({1: "one"})
+
+    state.remove_files()
+
+    assert state.get_note_fingerprints([1]) == {}
+
+
+def test_get_note_tags_skips_notes_without_tags(state):
+    state.update_note_fingerprints({1: "one", 2: "two"}, {1: ["tag", "other"]})
+
+    assert state.get_note_tags([1, 2]) == {1: ["tag", "other"]}
+
+
+def test_update_note_fingerprints_replaces_old_tags(state):
+    state.update_note_fingerprints({1: "old"}, {1: ["old"]})
+
+    state.update_note_fingerprints({1: "new"}, {1: []})
+
+    assert state.get_note_tags([1]) == {1: []}
+
+
+def test_remove_files_keeps_note_tags(state):
+    state.update_note_fingerprints({1: "one"}, {1: ["tag"]})
+
+    state.remove_files()
+
+    assert state.get_note_tags([1]) == {1: ["tag"]}
+
+
+def test_get_config_fingerprint_when_it_was_not_saved(state):
+    assert state.get_config_fingerprint("notes") is None
+
+
+def test_update_config_fingerprint(state):
+    state.update_config_fingerprint("notes", "old")
+
+    state.update_config_fingerprint("notes", "new")
+
+    assert state.get_config_fingerprint("notes") == "new"
+
+
+def test_close_saves_changes(state_path):
+    state = SyncState(state_path)
+    state.update_file("file.md", "hash", (1, 2, 3))
+    state.close()
+
+    with SyncState(state_path) as new_state:
+        assert new_state.get_file("file.md").hash == "hash"
+
+
+def test_changes_are_committed_in_batches(state_path, mocker):
+    mocker.patch.object(SyncState, "_commit_interval", 2)
+    state = SyncState(state_path)
+    state.update_file("file.md", "hash", (1, 2, 3))
+    state.update_file("another.md", "hash", (1, 2, 3))
+    state.update_file("uncommitted.md", "hash", (1, 2, 3))
+
+    with SyncState(state_path) as new_state:
+        assert new_state.get_file("file.md") is not None
+        assert new_state.get_file("another.md") is not None
+        assert new_state.get_file("uncommitted.md") is None
+
+    state.close()
+
+
+def test_repr_method(state, state_path):
+    assert repr(state) == f"SyncState(path={state_path!r})"
+
+
+def test_get_directory_listing_when_directory_was_not_saved(state):
+    assert state.get_directory_listing("directory", 1) is None
+
+
+def test_get_directory_listing_when_directory_was_not_modified(state):
+    state.update_directory_listing("directory", 1, [("file.md", False)])
+
+    assert state.get_directory_listing("directory", 1) == [["file.md", False]]
+
+
+def test_get_directory_listing_when_directory_was_modified(state):
+    state.update_directory_listing("directory", 1, [("file.md", False)])
+
+    assert state.get_directory_listing("directory", 2) is None
+
+
+def test_get_directory_listing_without_modification_time(state):
+    state.update_directory_listing("directory", 1, [("file.md", False)])
+
+    assert state.get_directory_listing("directory") == [["file.md", False]]
+
+
+def test_remove_directory_listings_removes_subdirectories(state):
+    for path in ["/dir", "/dir/sub", "/dir/sub/deeper", "/dir10", "/other"]:
+        state.update_directory_listing(path, 1, [])
+
+    state.remove_directory_listings(["/dir", "/other"])
+
+    assert state.get_directory_listing("/dir") is None
+    assert state.get_directory_listing("/dir/sub/deeper") is None
+    assert state.get_directory_listing("/other") is None
+    assert state.get_directory_listing("/dir10") == []
+
+
+def test_remove_files_removes_directory_listings(state):
+    state.update_directory_listing("directory", 1, [("file.md", False)])
+
+    state.remove_files()
+
+    assert state.get_directory_listing("directory") is None
+
+
+def test_get_git_sync_when_repository_was_not_synced(state):
+    assert state.get_git_sync("/repo", "/repo") is None
+
+
+def test_update_git_sync(state):
+    state.update_git_sync("/repo", "/repo/dir", False, "first")
+    state.update_git_sync("/repo", "/repo/dir", False, "second")
+
+    assert state.get_git_sync("/repo", "/repo/dir").commit_hash == "second"
+
+
+def test_update_git_sync_with_uncommitted_files(state):
+    state.update_git_sync("/repo", "/repo", True, "commit", ["/repo/file.md"])
+
+    assert state.get_git_sync("/repo", "/repo/dir", True) == GitSync(
+        "commit", ["/repo/file.md"]
+    )
+
+
+def test_get_git_sync_when_other_path_was_synced(state):
+    state.update_git_sync("/repo", "/repo/dir1", True, "commit")
+
+    assert state.get_git_sync("/repo", "/repo/dir2", True) is None
+    assert state.get_git_sync("/repo", "/repo/dir10", True) is None
+
+
+def test_get_git_sync_when_path_was_synced_by_parent_directory(state):
+    state.update_git_sync("/repo", "/repo", True, "commit")
+
+    assert (
+        state.get_git_sync("/repo", "/repo/dir/file.md", True).commit_hash == "commit"
+    )
+
+
+def test_get_git_sync_when_directory_was_synced_non_recursively(state):
+    state.update_git_sync("/repo", "/repo", False, "commit")
+
+    assert state.get_git_sync("/repo", "/repo", False).commit_hash == "commit"
+    assert state.get_git_sync("/repo", "/repo", True) is None
+    assert state.get_git_sync("/repo", "/repo/dir", False) is None
+
+
+def test_get_git_sync_returns_commit_of_the_last_sync(state, mocker):
+    mocker.patch("time.time", side_effect=[1.0, 2.0])
+    state.update_git_sync("/repo", "/repo/dir", True, "old")
+    state.update_git_sync("/repo", "/repo", True, "new")
+
+    assert state.get_git_sync("/repo", "/repo/dir", True).commit_hash == "new"
+
+
+def test_remove_files_removes_git_syncs(state):
+    state.update_git_sync("/repo", "/repo", True, "commit")
+
+    state.remove_files()
+
+    assert state.get_git_sync("/repo", "/repo", True) is None
+
+
+def test_state_can_be_used_by_another_thread(state):
+    thread = threading.Thread(
+        target=state.update_file, args=("file.md", "hash", (1, 2, 3))
+    )
+    thread.start()
+    thread.join()
+
+    assert state.get_file("file.md").hash == "hash"
@@ -0,0 +1,298 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from inka.models import walker
+from inka.models.sync_state import SyncState
+from inka.models.walker import IgnoreRules, filter_ignored, walk_files
+
+EXTENSIONS = [".md", ".markdown"]
+
+
+@pytest.fixture
+def directory(tmp_path: Path) -> Path:
+    """Temporary directory with Markdown files in nested directories"""
+    for path in [
+        "first.md",
+        "second.markdown",
+        "image.png",
+        "sub/third.md",
+        "sub/deeper/fourth.md",
+        ".git/fifth.md",
+        "node_modules/package/README.md",
+        "attachments/sixth.md",
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("text", encoding="utf-8")
+
+    return tmp_path
+
+
+def found_files(directory: Path, recursive: bool = True, **kwargs) -> list:
+    return [
+        os.path.relpath(path, directory)
+        for path in walk_files(str(directory), EXTENSIONS, recursive, **kwargs)
+    ]
+
+
+# IgnoreRules
+@pytest.mark.parametrize(
+    "pattern, path, is_dir",
+    (
+        ("attachments", "attachments", True),
+        ("attachments", "notes/attachments", True),
+        ("attachments", "attachments", False),
+        ("attachments/", "notes/attachments", True),
+        ("/attachments", "attachments", True),
+        ("*.md", "notes/file.md", False),
+        ("notes/*.md", "notes/file.md", False),
+        ("file?.md", "file1.md", False),
+        ("file[0-9].md", "file1.md", False),
+        ("file[!a-z].md", "file1.md", False),
+        ("**/drafts", "a/b/drafts", True),
+        ("notes/**", "notes/a/b.md", False),
+        ("a/**/b", "a/b", True),
+        ("a/**/b", "a/x/y/b", True),
+        ("\\#file.md", "#file.md", False),
+    ),
+)
+def test_ignore_rules_when_pattern_matches(pattern, path, is_dir):
+    rules = IgnoreRules([pattern], "/base")
+
+    assert rules.is_ignored(f"/base/{path}", is_dir)
+
+
+@pytest.mark.parametrize(
+    "pattern, path, is_dir",
+    (
+        ("attachments/", "attachments", False),
+        ("/attachments", "notes/attachments", True),
+        ("notes/*.md", "other/notes/file.md", False),
+        ("notes/*.md", "notes/a/file.md", False),
+        ("*.md", "file.markdown", False),
+        ("file[!0-9].md", "file1.md", False),
+        ("# comment", "# comment", False),
+        ("", "file.md", False),
+    ),
+)
+def test_ignore_rules_when_pattern_does_not_match(pattern, path, is_dir):
+    rules = IgnoreRules([pattern], "/base")
+
+    assert not rules.is_ignored(f"/base/{path}", is_dir)
+
+
+def test_ignore_rules_last_matching_pattern_takes_precedence():
+    rules = IgnoreRules(["*.md", "!important.md"], "/base")
+
+    assert rules.is_ignored("/base/file.md", False)
+    assert not rules.is_ignored("/base/important.md", False)
+
+
+def test_ignore_rules_overrides_rules_of_parent():
+    parent = IgnoreRules(["drafts/"], "/base")
+    rules = IgnoreRules(["!drafts/"], "/base/notes", parent)
+
+    assert not rules.is_ignored("/base/notes/drafts", True)
+    assert rules.is_ignored("/base/other/drafts", True)
+
+
+def test_ignore_rules_from_file(tmp_path):
+    path = tmp_path / ".inkaignore"
+    path.write_text("# comment\n\ndrafts/\n", encoding="utf-8")
+
+    rules = IgnoreRules.from_file(str(path))
+
+    assert rules.is_ignored(str(tmp_path / "drafts"), True)
+    assert not rules.is_ignored(str(tmp_path / "notes"), True)
+
+
+# filter_ignored
+def test_filter_ignored_skips_paths_from_ignore_files(directory):
+    (directory / ".inkaignore").write_text("attachments/\n", encoding="utf-8")
+    (directory / "sub" / ".inkaignore").write_text("third.md\n", encoding="utf-8")
+    paths = [
+        str(directory / path)
+        for path in [
+            "first.md",
+            "sub/third.md",
+            "sub/deeper/fourth.md",
+            "attachments/sixth.md",
+            ".git/fifth.md",
+        ]
+    ]
+
+    assert list(filter_ignored(paths, str(directory))) == [
+        str(directory / "first.md"),
+        str(directory / "sub/deeper/fourth.md"),
+    ]
+
+
+# walk_files
+def test_walk_files_finds_markdown_files_in_subdirectories(directory):
+    expected = [
+        "attachments/sixth.md",
+        "first.md",
+        "second.markdown",
+        "sub/deeper/fourth.md",
+        "sub/third.md",
+    ]
+
+    assert sorted(found_files(directory)) == expected
+
+
+def test_walk_files_non_recursive(directory):
+    assert sorted(found_files(directory, recursive=False)) == [
+        "first.md",
+        "second.markdown",
+    ]
+
+
+def test_walk_files_skips_paths_from_ignore_files(directory):
+    (directory / ".inkaignore").write_text("attachments/\n", encoding="utf-8")
+    (directory / "sub" / ".inkaignore").write_text("third.md\n", encoding="utf-8")
+
+    assert sorted(found_files(directory)) == [
+        "first.md",
+        "second.markdown",
+        "sub/deeper/fourth.md",
+    ]
+
+
+def test_walk_files_default_patterns_can_be_negated(directory):
+    (directory / ".inkaignore").write_text("!node_modules/\n", encoding="utf-8")
+
+    assert "node_modules/package/README.md" in found_files(directory)
+
+
+def test_walk_files_does_not_change_working_directory(directory):
+    cwd = os.getcwd()
+
+    found_files(directory)
+
+    assert os.getcwd() == cwd
+
+
+def test_walk_files_visits_symlinked_directories_once(directory):
+    (directory / "sub" / "loop").symlink_to(directory, target_is_directory=True)
+    (directory / "link").symlink_to(directory / "sub", target_is_directory=True)
+
+    files = found_files(directory)
+
+    assert sorted(os.path.basename(file) for file in files) == [
+        "first.md",
+        "fourth.md",
+        "second.markdown",
+        "sixth.md",
+        "third.md",
+    ]
+
+
+def test_walk_files_skips_already_seen_files(directory):
+    seen = set()
+    first_run = found_files(directory / "sub", seen=seen)
+
+    second_run = found_files(directory, seen=seen)
+
+    assert sorted(first_run) == ["deeper/fourth.md", "third.md"]
+    assert sorted(second_run) == [
+        "attachments/sixth.md",
+        "first.md",
+        "second.markdown",
+    ]
+
+
+def test_walk_files_calls_on_error_for_unreadable_ignore_file(directory):
+    (directory / ".inkaignore").mkdir()
+    errors = []
+
+    files = found_files(directory, on_error=errors.append)
+
+    assert files == []
+    assert len(errors) == 1
+
+
+@pytest.fixture
+def state(tmp_path_factory) -> SyncState:
+    """Sync state that is stored outside the temporary directory with files"""
+    state = SyncState(tmp_path_factory.mktemp("state") / "sync_state.db")
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def old_directory(directory) -> Path:
+    """Temporary directory which subdirectories have modification time far in the past"""
+    for path, _, _ in os.walk(directory):
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+    return directory
+
+
+def test_walk_files_saves_listings_of_directories_to_cache(old_directory, state):
+    found_files(old_directory, cache=state)
+
+    listing = state.get_directory_listing(str(old_directory / "sub"), 1_000_000_000)
+    assert [entry[:3] for entry in listing] == [
+        ["deeper", True, False],
+        ["third.md", False, False],
+    ]
+
+
+def test_walk_files_does_not_list_unchanged_directories(old_directory, state, mocker):
+    expected = found_files(old_directory, cache=state)
+    scandir = mocker.spy(os, "scandir")
+
+    files = found_files(old_directory, cache=state)
+
+    assert files == expected
+    scandir.assert_not_called()
+
+
+def test_walk_files_lists_modified_directories(old_directory, state):
+    found_files(old_directory, cache=state)
+    (old_directory / "sub" / "new.md").write_text("text", encoding="utf-8")
+
+    files = found_files(old_directory, cache=state)
+
+    assert "sub/new.md" in files
+
+
+def test_walk_files_does_not_cache_recently_modified_directories(directory, state):
+    found_files(directory, cache=state)
+
+    mtime_ns = os.stat(directory).st_mtime_ns
+    assert state.get_directory_listing(str(directory), mtime_ns) is None
+
+
+def test_walk_files_removes_listings_of_removed_directories(old_directory, state):
+    found_files(old_directory, cache=state)
+    shutil.rmtree(old_directory / "sub")
+
+    found_files(old_directory, cache=state)
+
+    assert state.get_directory_listing(str(old_directory / "sub")) is None
+    assert state.get_directory_listing(str(old_directory / "sub" / "deeper")) is None
+    assert state.get_directory_listing(str(old_directory / "attachments")) is not None
+
+
+def test_walk_files_removes_listing_of_unreadable_directory(
+    old_directory, state, mocker
+):
+    found_files(old_directory, cache=state)
+    sub = str(old_directory / "sub")
+    os.utime(sub, ns=(2_000_000_000, 2_000_000_000))
+    scan_directory = walker._scan_directory
+
+    def scan(directory):
+        if directory == sub:
+            raise PermissionError(directory)
+        return scan_directory(directory)
+
+    mocker.patch.object(walker, "_scan_directory", side_effect=scan)
+    errors = []
+
+    found_files(old_directory, cache=state, on_error=errors.append)
+
+    assert len(errors) == 1
+    assert state.get_directory_listing(sub) is None
@@ -1,9 +1,10 @@
 import random
 from pathlib import Path
-from typing import List, Union
+from typing import List, Tuple, Union
 
 import pytest
 
+from inka.models.document import Document
 from inka.models.notes.basic_note import BasicNote
 from inka.models.notes.cloze_note import ClozeNote
 from inka.models.notes.note import Note
@@ -57,7 +58,7 @@ def file(tmp_path: Path) -> Path:
 @pytest.fixture
 def notes(file: Path) -> List[Union[BasicNote, ClozeNote]]:
     """Notes from the temporary file with randomly generated ids"""
-    parser = Parser(file, "")
+    parser = Parser(Document.read(file), "")
     notes = parser.collect_notes()
     for note in notes:
         note.anki_id = random.randint(1000000000, 9999999999)
@@ -65,74 +66,85 @@ def notes(file: Path) -> List[Union[BasicNote, ClozeNote]]:
     return notes
 
 
+def create_writer(file: Path, content: str) -> Tuple[Writer, List[Note]]:
+    """Write content to the file and create writer with the notes from it"""
+    file.write_text(content, encoding="utf-8")
+    document = Document.read(file)
+    notes = Parser(document, "").collect_notes()
+    return Writer(document, notes), notes
+
+
 @pytest.fixture
 def writer(file: Path, notes: List[Note]) -> Writer:
     """Fake writer which uses temporary file"""
-    return Writer(file, notes)
+    return Writer(Document.read(file), notes)
 
 
 @pytest.fixture
 def writer_with_ids(file: Path, notes: List[Note]) -> Writer:
     """Fake writer which uses temporary file and has IDs on cards"""
-    writer = Writer(file, notes)
+    writer = Writer(Document.read(file), notes)
     writer.update_note_ids()
     return writer
 
 
 def test_update_ids_saves_to_file_system(writer, file):
-    expected = "Some string"
-    writer._file_content = expected
-
     writer.update_note_ids()
+    writer.save()
 
     with open(file, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+        assert f.read() == writer._file_content
 
 
-def test_update_ids_skips_card_if_it_was_not_found(writer, notes):
-    writer._file_content = (
-        "---\n"
-        "\n"
-        "Deck: Abraham\n"
-        "\n"
-        "Tags: one two-three\n"
-        "\n"
-        "2. Another question\n"
-        "\n"
-        "More info on question.\n"
-        "\n"
-        "And even more!\n"
-        "\n"
-        "> Second answer\n"
-        "> \n"
-        "> Additional info\n"
-        "> \n"
-        "> And more to it\n"
-        "\n"
-        "---"
-    )
-    expected = (
-        "---\n"
-        "\n"
-        "Deck: Abraham\n"
-        "\n"
-        "Tags: one two-three\n"
-        "\n"
-        f"<!--ID:{notes[1].anki_id}-->\n"
-        "2. Another question\n"
-        "\n"
-        "More info on question.\n"
-        "\n"
-        "And even more!\n"
-        "\n"
-        "> Second answer\n"
-        "> \n"
-        "> Additional info\n"
-        "> \n"
-        "> And more to it\n"
-        "\n"
-        "---"
-    )
+def test_save_does_not_write_file_if_content_has_not_changed(writer, file, mocker):
+    write = mocker.spy(Document, "write_chunks")
+
+    assert writer.save() is False
+    write.assert_not_called()
+
+
+def test_save_writes_all_edits_at_once(writer, notes, file, mocker):
+    write = mocker.spy(Document, "write_chunks")
+    notes[2].updated_text_md = "Only one {{c1::line}}"
+
+    writer.update_cloze_notes()
+    writer.update_note_ids()
+    expected = writer._file_content
+
+    assert writer.save() is True
+    assert writer.save() is False
+    write.assert_called_once()
+    assert file.read_text(encoding="utf-8") == expected
+
+
+def test_save_applies_edits_when_document_is_read_in_chunks(
+    writer, notes, file, mocker
+):
+    writer.update_note_ids()
+    expected = writer._file_content
+    mocker.patch.object(Document, "_chunk_size", 5)
+
+    writer.save()
+
+    assert file.read_text(encoding="utf-8") == expected
+
+
+def test_update_ids_of_passed_notes_only(file, notes):
+    writer = Writer(Document.read(file))
+
+    writer.update_note_ids(notes[:1])
+    writer.save()
+
+    text = file.read_text(encoding="utf-8")
+    assert f"<!--ID:{notes[0].anki_id}-->" in text
+    assert f"<!--ID:{notes[1].anki_id}-->" not in text
+
+
+def test_update_ids_skips_card_if_it_was_not_found(file):
+    document = Document.read(file)
+    expected = document.text
+    note = BasicNote("Some question?", "First answer", [], "Abraham", 1234567890)
+    writer = Writer(document, [note])
 
     writer.update_note_ids()
 
@@ -185,20 +197,21 @@ def test_update_ids_does_not_add_id_if_it_no_id_in_card(writer, notes):
     assert writer._file_content == expected
 
 
-def test_update_ids_removes_id_from_file_if_card_object_has_no_id(writer, notes):
-    writer._file_content = (
+def test_update_ids_removes_id_from_file_if_card_object_has_no_id(file):
+    writer, notes = create_writer(
+        file,
         "---\n"
         "\n"
         "Deck: Abraham\n"
         "\n"
         "Tags: one two-three\n"
         "\n"
-        f"<!--ID:{notes[0].anki_id}-->\n"
+        "<!--ID:1111111111-->\n"
         "1. Some question?\n"
         "\n"
         "> First answer\n"
         "\n"
-        f"<!--ID:{notes[1].anki_id}-->\n"
+        "<!--ID:2222222222-->\n"
         "2. Another question\n"
         "\n"
         "More info on question.\n"
@@ -211,14 +224,14 @@ def test_update_ids_removes_id_from_file_if_card_object_has_no_id(writer, notes)
         "> \n"
         "> And more to it\n"
         "\n"
-        f"<!--ID:{notes[2].anki_id}-->\n"
+        "<!--ID:3333333333-->\n"
         "3. Only one {line}\n"
         "\n"
-        f"<!--ID:{notes[3].anki_id}-->\n"
+        "<!--ID:4444444444-->\n"
         "4. Mul{1::tip}le\n\n"
         "{lines}\n\n"
         "here\n\n"
-        "---"
+        "---",
     )
     expected = (
         "---\n"
@@ -231,7 +244,7 @@ def test_update_ids_removes_id_from_file_if_card_object_has_no_id(writer, notes)
         "\n"
         "> First answer\n"
         "\n"
-        f"<!--ID:{notes[1].anki_id}-->\n"
+        "<!--ID:2222222222-->\n"
         "2. Another question\n"
         "\n"
         "More info on question.\n"
@@ -244,10 +257,10 @@ def test_update_ids_removes_id_from_file_if_card_object_has_no_id(writer, notes)
         "> \n"
         "> And more to it\n"
         "\n"
-        f"<!--ID:{notes[2].anki_id}-->\n"
+        "<!--ID:3333333333-->\n"
         "3. Only one {line}\n"
         "\n"
-        f"<!--ID:{notes[3].anki_id}-->\n"
+        "<!--ID:4444444444-->\n"
         "4. Mul{1::tip}le\n\n"
         "{lines}\n\n"
         "here\n\n"
@@ -306,8 +319,9 @@ def test_update_ids_writes_id_before_question(writer, notes):
     assert writer._file_content == expected
 
 
-def test_updates_id_if_another_is_written(writer, notes):
-    writer._file_content = (
+def test_updates_id_if_another_is_written(file):
+    writer, notes = create_writer(
+        file,
         "---\n"
         "\n"
         "Deck: Abraham\n"
@@ -331,8 +345,10 @@ def test_updates_id_if_another_is_written(writer, notes):
         "> \n"
         "> And more to it\n"
         "\n"
-        "---"
+        "---",
     )
+    notes[0].anki_id = 1111111111
+    notes[1].anki_id = 2222222222
     expected = (
         "---\n"
         "\n"
@@ -340,12 +356,12 @@ def test_updates_id_if_another_is_written(writer, notes):
         "\n"
         "Tags: one two-three\n"
         "\n"
-        f"<!--ID:{notes[0].anki_id}-->\n"
+        "<!--ID:1111111111-->\n"
         "1. Some question?\n"
         "\n"
         "> First answer\n"
         "\n"
-        f"<!--ID:{notes[1].anki_id}-->\n"
+        "<!--ID:2222222222-->\n"
         "2. Another question\n"
         "\n"
         "More info on question.\n"
@@ -366,14 +382,72 @@ def test_updates_id_if_another_is_written(writer, notes):
     assert writer._file_content == expected
 
 
-def test_update_card_fields_saves_to_file_system(writer, file):
-    expected = "Some string"
-    writer._file_content = expected
+def test_update_ids_when_notes_have_same_question(file):
+    writer, notes = create_writer(
+        file,
+        "---\n"
+        "Deck: Abraham\n"
+        "\n"
+        "1. Same question\n"
+        "> First answer\n"
+        "\n"
+        "<!--ID:1111111111-->\n"
+        "2. Same question\n"
+        "> Second answer\n"
+        "---",
+    )
+    notes[0].anki_id = 2222222222
+    expected = (
+        "---\n"
+        "Deck: Abraham\n"
+        "\n"
+        "<!--ID:2222222222-->\n"
+        "1. Same question\n"
+        "> First answer\n"
+        "\n"
+        "<!--ID:1111111111-->\n"
+        "2. Same question\n"
+        "> Second answer\n"
+        "---"
+    )
+
+    writer.update_note_ids()
+
+    assert writer._file_content == expected
 
-    writer.update_fields_of_basic_notes()
+
+def test_update_ids_when_notes_have_same_id(file):
+    writer, notes = create_writer(
+        file,
+        "---\n"
+        "Deck: Abraham\n"
+        "\n"
+        "<!--ID:1111111111-->\n"
+        "1. First question\n"
+        "> First answer\n"
+        "\n"
+        "<!--ID:1111111111-->\n"
+        "2. Second question\n"
+        "> Second answer\n"
+        "---",
+    )
+    notes[1].anki_id = 2222222222
+
+    writer.update_note_ids()
+
+    assert writer._file_content.count("<!--ID:1111111111-->") == 1
+    assert writer._file_content.count("<!--ID:2222222222-->") == 1
+
+
+def test_update_card_fields_saves_to_file_system(writer_with_ids, notes, file):
+    notes[0].changed = True
+    notes[0].raw_front_md = "Amazing new text"
+
+    writer_with_ids.update_fields_of_basic_notes()
+    writer_with_ids.save()
 
     with open(file, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+        assert f.read() == writer_with_ids._file_content
 
 
 def test_update_card_fields_skips_not_changed_cards(writer_with_ids, notes):
@@ -611,14 +685,14 @@ def test_updates_multiline_answer_field(writer_with_ids, notes):
     assert writer_with_ids._file_content == expected
 
 
-def test_delete_saves_changes_to_file_system(writer, notes, file):
-    expected = "Some string"
-    writer._file_content = expected
+def test_delete_saves_changes_to_file_system(writer_with_ids, notes, file):
+    notes[0].to_delete = True
 
-    writer.delete_notes()
+    writer_with_ids.delete_notes()
+    writer_with_ids.save()
 
     with open(file, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+        assert f.read() == writer_with_ids._file_content
 
 
 def test_delete_skips_cards_that_are_not_marked_for_deletion(writer_with_ids, notes):
@@ -703,14 +777,14 @@ def test_deletes_multiple_cards_marked_for_deletion(writer_with_ids, notes):
     assert writer_with_ids._file_content == expected
 
 
-def test_update_cloze_notes_saves_to_file_system(writer, file):
-    expected = "Some string"
-    writer._file_content = expected
+def test_update_cloze_notes_saves_to_file_system(writer, notes, file):
+    notes[2].updated_text_md = "Only one {{c1::line}}"
 
     writer.update_cloze_notes()
+    writer.save()
 
     with open(file, mode="rt", encoding="utf-8") as f:
-        assert f.read() == expected
+        assert f.read() == writer._file_content
 
 
 def test_update_cloze_notes_when_note_has_only_one_line(writer, notes):
@@ -856,3 +930,29 @@ def test_update_cloze_notes_updates_raw_text_value(writer, notes):
     writer.update_cloze_notes()
 
     assert notes[2].raw_text_md == notes[2].updated_text_md
+
+
+def test_update_cloze_notes_and_ids_together(writer, notes):
+    notes[2].updated_text_md = "Only one {{c1::line}}"
+    for note in notes:
+        note.anki_id = None
+    notes[2].anki_id = 1111111111
+
+    writer.update_cloze_notes()
+    writer.update_note_ids()
+
+    assert (
+        "\n\n<!--ID:1111111111-->\n3. Only one {{c1::line}}\n\n4. Mul{1::tip}le"
+        in writer._file_content
+    )
+
+
+def test_add_edits_applies_edits_of_another_writer(writer, file, notes):
+    notes[2].updated_text_md = "Only one {{c1::line}}"
+    other_writer = Writer(Document.read(file), notes)
+    other_writer.update_cloze_notes()
+
+    writer.add_edits(other_writer.edits)
+
+    assert writer.edits == other_writer.edits
+    assert "3. Only one {{c1::line}}\n" in writer._file_content